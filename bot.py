@@ -1,12 +1,13 @@
 import logging
 import asyncio
-from aiogram import Bot, Dispatcher, types
+from datetime import datetime
+from aiogram import Dispatcher, types
 from aiogram.utils import executor
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.types import BotCommand
 
 # Import configurations and handlers
-from config import BOT_TOKEN, CHANNEL_ID, ADMIN_ID
+from config import BOT_TOKEN, ADMIN_ID, BROADCAST_WORKERS
 from database.models import Database
 from handlers.user_handlers import UserHandlers
 from handlers.referral_handlers import ReferralHandlers
@@ -16,6 +17,10 @@ from utils.scheduler import BotScheduler
 from utils.campaign_manager import CampaignManager
 from utils.ab_testing import ABTestManager
 from utils.analytics import Analytics
+from utils.outbound import OutboundBot
+from utils.rate_limiter import shared_limiter
+from utils.broadcast_worker import start_workers, stop_workers
+from utils.click_tracking import decode_click
 
 # Configure logging
 logging.basicConfig(
@@ -30,7 +35,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
+# Message calls share one rate budget; handler replies take priority over bulk sends
+bot = OutboundBot(token=BOT_TOKEN)
 dp = Dispatcher(bot)
 dp.middleware.setup(LoggingMiddleware())
 
@@ -42,10 +48,13 @@ admin_handlers = AdminHandlers(bot, db, ADMIN_ID)
 advertising_handlers = AdvertisingHandlers(bot, db)
 
 # Initialize utilities
-scheduler = BotScheduler(bot, db)
-campaign_manager = CampaignManager(bot, db)
+scheduler = BotScheduler(bot, db, admin_handlers.broadcast_jobs)
+admin_handlers.scheduler = scheduler
+campaign_manager = CampaignManager(bot, db, advertising_handlers.execute_smart_campaign)
+advertising_handlers.campaign_manager = campaign_manager
 ab_test_manager = ABTestManager(bot, db)
 analytics = Analytics(db)
+broadcast_workers = []
 
 # ==================== COMMAND HANDLERS ====================
 
@@ -129,9 +138,12 @@ async def handle_messages(message: types.Message):
         # Update user activity
         await db.update_user_activity(message.from_user.id)
         
-        # Handle admin messages (like broadcast creation)
+        # Handle admin messages (like broadcast or campaign creation)
         if message.from_user.id == ADMIN_ID:
-            await admin_handlers.handle_admin_message(message)
+            if advertising_handlers.is_waiting_for_message(message.from_user.id):
+                await advertising_handlers.handle_campaign_message(message)
+            else:
+                await admin_handlers.handle_admin_message(message)
         else:
             # Handle regular user messages
             if message.text and not message.text.startswith('/'):
@@ -174,6 +186,12 @@ async def handle_callback_queries(callback: types.CallbackQuery):
         # Update user activity
         await db.update_user_activity(callback.from_user.id)
         
+        # Tracked campaign buttons are counted in memory and written in batches
+        click = decode_click(callback.data)
+        if click:
+            await advertising_handlers.handle_tracked_click(callback, click)
+            return
+        
         # Log callback for analytics
         await db.log_analytics('button_click', callback.from_user.id, callback.data)
         
@@ -203,7 +221,7 @@ async def handle_inline_queries(inline_query: types.InlineQuery):
         query = inline_query.query
         
         # Check if user exists in database
-        user_data = await db.get_user(user_id)
+        user_data = await db.get_user(user_id, fields=('user_id',))
         if not user_data:
             return
         
@@ -322,6 +340,20 @@ async def on_startup(dp):
         campaign_manager.start()
         logger.info("✅ Campaign manager started")
         
+        # Start delivering campaign messages held for users' best hours
+        advertising_handlers.delivery_wheel.start()
+        logger.info("✅ Campaign delivery wheel started")
+        
+        # Start broadcast worker processes
+        if BROADCAST_WORKERS:
+            broadcast_workers.extend(start_workers(BROADCAST_WORKERS))
+            logger.info(f"✅ Started {BROADCAST_WORKERS} broadcast workers")
+        
+        # Resume broadcasts interrupted by the last shutdown
+        resumed = await admin_handlers.broadcast_jobs.resume_unfinished()
+        if resumed:
+            logger.info(f"✅ Resumed broadcast jobs: {resumed}")
+        
         # Get bot info
         bot_info = await bot.get_me()
         logger.info(f"✅ Bot info: @{bot_info.username}")
@@ -360,9 +392,13 @@ async def on_shutdown(dp):
         logger.info("✅ Scheduler stopped")
         
         # Stop campaign manager
-        campaign_manager.stop()
+        await campaign_manager.stop()
         logger.info("✅ Campaign manager stopped")
         
+        # Stop the delivery wheel; held messages stay stored for the next start
+        await advertising_handlers.delivery_wheel.stop()
+        logger.info("✅ Campaign delivery wheel stopped")
+        
         # Send shutdown notification to admin
         shutdown_message = f"""
 ⏹️ ربات متوقف شد
@@ -372,9 +408,21 @@ async def on_shutdown(dp):
 📊 آمار نهایی در دسترس است.
         """
         
-                await bot.send_message(ADMIN_ID, shutdown_message)
+        await bot.send_message(ADMIN_ID, shutdown_message)
         logger.info("✅ Shutdown notification sent to admin")
         
+        # Checkpoint running broadcasts so they resume on next start
+        await admin_handlers.broadcast_jobs.shutdown()
+        await stop_workers(broadcast_workers)
+        logger.info("✅ Broadcast jobs checkpointed")
+        
+        # Stop the outbound dispatcher
+        shared_limiter.close()
+        
+        # Close database connections
+        await db.close()
+        logger.info("✅ Database connections closed")
+        
         # Close bot session
         await bot.close()
         logger.info("✅ Bot session closed")
@@ -398,6 +446,9 @@ async def periodic_health_check():
             
             # Log health status
             logger.info(f"Health check passed - Users: {stats['total_users']}, Bot: @{bot_info.username}")
+            logger.info(f"Database: {db.pool_stats()}")
+            logger.info(f"Outbound: {shared_limiter.stats()}")
+            logger.info(f"Campaign wheel: {advertising_handlers.delivery_wheel.stats()}")
             
         except Exception as e:
             logger.error(f"Health check failed: {e}")
@@ -418,12 +469,10 @@ async def periodic_cleanup():
             await asyncio.sleep(86400)  # Run daily
             
             # Clean old analytics data (older than 90 days)
-            async with db.get_connection() as conn:
-                await conn.execute("""
-                    DELETE FROM analytics 
-                    WHERE timestamp < datetime('now', '-90 days')
-                """)
-                await conn.commit()
+            await db.execute_write("""
+                DELETE FROM analytics 
+                WHERE timestamp < datetime('now', '-90 days')
+            """)
             
             logger.info("✅ Periodic cleanup completed")
             
@@ -10,20 +10,72 @@ ADMIN_ID = int(os.getenv('ADMIN_ID', 0))
 
 # Database Configuration
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'bot.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+# SQLite PRAGMA profile applied to every connection
+DB_PRAGMAS = {
+    'journal_mode': os.getenv('DB_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.getenv('DB_MMAP_SIZE', 268435456)),  # 256MB
+    'cache_size': int(os.getenv('DB_CACHE_SIZE', -16000)),  # 16MB (negative = KiB)
+    'busy_timeout': int(os.getenv('DB_BUSY_TIMEOUT', 5000)),  # ms
+    'temp_store': os.getenv('DB_TEMP_STORE', 'MEMORY'),
+}
 
 # Bot Settings
 REFERRAL_REWARD = int(os.getenv('REFERRAL_REWARD', 10))
 MIN_REFERRALS_FOR_CONTENT = int(os.getenv('MIN_REFERRALS_FOR_CONTENT', 5))
-BROADCAST_DELAY = float(os.getenv('BROADCAST_DELAY', 0.1))
+BROADCAST_DELAY = float(os.getenv('BROADCAST_DELAY', 0.034))  # ~30 msg/s, Telegram's global limit
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 1 / BROADCAST_DELAY if BROADCAST_DELAY > 0 else 30))
+BROADCAST_PER_CHAT_RATE = float(os.getenv('BROADCAST_PER_CHAT_RATE', 1))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 16))
+BROADCAST_CHECKPOINT_INTERVAL = float(os.getenv('BROADCAST_CHECKPOINT_INTERVAL', 5))  # seconds
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', 3))
+# Flood waits per recipient before giving up; counted apart from the retries above
+BROADCAST_MAX_FLOOD_WAITS = int(os.getenv('BROADCAST_MAX_FLOOD_WAITS', 10))
+BROADCAST_RETRY_BASE_DELAY = float(os.getenv('BROADCAST_RETRY_BASE_DELAY', 1.0))  # seconds
+# Worker processes that deliver broadcasts, each owning user_id % N; 0 sends from the bot process.
+# Keep the count fixed while broadcasts are running.
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', 0))
+BROADCAST_WORKER_POLL_INTERVAL = float(os.getenv('BROADCAST_WORKER_POLL_INTERVAL', 2))  # seconds
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', 5))  # seconds between status edits
+PROGRESS_EDIT_SHARE = float(os.getenv('PROGRESS_EDIT_SHARE', 0.02))  # of BROADCAST_RATE, for all status edits
+# Reserved share of BROADCAST_RATE per outbound priority class, highest priority first
+OUTBOUND_SHARES = {
+    'interactive': float(os.getenv('OUTBOUND_SHARE_INTERACTIVE', 0.4)),
+    'referral': float(os.getenv('OUTBOUND_SHARE_REFERRAL', 0.1)),
+    'campaign': float(os.getenv('OUTBOUND_SHARE_CAMPAIGN', 0.2)),
+    'broadcast': float(os.getenv('OUTBOUND_SHARE_BROADCAST', 0.3)),
+}
+USER_PAGE_SIZE = int(os.getenv('USER_PAGE_SIZE', 500))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))  # seconds
+SEGMENT_CACHE_SIZE = int(os.getenv('SEGMENT_CACHE_SIZE', 32))
+SEGMENT_CACHE_TTL = int(os.getenv('SEGMENT_CACHE_TTL', 300))  # seconds
 
 # Campaign Settings
 MAX_CAMPAIGN_SIZE = int(os.getenv('MAX_CAMPAIGN_SIZE', 10000))
 AB_TEST_MIN_SIZE = int(os.getenv('AB_TEST_MIN_SIZE', 100))
 CAMPAIGN_TIMEOUT = int(os.getenv('CAMPAIGN_TIMEOUT', 3600))
+CAMPAIGN_WHEEL_SLOTS = int(os.getenv('CAMPAIGN_WHEEL_SLOTS', 24))
+CAMPAIGN_WHEEL_BATCH_SIZE = int(os.getenv('CAMPAIGN_WHEEL_BATCH_SIZE', 500))
+CAMPAIGN_LEASE_TTL = int(os.getenv('CAMPAIGN_LEASE_TTL', 300))  # seconds
 
 # Analytics Settings
 ANALYTICS_RETENTION_DAYS = int(os.getenv('ANALYTICS_RETENTION_DAYS', 90))
 REPORT_FREQUENCY_HOURS = int(os.getenv('REPORT_FREQUENCY_HOURS', 24))
+ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', 500))
+ANALYTICS_FLUSH_INTERVAL_MS = int(os.getenv('ANALYTICS_FLUSH_INTERVAL_MS', 1000))
+ANALYTICS_MAX_PENDING = int(os.getenv('ANALYTICS_MAX_PENDING', 10000))
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv('ACTIVITY_FLUSH_INTERVAL', 60))  # seconds
+DELIVERY_LOG_BATCH_SIZE = int(os.getenv('DELIVERY_LOG_BATCH_SIZE', 1000))
+DELIVERY_LOG_FLUSH_INTERVAL_MS = int(os.getenv('DELIVERY_LOG_FLUSH_INTERVAL_MS', 1000))
+DELIVERY_LOG_MAX_PENDING = int(os.getenv('DELIVERY_LOG_MAX_PENDING', 50000))
+CLICK_FLUSH_INTERVAL = int(os.getenv('CLICK_FLUSH_INTERVAL', 10))  # seconds
+USER_PROFILE_WINDOW_DAYS = int(os.getenv('USER_PROFILE_WINDOW_DAYS', 30))
+USER_PROFILE_REFRESH_INTERVAL = int(os.getenv('USER_PROFILE_REFRESH_INTERVAL', 600))  # seconds
+USER_PROFILE_BATCH_SIZE = int(os.getenv('USER_PROFILE_BATCH_SIZE', 1000))
 
 # Security Settings
 MAX_MESSAGES_PER_MINUTE = int(os.getenv('MAX_MESSAGES_PER_MINUTE', 30))
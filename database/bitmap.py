@@ -0,0 +1,244 @@
+import sys
+from array import array
+from bisect import bisect_left
+
+# Containers hold the low 16 bits of the IDs sharing the same high bits
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Above this many members a container is stored as a bitmap instead of a sorted array
+ARRAY_LIMIT = 4096
+# Below this many members per container on average, the per-container overhead
+# outweighs the savings, so the set is kept as one flat sorted array('q')
+# (real Telegram IDs are spread over billions and mostly land one per container)
+MIN_CHUNK_DENSITY = 64
+
+
+def _is_sparse(members, containers):
+    return members < max(containers, 1) * MIN_CHUNK_DENSITY
+
+
+def _count(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _chunk(ids):
+    """Group sorted IDs into containers keyed by their high bits"""
+    chunks = {}
+    high, lows = None, []
+    for user_id in ids:
+        if user_id >> CHUNK_BITS != high:
+            if lows:
+                chunks[high] = _pack_sorted(lows)
+            high, lows = user_id >> CHUNK_BITS, []
+        lows.append(user_id & CHUNK_MASK)
+    if lows:
+        chunks[high] = _pack_sorted(lows)
+    return chunks
+
+
+def _iter_chunks(chunks):
+    for high in sorted(chunks):
+        base = high << CHUNK_BITS
+        container = chunks[high]
+        lows = _iter_bits(container) if isinstance(container, int) else container
+        for low in lows:
+            yield base + low
+
+
+def _to_bits(container):
+    if isinstance(container, int):
+        return container
+    data = bytearray((CHUNK_MASK + 1) // 8)
+    for low in container:
+        data[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _iter_bits(bits):
+    """Yield the positions of set bits in ascending order"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        while byte:
+            lowest = byte & -byte
+            yield index * 8 + lowest.bit_length() - 1
+            byte ^= lowest
+
+
+def _pack(bits):
+    """Store a bitmap container in its smaller form (None when empty)"""
+    if not bits:
+        return None
+    if bits.bit_count() <= ARRAY_LIMIT:
+        return array('H', _iter_bits(bits))
+    return bits
+
+
+def _pack_sorted(lows):
+    if not lows:
+        return None
+    if len(lows) > ARRAY_LIMIT:
+        return _to_bits(lows)
+    return array('H', lows)
+
+
+# Container operations: (on two sorted arrays, on two bitmaps)
+UNION = (lambda a, b: sorted(set(a).union(b)), lambda a, b: a | b)
+INTERSECTION = (lambda a, b: sorted(set(a).intersection(b)), lambda a, b: a & b)
+DIFFERENCE = (lambda a, b: sorted(set(a).difference(b)), lambda a, b: a & ~b)
+
+
+def _merge(a, b, operation):
+    """Combine two containers, only building bitmaps when one side is already dense"""
+    on_arrays, on_bits = operation
+    if isinstance(a, int) or isinstance(b, int):
+        return _pack(on_bits(_to_bits(a), _to_bits(b)))
+    return _pack_sorted(on_arrays(a, b))
+
+
+class UserSet:
+    """Compressed set of user IDs with fast union, intersection and difference
+
+    Dense sets are Roaring-style: IDs are grouped by their high bits into
+    containers that are sorted arrays of 16-bit values while sparse and
+    integer bitmaps once dense. Sparse sets, where containers would hold
+    only a few IDs each, are one sorted array('q') instead. Iteration
+    yields IDs in ascending order, so a set can be passed straight to the
+    broadcast engine as recipients.
+    """
+
+    __slots__ = ('_chunks', '_flat')
+
+    def __init__(self, user_ids=()):
+        self._chunks = None
+        self._flat = array('q')
+        if user_ids:
+            self._load(array('q', sorted(set(user_ids))))
+
+    @classmethod
+    def from_sorted(cls, user_ids):
+        """Build a set from IDs already in ascending order without duplicates"""
+        user_set = cls()
+        user_set._load(array('q', user_ids))
+        return user_set
+
+    def _load(self, ids):
+        """Store sorted unique IDs in whichever layout suits their density"""
+        containers = len({user_id >> CHUNK_BITS for user_id in ids})
+        if _is_sparse(len(ids), containers):
+            self._chunks, self._flat = None, ids
+        else:
+            self._chunks, self._flat = _chunk(ids), None
+
+    def _as_chunks(self):
+        return self._chunks if self._flat is None else _chunk(self._flat)
+
+    def _combine(self, other, operation, keep_self_only, keep_other_only):
+        ours, theirs = self._as_chunks(), other._as_chunks()
+        chunks = {}
+        for high, container in ours.items():
+            if high in theirs:
+                container = _merge(container, theirs[high], operation)
+            elif not keep_self_only:
+                continue
+            if container is not None:
+                chunks[high] = container
+        if keep_other_only:
+            for high, container in theirs.items():
+                if high not in ours:
+                    chunks[high] = container
+
+        result = UserSet()
+        members = sum(_count(container) for container in chunks.values())
+        if _is_sparse(members, len(chunks)):
+            result._flat = array('q', _iter_chunks(chunks))
+        else:
+            result._chunks, result._flat = chunks, None
+        return result
+
+    def _combine_flat(self, other, operation):
+        return UserSet.from_sorted(operation[0](self._flat, other._flat))
+
+    def __or__(self, other):
+        if self._flat is not None and other._flat is not None:
+            return self._combine_flat(other, UNION)
+        return self._combine(other, UNION, True, True)
+
+    def __and__(self, other):
+        if self._flat is not None and other._flat is not None:
+            return self._combine_flat(other, INTERSECTION)
+        # Probing the dense set keeps the cost proportional to the flat side
+        if self._flat is not None:
+            return UserSet.from_sorted([user_id for user_id in self._flat if user_id in other])
+        if other._flat is not None:
+            return UserSet.from_sorted([user_id for user_id in other._flat if user_id in self])
+        return self._combine(other, INTERSECTION, False, False)
+
+    def __sub__(self, other):
+        if self._flat is not None and other._flat is not None:
+            return self._combine_flat(other, DIFFERENCE)
+        if self._flat is not None:
+            return UserSet.from_sorted([user_id for user_id in self._flat if user_id not in other])
+        return self._combine(other, DIFFERENCE, True, False)
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+
+    def __contains__(self, user_id):
+        if self._flat is not None:
+            index = bisect_left(self._flat, user_id)
+            return index < len(self._flat) and self._flat[index] == user_id
+        container = self._chunks.get(user_id >> CHUNK_BITS)
+        if container is None:
+            return False
+        low = user_id & CHUNK_MASK
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        index = bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def __len__(self):
+        if self._flat is not None:
+            return len(self._flat)
+        return sum(_count(container) for container in self._chunks.values())
+
+    def __bool__(self):
+        return len(self) > 0 if self._flat is not None else bool(self._chunks)
+
+    def __iter__(self):
+        if self._flat is not None:
+            return iter(self._flat)
+        return _iter_chunks(self._chunks)
+
+    def __eq__(self, other):
+        if not isinstance(other, UserSet):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def to_array(self):
+        """Get the members as a sorted array('q')"""
+        return array('q', self)
+
+    def stats(self):
+        """Get the layout, container counts and memory use in bytes"""
+        if self._flat is not None:
+            return {
+                'members': len(self._flat),
+                'layout': 'flat',
+                'containers': 0,
+                'bitmaps': 0,
+                'bytes': sys.getsizeof(self._flat)
+            }
+        return {
+            'members': len(self),
+            'layout': 'chunked',
+            'containers': len(self._chunks),
+            'bitmaps': sum(1 for container in self._chunks.values() if isinstance(container, int)),
+            'bytes': sys.getsizeof(self._chunks) + sum(
+                sys.getsizeof(high) + sys.getsizeof(container) for high, container in self._chunks.items()
+            )
+        }
+
+    def __repr__(self):
+        return f"UserSet({len(self)} users)"
+
@@ -0,0 +1,438 @@
+import asyncio
+import time
+from datetime import datetime
+
+from database.queries import CLICKED_BEFORE
+
+
+class BatchBuffer:
+    """Write-behind buffer that inserts queued rows with one executemany per flush
+
+    A flush happens when `batch_size` rows are pending or every
+    `flush_interval` seconds, whichever comes first. Once `max_pending`
+    rows are waiting, producers wait up to `backpressure_timeout` for a
+    flush to make room before the row is dropped.
+    """
+
+    name = 'rows'
+    insert_sql = None
+
+    def __init__(self, db, batch_size=500, flush_interval=1.0, max_pending=10000, backpressure_timeout=1.0):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.backpressure_timeout = backpressure_timeout
+        self._rows = []
+        self._batch_ready = asyncio.Event()
+        self._space_freed = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+        # Metrics
+        self.logged = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.delayed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the periodic flush task"""
+        if not self._task:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush task and write out everything still pending"""
+        if self._task:
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def add_row(self, row):
+        """Queue a row without waiting for disk I/O"""
+        if len(self._rows) >= self.max_pending:
+            self.delayed += 1
+            self._batch_ready.set()
+            try:
+                while len(self._rows) >= self.max_pending:
+                    self._space_freed.clear()
+                    await asyncio.wait_for(self._space_freed.wait(), self.backpressure_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                return False
+
+        self._rows.append(row)
+        self.logged += 1
+        if len(self._rows) >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    async def flush(self):
+        """Write all pending rows in one transaction"""
+        if not self._rows:
+            return 0
+        rows, self._rows = self._rows, []
+        self._space_freed.set()
+
+        async def job(db):
+            await self.write_rows(db, rows)
+
+        try:
+            await self.db.write(job)
+        except Exception as e:
+            self.failed += len(rows)
+            print(f"Error flushing {len(rows)} {self.name}: {e}")
+            return 0
+
+        self.flushed += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    async def write_rows(self, db, rows):
+        """Insert a batch of rows (runs inside the writer transaction)"""
+        await db.executemany(self.insert_sql, rows)
+
+    async def _run(self):
+        """Flush on a full batch or when the interval elapses"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    def stats(self):
+        """Get buffer metrics"""
+        return {
+            'pending': len(self._rows),
+            'logged': self.logged,
+            'flushed': self.flushed,
+            'flushes': self.flushes,
+            'delayed': self.delayed,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+
+class AnalyticsBuffer(BatchBuffer):
+    """Write-behind buffer for analytics events"""
+
+    name = 'analytics events'
+    insert_sql = """
+        INSERT INTO analytics (event_type, user_id, data, timestamp)
+        VALUES (?, ?, ?, ?)
+    """
+
+    async def add(self, event_type, user_id, data=""):
+        """Queue an analytics event without waiting for disk I/O"""
+        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        return await self.add_row((event_type, user_id, str(data), timestamp))
+
+
+class DeliveryLog(BatchBuffer):
+    """Per-recipient outcome of broadcast, campaign and A/B test sends
+
+    Rows are integer coded to stay small at broadcast volume; a resend to
+    the same recipient of the same job replaces the earlier row.
+    """
+
+    # Job types
+    BROADCAST = 1
+    CAMPAIGN = 2
+    AB_TEST = 3
+
+    # Statuses
+    SENT = 1
+    FAILED = 2
+    UNREACHABLE = 3
+
+    name = 'delivery log rows'
+    insert_sql = """
+        INSERT OR REPLACE INTO delivery_log (job_type, job_id, user_id, variant, status, message_id, sent_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+
+    async def record(self, job_type, job_id, user_id, status, message_id=None, variant=0):
+        """Queue the outcome of one send"""
+        return await self.add_row((job_type, job_id, user_id, variant, status, message_id, int(time.time())))
+
+    async def write_rows(self, db, rows):
+        """Insert a batch and apply its campaign sends to campaign_stats_hourly
+
+        A resend replaces the recipient's earlier row, so the rollup takes
+        the replaced outcome back out and each recipient counts once.
+        """
+        # The last row per recipient wins, as with INSERT OR REPLACE
+        campaign_rows = {}
+        for row in rows:
+            if row[0] == self.CAMPAIGN:
+                campaign_rows[row[1], row[2]] = row
+        replaced = await self._existing_campaign_rows(db, campaign_rows)
+
+        await super().write_rows(db, rows)
+
+        # (campaign_id, hour) -> [sent, delivered, failed, unreachable], indexed by status code
+        counts = {}
+        changes = [(job_id, status, sent_at, 1) for job_type, job_id, user_id, variant, status, message_id, sent_at
+                   in campaign_rows.values()]
+        changes += [(job_id, status, sent_at, -1) for job_id, status, sent_at in replaced]
+        for job_id, status, sent_at, delta in changes:
+            totals = counts.setdefault((job_id, sent_at - sent_at % 3600), [0, 0, 0, 0])
+            totals[0] += delta
+            totals[status] += delta
+        rollup = [key + tuple(totals) for key, totals in counts.items() if any(totals)]
+        if rollup:
+            await db.executemany("""
+                INSERT INTO campaign_stats_hourly (campaign_id, hour, sent, delivered, failed, unreachable)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (campaign_id, hour) DO UPDATE SET
+                    sent = sent + excluded.sent,
+                    delivered = delivered + excluded.delivered,
+                    failed = failed + excluded.failed,
+                    unreachable = unreachable + excluded.unreachable
+            """, rollup)
+
+    async def _existing_campaign_rows(self, db, campaign_rows):
+        """Get (job_id, status, sent_at) of the logged rows a batch is about to replace"""
+        user_ids = {}
+        for job_id, user_id in campaign_rows:
+            user_ids.setdefault(job_id, []).append(user_id)
+
+        existing = []
+        for job_id, ids in user_ids.items():
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                async with db.execute(f"""
+                    SELECT job_id, status, sent_at FROM delivery_log
+                    WHERE job_type = ? AND job_id = ? AND user_id IN ({', '.join('?' * len(chunk))})
+                """, (self.CAMPAIGN, job_id, *chunk)) as cursor:
+                    existing.extend(await cursor.fetchall())
+        return existing
+
+class ActivityTracker:
+    """Coalesces last-activity updates into one batched UPDATE per interval
+
+    `touch()` only records the latest timestamp per user in memory, so each
+    user is written at most once per flush no matter how many updates they
+    send. Queries that filter on `last_activity` should call `flush()` first.
+    """
+
+    def __init__(self, db, flush_interval=60.0):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._task = None
+        self._stopping = asyncio.Event()
+
+        # Metrics
+        self.touches = 0
+        self.flushed = 0
+        self.flushes = 0
+
+    def start(self):
+        """Start the periodic flush task"""
+        if not self._task:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush task and write out pending activity"""
+        if self._task:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def touch(self, user_id):
+        """Record activity for a user"""
+        self._pending[user_id] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        self.touches += 1
+
+    async def flush(self):
+        """Write all pending activity timestamps in one transaction"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        rows = [(timestamp, user_id) for user_id, timestamp in pending.items()]
+
+        async def job(db):
+            await db.executemany("UPDATE users SET last_activity = ? WHERE user_id = ?", rows)
+            # Active users are reachable again; count how many were not
+            cursor = await db.executemany(
+                "UPDATE users SET is_reachable = TRUE WHERE user_id = ? AND is_reachable = FALSE",
+                [(user_id,) for user_id in pending]
+            )
+            return cursor.rowcount
+
+        try:
+            reachable_again = await self.db.write(job)
+        except Exception as e:
+            # Put the timestamps back unless newer ones arrived meanwhile
+            for user_id, timestamp in pending.items():
+                self._pending.setdefault(user_id, timestamp)
+            print(f"Error flushing activity for {len(rows)} users: {e}")
+            return 0
+
+        if reachable_again:
+            # Segments exclude unreachable users, so cached members are stale
+            self.db.segment_cache.clear()
+        self.flushed += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    async def _run(self):
+        """Flush every interval until stopped"""
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def stats(self):
+        """Get tracker metrics"""
+        return {
+            'pending': len(self._pending),
+            'touches': self.touches,
+            'flushed': self.flushed,
+            'flushes': self.flushes
+        }
+
+
+class ClickCounter:
+    """Counts tracked button clicks in memory and adds them to the rollups per interval
+
+    Counts are kept per (job_type, job_id, variant, button, hour), so a
+    burst of clicks on one campaign costs one upsert per key at the next
+    flush. `presses` counts every press; `clicks` only a user's first
+    click on a button, which click_users remembers. Campaign clicks also
+    go to the `clicked` column of campaign_stats_hourly.
+    """
+
+    def __init__(self, db, flush_interval=10.0):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._pending = {}
+        # (job_type, job_id, variant, button, user_id) -> hour of first clicks not written yet
+        self._first_clicks = {}
+        self._task = None
+        self._stopping = asyncio.Event()
+
+        # Metrics
+        self.clicks = 0
+        self.unique_clicks = 0
+        self.flushed = 0
+        self.flushes = 0
+
+    def start(self):
+        """Start the periodic flush task"""
+        if not self._task:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush task and write out pending clicks"""
+        if self._task:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def click(self, job_type, job_id, variant, button, user_id):
+        """Count a press on a tracked button; returns True if it is the user's first click on it"""
+        now = int(time.time())
+        hour = now - now % 3600
+        key = (job_type, job_id, variant, button, hour)
+        self._pending[key] = self._pending.get(key, 0) + 1
+        self.clicks += 1
+
+        click = (job_type, job_id, variant, button, user_id)
+        if click in self._first_clicks:
+            return False
+        async with self.db.get_connection() as db:
+            async with db.execute(CLICKED_BEFORE, click) as cursor:
+                if await cursor.fetchone():
+                    return False
+        self._first_clicks[click] = hour
+        self.unique_clicks += 1
+        return True
+
+    async def flush(self):
+        """Add all pending click counts to the rollups in one transaction"""
+        if not self._pending and not self._first_clicks:
+            return 0
+        pending, self._pending = self._pending, {}
+        first_clicks, self._first_clicks = self._first_clicks, {}
+
+        # (job_type, job_id, variant, button, hour) -> users whose first click it may be
+        new_users = {}
+        for (job_type, job_id, variant, button, user_id), hour in first_clicks.items():
+            new_users.setdefault((job_type, job_id, variant, button, hour), []).append((user_id,))
+
+        async def job(db):
+            # Only users click_users did not have yet count, in case another instance was first
+            clicks = {}
+            for key, users in new_users.items():
+                cursor = await db.executemany("""
+                    INSERT OR IGNORE INTO click_users (job_type, job_id, variant, button, user_id)
+                    VALUES (?, ?, ?, ?, ?)
+                """, [key[:4] + user for user in users])
+                clicks[key] = cursor.rowcount
+
+            await db.executemany("""
+                INSERT INTO click_stats_hourly (job_type, job_id, variant, button, hour, presses, clicks)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (job_type, job_id, variant, button, hour) DO UPDATE SET
+                    presses = presses + excluded.presses, clicks = clicks + excluded.clicks
+            """, [key + (pending.get(key, 0), clicks.get(key, 0)) for key in set(pending) | set(clicks)])
+
+            # (campaign_id, hour) -> clicks over all variants and buttons
+            campaign_clicks = {}
+            for (job_type, job_id, variant, button, hour), count in clicks.items():
+                if job_type == DeliveryLog.CAMPAIGN and count:
+                    campaign_clicks[job_id, hour] = campaign_clicks.get((job_id, hour), 0) + count
+            if campaign_clicks:
+                await db.executemany("""
+                    INSERT INTO campaign_stats_hourly (campaign_id, hour, clicked)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (campaign_id, hour) DO UPDATE SET clicked = clicked + excluded.clicked
+                """, [key + (count,) for key, count in campaign_clicks.items()])
+
+        try:
+            await self.db.write(job)
+        except Exception as e:
+            # Keep the counts for the next flush
+            for key, presses in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + presses
+            for click, hour in first_clicks.items():
+                self._first_clicks.setdefault(click, hour)
+            print(f"Error flushing {len(pending)} click counters: {e}")
+            return 0
+
+        self.flushed += sum(pending.values())
+        self.flushes += 1
+        return len(pending)
+
+    async def _run(self):
+        """Flush every interval until stopped"""
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def stats(self):
+        """Get counter metrics"""
+        return {
+            'pending': len(self._pending),
+            'clicks': self.clicks,
+            'unique_clicks': self.unique_clicks,
+            'flushed': self.flushed,
+            'flushes': self.flushes
+        }
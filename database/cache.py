@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded LRU cache whose entries expire after `ttl` seconds
+
+    Readers call `generation()` before loading a value from the database and
+    pass it to `put()`; if an invalidation happened in between, the possibly
+    stale value is not stored.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """Get a cached value, or `default` when missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def generation(self):
+        """Get the invalidation generation to pass to put()"""
+        return self._generation
+
+    def put(self, key, value, generation=None):
+        """Store a value unless an invalidation happened since `generation`"""
+        if generation is not None and generation != self._generation:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        """Drop cached values for keys"""
+        self._generation += 1
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached value"""
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self):
+        """Get cache metrics"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations
+        }
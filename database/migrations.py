@@ -0,0 +1,551 @@
+import sys
+
+from database.queries import (
+    REFERRALS_BY_REFERRER, POPULAR_ACTIONS, PROFILE_EVENTS, PROFILE_REFRESH_CONDITION, TOP_REFERRERS,
+    CAMPAIGN_STATS, AB_TEST_GROUP_DELIVERIES, CLICKS_BY_VARIANT, CLICKED_BEFORE, WHEEL_SLOT_PAGE, SCHEDULED_CAMPAIGNS,
+    CAMPAIGN_HELD_DELIVERIES, FINISH_SENT_CAMPAIGNS, CLAIM_BROADCAST_SHARD, profiles_query, segment_count_query, user_page_query
+)
+
+# Full recount of stats_counters, used to seed the table and by the
+# periodic reconcile job. Bucketed counters use 'prefix:<date>' names.
+RECOUNT_STATS_COUNTERS = [
+    "DELETE FROM stats_counters",
+    "INSERT INTO stats_counters (name, value) SELECT 'total_users', COUNT(*) FROM users",
+    "INSERT INTO stats_counters (name, value) SELECT 'active_members', COUNT(*) FROM users WHERE is_member = TRUE",
+    "INSERT INTO stats_counters (name, value) SELECT 'referrers', COUNT(*) FROM users WHERE total_referrals > 0",
+    "INSERT INTO stats_counters (name, value) SELECT 'total_referrals', COUNT(*) FROM referrals",
+    """
+    INSERT INTO stats_counters (name, value)
+    SELECT 'joined:' || DATE(join_date), COUNT(*) FROM users GROUP BY 1
+    """,
+    """
+    INSERT INTO stats_counters (name, value)
+    SELECT 'active:' || strftime('%Y-%m-%d %H', last_activity), COUNT(*) FROM users GROUP BY 1
+    """,
+    """
+    INSERT INTO stats_counters (name, value)
+    SELECT 'referrals:' || strftime('%Y-%m-%d %H', date), COUNT(*) FROM referrals GROUP BY 1
+    """,
+]
+
+# Each migration is (version, description, statements). Versions are applied
+# in order inside one transaction and recorded in schema_version.
+MIGRATIONS = [
+    (1, "baseline tables", [
+        # Users table
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            referrer_id INTEGER,
+            join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_member BOOLEAN DEFAULT FALSE,
+            total_referrals INTEGER DEFAULT 0,
+            points INTEGER DEFAULT 0,
+            is_banned BOOLEAN DEFAULT FALSE,
+            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Referrals table
+        """
+        CREATE TABLE IF NOT EXISTS referrals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            referrer_id INTEGER,
+            referred_id INTEGER,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            reward_given BOOLEAN DEFAULT FALSE,
+            FOREIGN KEY (referrer_id) REFERENCES users (user_id),
+            FOREIGN KEY (referred_id) REFERENCES users (user_id)
+        )
+        """,
+        # Analytics table
+        """
+        CREATE TABLE IF NOT EXISTS analytics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT,
+            user_id INTEGER,
+            data TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Broadcast messages table
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_text TEXT,
+            media_type TEXT,
+            media_file_id TEXT,
+            scheduled_time TIMESTAMP,
+            sent BOOLEAN DEFAULT FALSE,
+            total_sent INTEGER DEFAULT 0,
+            total_failed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Exclusive content table
+        """
+        CREATE TABLE IF NOT EXISTS exclusive_content (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT,
+            description TEXT,
+            file_id TEXT,
+            file_type TEXT,
+            required_referrals INTEGER DEFAULT 0,
+            required_points INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+        """,
+        # User rewards table
+        """
+        CREATE TABLE IF NOT EXISTS user_rewards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            content_id INTEGER,
+            claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (content_id) REFERENCES exclusive_content (id)
+        )
+        """
+    ]),
+    (2, "hot-path indexes", [
+        # add_referral duplicate check, show_my_referrals listing
+        "CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals (referrer_id, referred_id)",
+        "CREATE INDEX IF NOT EXISTS idx_referrals_date ON referrals (date)",
+        # Time-window analytics reports (covering for GROUP BY event_type)
+        "CREATE INDEX IF NOT EXISTS idx_analytics_timestamp ON analytics (timestamp, event_type)",
+        # analyze_user_behavior (covering)
+        "CREATE INDEX IF NOT EXISTS idx_analytics_user ON analytics (user_id, timestamp, event_type)",
+        # Leaderboard
+        "CREATE INDEX IF NOT EXISTS idx_users_referrals ON users (total_referrals DESC, points DESC)",
+        # Activity windows and join-date reports
+        "CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users (last_activity)",
+        "CREATE INDEX IF NOT EXISTS idx_users_join_date ON users (join_date)",
+    ]),
+    (3, "campaign and A/B test tables", [
+        # Scheduled campaigns table
+        """
+        CREATE TABLE IF NOT EXISTS scheduled_campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            campaign_type TEXT,
+            target_type TEXT,
+            message_text TEXT,
+            media_type TEXT,
+            media_file_id TEXT,
+            scheduled_time TIMESTAMP,
+            executed BOOLEAN DEFAULT FALSE,
+            executed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_scheduled_campaigns_due ON scheduled_campaigns (executed, scheduled_time)",
+        # Campaign messages table
+        """
+        CREATE TABLE IF NOT EXISTS campaign_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id INTEGER,
+            user_id INTEGER,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            delivered BOOLEAN DEFAULT FALSE,
+            opened BOOLEAN DEFAULT FALSE,
+            clicked BOOLEAN DEFAULT FALSE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_campaign_messages_sent ON campaign_messages (sent_at, campaign_id)",
+        "CREATE INDEX IF NOT EXISTS idx_campaign_messages_campaign ON campaign_messages (campaign_id, user_id)",
+        # A/B test messages table
+        """
+        CREATE TABLE IF NOT EXISTS ab_test_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id INTEGER,
+            user_id INTEGER,
+            test_group TEXT,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            delivered BOOLEAN DEFAULT FALSE,
+            opened BOOLEAN DEFAULT FALSE,
+            clicked BOOLEAN DEFAULT FALSE,
+            engagement_time REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ab_test_messages_group ON ab_test_messages (test_id, test_group)",
+    ]),
+    (4, "unique referrals and reward claims", [
+        # Drop duplicates left by the old check-then-insert race
+        """
+        DELETE FROM referrals WHERE id NOT IN (
+            SELECT MIN(id) FROM referrals GROUP BY referred_id
+        )
+        """,
+        """
+        DELETE FROM user_rewards WHERE id NOT IN (
+            SELECT MIN(id) FROM user_rewards GROUP BY user_id, content_id
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_referrals_referred ON referrals (referred_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_rewards_claim ON user_rewards (user_id, content_id)",
+    ]),
+    (5, "materialized stats counters", [
+        """
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_user_insert AFTER INSERT ON users
+        BEGIN
+            INSERT INTO stats_counters (name, value) VALUES
+                ('total_users', 1),
+                ('active_members', CASE WHEN NEW.is_member THEN 1 ELSE 0 END),
+                ('joined:' || DATE(NEW.join_date), 1),
+                ('active:' || strftime('%Y-%m-%d %H', NEW.last_activity), 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_user_delete AFTER DELETE ON users
+        BEGIN
+            INSERT INTO stats_counters (name, value) VALUES
+                ('total_users', -1),
+                ('active_members', CASE WHEN OLD.is_member THEN -1 ELSE 0 END),
+                ('referrers', CASE WHEN OLD.total_referrals > 0 THEN -1 ELSE 0 END),
+                ('joined:' || DATE(OLD.join_date), -1),
+                ('active:' || strftime('%Y-%m-%d %H', OLD.last_activity), -1)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_membership AFTER UPDATE OF is_member ON users
+        WHEN COALESCE(OLD.is_member, 0) != COALESCE(NEW.is_member, 0)
+        BEGIN
+            INSERT INTO stats_counters (name, value)
+            VALUES ('active_members', CASE WHEN NEW.is_member THEN 1 ELSE -1 END)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_referrer AFTER UPDATE OF total_referrals ON users
+        WHEN (OLD.total_referrals > 0) != (NEW.total_referrals > 0)
+        BEGIN
+            INSERT INTO stats_counters (name, value)
+            VALUES ('referrers', CASE WHEN NEW.total_referrals > 0 THEN 1 ELSE -1 END)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_activity AFTER UPDATE OF last_activity ON users
+        WHEN strftime('%Y-%m-%d %H', OLD.last_activity) IS NOT strftime('%Y-%m-%d %H', NEW.last_activity)
+        BEGIN
+            INSERT INTO stats_counters (name, value) VALUES
+                ('active:' || strftime('%Y-%m-%d %H', OLD.last_activity), -1),
+                ('active:' || strftime('%Y-%m-%d %H', NEW.last_activity), 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_referral_insert AFTER INSERT ON referrals
+        BEGIN
+            INSERT INTO stats_counters (name, value) VALUES
+                ('total_referrals', 1),
+                ('referrals:' || strftime('%Y-%m-%d %H', NEW.date), 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_referral_delete AFTER DELETE ON referrals
+        BEGIN
+            INSERT INTO stats_counters (name, value) VALUES
+                ('total_referrals', -1),
+                ('referrals:' || strftime('%Y-%m-%d %H', OLD.date), -1)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+        END
+        """,
+    ] + RECOUNT_STATS_COUNTERS),
+    (6, "resumable broadcast jobs", [
+        "ALTER TABLE broadcasts ADD COLUMN status TEXT DEFAULT 'pending'",
+        "ALTER TABLE broadcasts ADD COLUMN audience TEXT DEFAULT 'all'",
+        "ALTER TABLE broadcasts ADD COLUMN cursor_user_id INTEGER DEFAULT -1",
+        "ALTER TABLE broadcasts ADD COLUMN total_users INTEGER DEFAULT 0",
+        "ALTER TABLE broadcasts ADD COLUMN created_by INTEGER",
+        "ALTER TABLE broadcasts ADD COLUMN admin_chat_id INTEGER",
+        "ALTER TABLE broadcasts ADD COLUMN status_message_id INTEGER",
+        "ALTER TABLE broadcasts ADD COLUMN started_at TIMESTAMP",
+        "ALTER TABLE broadcasts ADD COLUMN finished_at TIMESTAMP",
+        "UPDATE broadcasts SET status = CASE WHEN sent THEN 'done' ELSE 'pending' END",
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status, scheduled_time)",
+    ]),
+    (7, "unreachable users", [
+        "ALTER TABLE users ADD COLUMN is_reachable BOOLEAN DEFAULT TRUE",
+        "ALTER TABLE users ADD COLUMN unreachable_at TIMESTAMP",
+        # Broadcast audiences walk this partial index instead of the whole table
+        """
+        CREATE INDEX IF NOT EXISTS idx_users_reachable ON users (user_id)
+        WHERE is_banned = FALSE AND is_reachable = TRUE
+        """,
+    ]),
+    (8, "sharded broadcast workers", [
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_shards (
+            broadcast_id INTEGER NOT NULL,
+            shard INTEGER NOT NULL,
+            shard_count INTEGER NOT NULL,
+            status TEXT DEFAULT 'pending',
+            cursor_user_id INTEGER DEFAULT -1,
+            total_sent INTEGER DEFAULT 0,
+            total_failed INTEGER DEFAULT 0,
+            worker_pid INTEGER,
+            heartbeat_at TIMESTAMP,
+            PRIMARY KEY (broadcast_id, shard)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_shards_claim ON broadcast_shards (shard, status)",
+    ]),
+    (9, "delivery log", [
+        # Integer coded, see DeliveryLog; sent_at is unix time
+        """
+        CREATE TABLE IF NOT EXISTS delivery_log (
+            job_type INTEGER NOT NULL,
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            variant INTEGER NOT NULL DEFAULT 0,
+            status INTEGER NOT NULL,
+            message_id INTEGER,
+            sent_at INTEGER NOT NULL,
+            PRIMARY KEY (job_type, job_id, user_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_delivery_log_sent ON delivery_log (job_type, sent_at)",
+    ]),
+    (10, "user behavior profiles", [
+        # Rebuilt from analytics by UserProfileBuilder; interests is comma separated
+        """
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            user_id INTEGER PRIMARY KEY,
+            best_time INTEGER NOT NULL DEFAULT 12,
+            engagement_score INTEGER NOT NULL DEFAULT 0,
+            interests TEXT NOT NULL DEFAULT '',
+            updated_at INTEGER NOT NULL
+        )
+        """,
+    ]),
+    (11, "campaign delivery wheel", [
+        # Campaign messages waiting for the user's best hour, see DeliveryWheel
+        """
+        CREATE TABLE IF NOT EXISTS campaign_deliveries (
+            slot INTEGER NOT NULL,
+            campaign_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            PRIMARY KEY (slot, campaign_id, user_id)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (12, "campaigns with status and leases", [
+        # status: draft -> scheduled -> running -> (sending ->) done / failed, see CampaignManager
+        """
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            campaign_type TEXT,
+            target_type TEXT NOT NULL DEFAULT 'all',
+            message_text TEXT,
+            media_type TEXT,
+            media_file_id TEXT,
+            status TEXT NOT NULL DEFAULT 'draft',
+            scheduled_time TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_campaigns_due ON campaigns (status, scheduled_time)",
+        # Held by the bot instance running a campaign; expires_at is unix time
+        """
+        CREATE TABLE IF NOT EXISTS campaign_leases (
+            campaign_id INTEGER PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+        """,
+        """
+        INSERT INTO campaigns
+            (id, name, campaign_type, target_type, message_text, media_type, media_file_id,
+             status, scheduled_time, finished_at, created_at)
+        SELECT id, name, campaign_type, COALESCE(target_type, 'all'), message_text, media_type, media_file_id,
+               CASE WHEN executed THEN 'done' ELSE 'scheduled' END, scheduled_time, executed_at, created_at
+        FROM scheduled_campaigns
+        """,
+        "DROP TABLE scheduled_campaigns",
+    ]),
+    (13, "hourly campaign stats", [
+        # Maintained by DeliveryLog flushes; hour is the unix time of the hour's start
+        """
+        CREATE TABLE IF NOT EXISTS campaign_stats_hourly (
+            campaign_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            sent INTEGER NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            unreachable INTEGER NOT NULL DEFAULT 0,
+            opened INTEGER NOT NULL DEFAULT 0,
+            clicked INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (campaign_id, hour)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_campaign_stats_hour ON campaign_stats_hourly (hour, campaign_id)",
+        # Backfill from the delivery log (job_type 2 is a campaign; statuses 1-3 as in DeliveryLog)
+        """
+        INSERT INTO campaign_stats_hourly (campaign_id, hour, sent, delivered, failed, unreachable)
+        SELECT job_id, sent_at - sent_at % 3600, COUNT(*),
+               SUM(status = 1), SUM(status = 2), SUM(status = 3)
+        FROM delivery_log WHERE job_type = 2
+        GROUP BY job_id, sent_at - sent_at % 3600
+        """,
+    ]),
+    (14, "tracked button clicks", [
+        # JSON list of {"text": ..., "url": ...} or {"text": ..., "reply": ...} buttons
+        "ALTER TABLE campaigns ADD COLUMN buttons TEXT",
+        # Maintained by ClickCounter flushes; job_type and variant as in DeliveryLog
+        """
+        CREATE TABLE IF NOT EXISTS click_stats_hourly (
+            job_type INTEGER NOT NULL,
+            job_id INTEGER NOT NULL,
+            variant INTEGER NOT NULL,
+            button INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            clicks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (job_type, job_id, variant, button, hour)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (15, "campaigns sending held deliveries", [
+        # A campaign whose run left deliveries on the wheel stays 'sending' until they are sent
+        "CREATE INDEX IF NOT EXISTS idx_campaign_deliveries_campaign ON campaign_deliveries (campaign_id)",
+    ]),
+    (16, "campaign progress messages", [
+        # The admin's status message that shows a running campaign's progress
+        "ALTER TABLE campaigns ADD COLUMN admin_chat_id INTEGER",
+        "ALTER TABLE campaigns ADD COLUMN status_message_id INTEGER",
+    ]),
+    (17, "unique button clicks", [
+        # One row per user and tracked button, so clicks only count a user's first click
+        """
+        CREATE TABLE IF NOT EXISTS click_users (
+            job_type INTEGER NOT NULL,
+            job_id INTEGER NOT NULL,
+            variant INTEGER NOT NULL,
+            button INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (job_type, job_id, variant, button, user_id)
+        ) WITHOUT ROWID
+        """,
+        # Every press including repeats; until now that is what clicks counted
+        "ALTER TABLE click_stats_hourly ADD COLUMN presses INTEGER NOT NULL DEFAULT 0",
+        "UPDATE click_stats_hourly SET presses = clicks",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Hot queries that must be served by an index, built from the SQL the
+# data-access code runs. Parameters only need the right shape; EXPLAIN
+# QUERY PLAN does not depend on their values.
+_AUDIENCE_PAGE, _AUDIENCE_PARAMS = user_page_query('all')
+HOT_QUERIES = {
+    'my_referrals': (REFERRALS_BY_REFERRER.format(columns='referred_id, date'), (1, 20)),
+    'popular_actions': (POPULAR_ACTIONS, (10,)),
+    'profile_refresh': (
+        PROFILE_EVENTS.format(where=PROFILE_REFRESH_CONDITION), ('-30 days', 0, 1)
+    ),
+    'campaign_profiles': (profiles_query(3), (1, 2, 3)),
+    'leaderboard': (TOP_REFERRERS.format(columns='user_id, first_name, total_referrals, points'), (10,)),
+    'active_users': segment_count_query('active'),
+    'new_users': segment_count_query('new'),
+    'broadcast_audience': (_AUDIENCE_PAGE, _AUDIENCE_PARAMS + (-1, 500)),
+    'claim_broadcast_shard': (CLAIM_BROADCAST_SHARD, (0, 0, 4)),
+    'campaign_performance': (CAMPAIGN_STATS, (0, 3600)),
+    'ab_test_group': (AB_TEST_GROUP_DELIVERIES, (1, 3, 1, 1)),
+    'ab_test_clicks': (CLICKS_BY_VARIANT, (3, 1, 1)),
+    'clicked_before': (CLICKED_BEFORE, (2, 1, 0, 0, 1)),
+    'wheel_slot': (WHEEL_SLOT_PAGE, (0, 0, -1, 0, 500)),
+    'due_campaigns': (SCHEDULED_CAMPAIGNS, ()),
+    'campaign_held_deliveries': (CAMPAIGN_HELD_DELIVERIES, (1,)),
+    'finish_sent_campaigns': (FINISH_SENT_CAMPAIGNS, ()),
+}
+
+
+async def get_schema_version(db):
+    """Get the highest applied migration version"""
+    async with db.execute("SELECT MAX(version) FROM schema_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] or 0
+
+
+async def run_migrations(db):
+    """Apply all pending migrations (run as a writer job)"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    current = await get_schema_version(db)
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        for statement in statements:
+            await db.execute(statement)
+        await db.execute(
+            "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+            (version, description)
+        )
+        applied.append(version)
+    return applied
+
+
+def find_table_scans(plan_rows):
+    """Return plan steps that scan a table without an index"""
+    return [
+        row[-1] for row in plan_rows
+        if row[-1].startswith('SCAN ') and 'INDEX' not in row[-1]
+    ]
+
+
+async def check_query_plans(db, queries=None):
+    """Run EXPLAIN QUERY PLAN for hot queries and report any full scans"""
+    problems = {}
+    for name, (query, params) in (queries or HOT_QUERIES).items():
+        async with db.execute(f"EXPLAIN QUERY PLAN {query}", params) as cursor:
+            scans = find_table_scans(await cursor.fetchall())
+        if scans:
+            problems[name] = scans
+    return problems
+
+
+def main(db_path):
+    """Migrate a database file and fail if a hot query falls back to a scan"""
+    import asyncio
+    import aiosqlite
+
+    async def run():
+        async with aiosqlite.connect(db_path) as db:
+            await run_migrations(db)
+            await db.commit()
+            return await check_query_plans(db)
+
+    problems = asyncio.run(run())
+    for name, scans in problems.items():
+        print(f"{name}: {'; '.join(scans)}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else ':memory:'))
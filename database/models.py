@@ -1,256 +1,452 @@
-import aiosqlite
 from datetime import datetime
+from itertools import islice
 import json
+from config import (
+    REFERRAL_REWARD, USER_PAGE_SIZE,
+    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_PRAGMAS,
+    ANALYTICS_BATCH_SIZE, ANALYTICS_FLUSH_INTERVAL_MS, ANALYTICS_MAX_PENDING,
+    ACTIVITY_FLUSH_INTERVAL, USER_CACHE_SIZE, USER_CACHE_TTL, SEGMENT_CACHE_SIZE, SEGMENT_CACHE_TTL,
+    DELIVERY_LOG_BATCH_SIZE, DELIVERY_LOG_FLUSH_INTERVAL_MS, DELIVERY_LOG_MAX_PENDING, CLICK_FLUSH_INTERVAL
+)
+from database.bitmap import UserSet
+from database.buffers import AnalyticsBuffer, ActivityTracker, DeliveryLog, ClickCounter
+from database.cache import LRUCache
+from database.migrations import run_migrations, check_query_plans, RECOUNT_STATS_COUNTERS
+from database.queries import (
+    PROFILE_COLUMNS, REFERRALS_BY_REFERRER, TOP_REFERRERS, CAMPAIGN_STATS,
+    profiles_query, segment_count_query, user_page_query
+)
+from database.pool import ConnectionPool
+from database.rows import UserRow, ReferralRow, ContentRow, ProfileRow, partial_row_type, select_columns, row_factory
+from database.segments import compile_segment_query, segment_key, uses_activity
+from database.writer import SQLiteWriter
+
 
 class Database:
-    def __init__(self, db_path="bot.db"):
+    def __init__(self, db_path="bot.db", pool_size=DB_POOL_SIZE, pool_timeout=DB_POOL_TIMEOUT, pragmas=None):
         self.db_path = db_path
+        self.pragmas = DB_PRAGMAS if pragmas is None else pragmas
+        self.pool = ConnectionPool(db_path, size=pool_size, timeout=pool_timeout, pragmas=self.pragmas)
+        self.writer = SQLiteWriter(db_path, pragmas=self.pragmas)
+        self.analytics_buffer = AnalyticsBuffer(
+            self,
+            batch_size=ANALYTICS_BATCH_SIZE,
+            flush_interval=ANALYTICS_FLUSH_INTERVAL_MS / 1000,
+            max_pending=ANALYTICS_MAX_PENDING
+        )
+        self.activity_tracker = ActivityTracker(self, flush_interval=ACTIVITY_FLUSH_INTERVAL)
+        self.delivery_log = DeliveryLog(
+            self,
+            batch_size=DELIVERY_LOG_BATCH_SIZE,
+            flush_interval=DELIVERY_LOG_FLUSH_INTERVAL_MS / 1000,
+            max_pending=DELIVERY_LOG_MAX_PENDING
+        )
+        self.click_counter = ClickCounter(self, flush_interval=CLICK_FLUSH_INTERVAL)
+        self.user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self.segment_cache = LRUCache(maxsize=SEGMENT_CACHE_SIZE, ttl=SEGMENT_CACHE_TTL)
+        self.button_cache = LRUCache(maxsize=SEGMENT_CACHE_SIZE, ttl=SEGMENT_CACHE_TTL)
+    
+    def get_connection(self):
+        """Check out a pooled read connection (reused by nested calls in the same task)"""
+        return self.pool.acquire()
+    
+    def write(self, job):
+        """Run an async write job on the single writer connection
+        
+        The job receives the connection and must not commit; its result is
+        returned once the surrounding transaction has committed.
+        """
+        return self.writer.submit(job)
+    
+    async def execute_write(self, query, params=()):
+        """Run a single write statement through the writer and return its cursor"""
+        async def job(db):
+            return await db.execute(query, params)
+        return await self.write(job)
+    
+    def pool_stats(self):
+        """Get connection pool, writer and buffer metrics"""
+        stats = self.pool.stats()
+        stats['writer'] = self.writer.stats()
+        stats['analytics_buffer'] = self.analytics_buffer.stats()
+        stats['activity_tracker'] = self.activity_tracker.stats()
+        stats['delivery_log'] = self.delivery_log.stats()
+        stats['click_counter'] = self.click_counter.stats()
+        stats['user_cache'] = self.user_cache.stats()
+        stats['segment_cache'] = self.segment_cache.stats()
+        return stats
+    
+    async def close(self):
+        """Flush pending writes and close all connections"""
+        await self.analytics_buffer.stop()
+        await self.activity_tracker.stop()
+        await self.delivery_log.stop()
+        await self.click_counter.stop()
+        await self.writer.stop()
+        await self.pool.close()
     
     async def init_db(self):
-        """Initialize database with all required tables"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Users table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    referrer_id INTEGER,
-                    join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_member BOOLEAN DEFAULT FALSE,
-                    total_referrals INTEGER DEFAULT 0,
-                    points INTEGER DEFAULT 0,
-                    is_banned BOOLEAN DEFAULT FALSE,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Referrals table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS referrals (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    referrer_id INTEGER,
-                    referred_id INTEGER,
-                    date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    reward_given BOOLEAN DEFAULT FALSE,
-                    FOREIGN KEY (referrer_id) REFERENCES users (user_id),
-                    FOREIGN KEY (referred_id) REFERENCES users (user_id)
-                )
-            """)
-            
-            # Analytics table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS analytics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_type TEXT,
-                    user_id INTEGER,
-                    data TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Broadcast messages table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS broadcasts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    message_text TEXT,
-                    media_type TEXT,
-                    media_file_id TEXT,
-                    scheduled_time TIMESTAMP,
-                    sent BOOLEAN DEFAULT FALSE,
-                    total_sent INTEGER DEFAULT 0,
-                    total_failed INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Exclusive content table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS exclusive_content (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT,
-                    description TEXT,
-                    file_id TEXT,
-                    file_type TEXT,
-                    required_referrals INTEGER DEFAULT 0,
-                    required_points INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            """)
-            
-            # User rewards table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS user_rewards (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    content_id INTEGER,
-                    claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id),
-                    FOREIGN KEY (content_id) REFERENCES exclusive_content (id)
-                )
-            """)
-            
-            await db.commit()
+        """Initialize database and apply pending schema migrations"""
+        # The writer opens first so journal_mode=WAL is set before readers attach
+        await self.writer.start()
+        await self.pool.open()
+        
+        applied = await self.write(run_migrations)
+        if applied:
+            print(f"Applied schema migrations: {applied}")
+        
+        async with self.get_connection() as db:
+            for name, scans in (await check_query_plans(db)).items():
+                print(f"Warning: query '{name}' uses a full scan: {'; '.join(scans)}")
+        self.analytics_buffer.start()
+        self.activity_tracker.start()
+        self.delivery_log.start()
+        self.click_counter.start()
     
     async def add_user(self, user_id, username, first_name, last_name, referrer_id=None):
         """Add new user to database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR IGNORE INTO users 
-                (user_id, username, first_name, last_name, referrer_id)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, username, first_name, last_name, referrer_id))
-            await db.commit()
-    
-    async def get_user(self, user_id):
-        """Get user data by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)) as cursor:
-                return await cursor.fetchone()
+        await self.execute_write("""
+            INSERT OR IGNORE INTO users 
+            (user_id, username, first_name, last_name, referrer_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, username, first_name, last_name, referrer_id))
+        self.user_cache.invalidate(user_id)
+    
+    async def get_user(self, user_id, fields=None):
+        """Get user data by ID as a UserRow (only `fields` if given)
+        
+        Full rows are served from a read-through LRU cache; writes that
+        change a user invalidate its entry. `last_activity` in a cached row
+        may lag by up to the cache TTL.
+        """
+        user = self.user_cache.get(user_id)
+        if user is None:
+            generation = self.user_cache.generation()
+            row_type, columns = select_columns(UserRow)
+            async with self.get_connection() as db:
+                async with db.execute(f"SELECT {columns} FROM users WHERE user_id = ?", (user_id,)) as cursor:
+                    cursor.row_factory = row_factory(row_type)
+                    user = await cursor.fetchone()
+            if user is None:
+                return None
+            self.user_cache.put(user_id, user, generation)
+        
+        if not fields:
+            return user
+        return partial_row_type(UserRow, tuple(fields))._make(getattr(user, field) for field in fields)
     
     async def update_user_activity(self, user_id):
-        """Update user's last activity"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?
-            """, (user_id,))
-            await db.commit()
+        """Update user's last activity (coalesced, written in batches)"""
+        self.activity_tracker.touch(user_id)
+    
+    async def flush_activity(self):
+        """Write pending last-activity updates before querying on them"""
+        await self.activity_tracker.flush()
     
     async def update_membership(self, user_id, is_member):
         """Update user membership status"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                UPDATE users SET is_member = ? WHERE user_id = ?
-            """, (is_member, user_id))
-            await db.commit()
+        await self.execute_write("""
+            UPDATE users SET is_member = ? WHERE user_id = ?
+        """, (is_member, user_id))
+        self.user_cache.invalidate(user_id)
+    
+    async def set_user_banned(self, user_id, is_banned):
+        """Ban or unban a user; returns False if the user does not exist"""
+        cursor = await self.execute_write("""
+            UPDATE users SET is_banned = ? WHERE user_id = ?
+        """, (is_banned, user_id))
+        self.user_cache.invalidate(user_id)
+        if cursor.rowcount:
+            # Every segment excludes banned users
+            self.segment_cache.clear()
+        return cursor.rowcount > 0
+    
+    async def mark_user_unreachable(self, user_id):
+        """Exclude a user who blocked the bot or deleted their account from broadcasts
+        
+        The user becomes reachable again on their next activity.
+        """
+        cursor = await self.execute_write("""
+            UPDATE users SET is_reachable = FALSE, unreachable_at = CURRENT_TIMESTAMP
+            WHERE user_id = ? AND is_reachable = TRUE
+        """, (user_id,))
+        self.user_cache.invalidate(user_id)
+        if cursor.rowcount:
+            # Every segment excludes unreachable users
+            self.segment_cache.clear()
     
     async def add_referral(self, referrer_id, referred_id):
-        """Add referral and update points"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Check if referral already exists
+        """Add referral and update points (a user can only be referred once)"""
+        async def job(db):
+            # The unique index on referred_id makes duplicates a no-op
             async with db.execute("""
-                SELECT id FROM referrals WHERE referrer_id = ? AND referred_id = ?
+                INSERT INTO referrals (referrer_id, referred_id)
+                VALUES (?, ?)
+                ON CONFLICT DO NOTHING
+                RETURNING id
             """, (referrer_id, referred_id)) as cursor:
-                existing = await cursor.fetchone()
+                inserted = await cursor.fetchone()
+            
+            if not inserted:
+                return False
             
-            if not existing:
-                await db.execute("""
-                    INSERT INTO referrals (referrer_id, referred_id)
-                    VALUES (?, ?)
-                """, (referrer_id, referred_id))
-                
-                # Update referrer's stats
-                await db.execute("""
-                    UPDATE users 
-                    SET total_referrals = total_referrals + 1,
-                        points = points + 10
-                    WHERE user_id = ?
-                """, (referrer_id,))
-                await db.commit()
-                return True
-            return False
+            # Update referrer's stats
+            await db.execute("""
+                UPDATE users 
+                SET total_referrals = total_referrals + 1,
+                    points = points + ?
+                WHERE user_id = ?
+            """, (REFERRAL_REWARD, referrer_id))
+            return True
+        
+        added = await self.write(job)
+        if added:
+            self.user_cache.invalidate(referrer_id)
+        return added
     
     async def get_user_stats(self):
-        """Get overall bot statistics"""
-        async with aiosqlite.connect(self.db_path) as db:
-            stats = {}
-            
-            # Total users
-            async with db.execute("SELECT COUNT(*) FROM users") as cursor:
-                stats['total_users'] = (await cursor.fetchone())[0]
-            
-            # Active members
-            async with db.execute("SELECT COUNT(*) FROM users WHERE is_member = TRUE") as cursor:
-                stats['active_members'] = (await cursor.fetchone())[0]
+        """Get overall bot statistics from the materialized counters"""
+        await self.flush_activity()
+        async with self.get_connection() as db:
+            counters = await self.get_counters(db, 'total_users', 'active_members', 'total_referrals')
             
             # Today's new users
             async with db.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE DATE(join_date) = DATE('now')
+                SELECT value FROM stats_counters WHERE name = 'joined:' || DATE('now')
             """) as cursor:
-                stats['today_users'] = (await cursor.fetchone())[0]
+                row = await cursor.fetchone()
             
-            # Total referrals
-            async with db.execute("SELECT COUNT(*) FROM referrals") as cursor:
-                stats['total_referrals'] = (await cursor.fetchone())[0]
-            
-            # Active users (last 7 days)
-            async with db.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE last_activity >= datetime('now', '-7 days')
-            """) as cursor:
-                stats['active_week'] = (await cursor.fetchone())[0]
-            
-            return stats
+            return {
+                'total_users': counters['total_users'],
+                'active_members': counters['active_members'],
+                'today_users': row[0] if row else 0,
+                'total_referrals': counters['total_referrals'],
+                'active_week': await self.sum_counter_buckets(db, 'active', '-7 days')
+            }
+    
+    async def get_campaign_stats(self, start, end=None):
+        """Get per-campaign totals between two datetimes from the hourly rollup
+        
+        Returns (campaign_id, name, sent, delivered, failed, unreachable,
+        opened, clicked) rows; the cost grows with the number of campaigns
+        and hours, not messages.
+        """
+        end = end or datetime.now()
+        async with self.get_connection() as db:
+            async with db.execute(CAMPAIGN_STATS, (int(start.timestamp()) // 3600 * 3600, int(end.timestamp()))) as cursor:
+                return await cursor.fetchall()
+    
+    async def get_campaign_buttons(self, campaign_id):
+        """Get a campaign's tracked buttons (cached; campaigns are not edited after creation)"""
+        buttons = self.button_cache.get(campaign_id)
+        if buttons is None:
+            async with self.get_connection() as db:
+                async with db.execute("SELECT buttons FROM campaigns WHERE id = ?", (campaign_id,)) as cursor:
+                    row = await cursor.fetchone()
+            buttons = json.loads(row[0]) if row and row[0] else []
+            self.button_cache.put(campaign_id, buttons)
+        return buttons
+    
+    async def get_counters(self, db, *names):
+        """Read named stats counters (missing counters are 0)"""
+        placeholders = ', '.join('?' for _ in names)
+        async with db.execute(f"""
+            SELECT name, value FROM stats_counters WHERE name IN ({placeholders})
+        """, names) as cursor:
+            values = dict(await cursor.fetchall())
+        return {name: values.get(name, 0) for name in names}
+    
+    async def sum_counter_buckets(self, db, prefix, since):
+        """Sum hourly 'prefix:YYYY-MM-DD HH' counters from a datetime('now', since) modifier"""
+        async with db.execute("""
+            SELECT COALESCE(SUM(value), 0) FROM stats_counters
+            WHERE name >= ? || ':' || strftime('%Y-%m-%d %H', 'now', ?)
+            AND name < ? || ';'
+        """, (prefix, since, prefix)) as cursor:
+            return (await cursor.fetchone())[0]
+    
+    async def reconcile_stats_counters(self):
+        """Recount all stats counters from the base tables"""
+        await self.flush_activity()
+        
+        async def job(db):
+            for statement in RECOUNT_STATS_COUNTERS:
+                await db.execute(statement)
+        
+        await self.write(job)
     
     async def get_top_referrers(self, limit=10):
         """Get top referrers leaderboard"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("""
-                SELECT user_id, first_name, total_referrals, points
-                FROM users 
-                WHERE total_referrals > 0
-                ORDER BY total_referrals DESC, points DESC
-                LIMIT ?
-            """, (limit,)) as cursor:
+        row_type, columns = select_columns(UserRow, ('user_id', 'first_name', 'total_referrals', 'points'))
+        async with self.get_connection() as db:
+            async with db.execute(TOP_REFERRERS.format(columns=columns), (limit,)) as cursor:
+                cursor.row_factory = row_factory(row_type)
+                return await cursor.fetchall()
+    
+    async def get_referrals(self, referrer_id, limit=20, fields=None):
+        """Get the most recent referrals made by a user as ReferralRows"""
+        row_type, columns = select_columns(ReferralRow, fields)
+        async with self.get_connection() as db:
+            async with db.execute(REFERRALS_BY_REFERRER.format(columns=columns), (referrer_id, limit)) as cursor:
+                cursor.row_factory = row_factory(row_type)
                 return await cursor.fetchall()
     
     async def get_all_users(self):
-        """Get all users for broadcasting"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Get all users for broadcasting (prefer iter_users for large audiences)"""
+        async with self.get_connection() as db:
             async with db.execute("""
-                SELECT user_id FROM users WHERE is_banned = FALSE
+                SELECT user_id FROM users WHERE is_banned = FALSE AND is_reachable = TRUE
             """) as cursor:
                 return await cursor.fetchall()
     
+    async def count_users(self, user_filter='all'):
+        """Count users in an audience segment (a name from SEGMENTS or a definition)"""
+        query, params = segment_count_query(user_filter)
+        if uses_activity(user_filter):
+            await self.flush_activity()
+        async with self.get_connection() as db:
+            async with db.execute(query, params) as cursor:
+                return (await cursor.fetchone())[0]
+    
+    async def resolve_segment(self, segment):
+        """Get the members of a segment as a UserSet
+        
+        Members are resolved with one query and cached for SEGMENT_CACHE_TTL
+        seconds, so repeated sends to the same segment do not rescan users.
+        """
+        key = segment_key(segment)
+        members = self.segment_cache.get(key)
+        if members is None:
+            generation = self.segment_cache.generation()
+            query, params = compile_segment_query(segment)
+            if uses_activity(segment):
+                await self.flush_activity()
+            async with self.get_connection() as db:
+                async with db.execute(query, params) as cursor:
+                    members = UserSet.from_sorted([row[0] async for row in cursor])
+            self.segment_cache.put(key, members, generation)
+        return members
+    
+    async def delivery_set(self, job_type, job_id, since=None, status=DeliveryLog.SENT, variant=None):
+        """Get the recipients of a broadcast, campaign or A/B test as a UserSet
+        
+        `since` (a datetime) limits it to sends from then on; `status=None`
+        includes every outcome and `variant` selects one A/B test group.
+        """
+        conditions = ["job_type = ?", "job_id = ?"]
+        params = [job_type, job_id]
+        if since is not None:
+            conditions.append("sent_at >= ?")
+            params.append(int(since.timestamp()))
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if variant is not None:
+            conditions.append("variant = ?")
+            params.append(variant)
+        
+        async with self.get_connection() as db:
+            async with db.execute(f"""
+                SELECT user_id FROM delivery_log WHERE {' AND '.join(conditions)} ORDER BY user_id
+            """, params) as cursor:
+                return UserSet.from_sorted([row[0] async for row in cursor])
+    
+    async def iter_user_batches(self, user_filter='all', batch_size=USER_PAGE_SIZE, start_after=-1, shard=None):
+        """Yield user IDs of a named audience in pages of batch_size
+        
+        Pages are fetched with keyset pagination on user_id, each on its own
+        short checkout, so no connection is held while the caller sends.
+        Only IDs greater than `start_after` are returned, and with
+        `shard=(index, count)` only those with user_id % count == index.
+        """
+        query, params = user_page_query(user_filter, shard)
+        if uses_activity(user_filter):
+            await self.flush_activity()
+        
+        last_id = start_after
+        while True:
+            async with self.get_connection() as db:
+                async with db.execute(query, params + (last_id, batch_size)) as cursor:
+                    rows = await cursor.fetchall()
+            
+            if not rows:
+                return
+            batch = [row[0] for row in rows]
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_id = batch[-1]
+    
+    async def iter_users(self, user_filter='all', batch_size=USER_PAGE_SIZE, start_after=-1, shard=None):
+        """Yield user IDs of a named audience one at a time"""
+        async for batch in self.iter_user_batches(user_filter, batch_size, start_after, shard):
+            for user_id in batch:
+                yield user_id
+    
+    async def iter_user_profiles(self, user_ids, batch_size=USER_PAGE_SIZE):
+        """Yield a ProfileRow for each of `user_ids` (ascending, e.g. a UserSet)
+        
+        Profiles are looked up by primary key a batch at a time; users
+        without a stored profile get the defaults of an empty one.
+        """
+        user_ids = iter(user_ids)
+        while True:
+            batch = list(islice(user_ids, batch_size))
+            if not batch:
+                return
+            async with self.get_connection() as db:
+                async with db.execute(profiles_query(len(batch)), batch) as cursor:
+                    cursor.row_factory = row_factory(ProfileRow)
+                    rows = await cursor.fetchall()
+            for row in rows:
+                yield row
+    
+    async def get_user_profile(self, user_id):
+        """Get a user's precomputed behavior profile as a ProfileRow"""
+        async with self.get_connection() as db:
+            async with db.execute(f"""
+                SELECT {PROFILE_COLUMNS} FROM (SELECT ? AS user_id) AS users
+                LEFT JOIN user_profiles ON user_profiles.user_id = users.user_id
+            """, (user_id,)) as cursor:
+                cursor.row_factory = row_factory(ProfileRow)
+                return await cursor.fetchone()
+    
     async def log_analytics(self, event_type, user_id, data=""):
-        """Log analytics event"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO analytics (event_type, user_id, data)
-                VALUES (?, ?, ?)
-            """, (event_type, user_id, str(data)))
-            await db.commit()
+        """Log analytics event (buffered, written in batches)"""
+        return await self.analytics_buffer.add(event_type, user_id, data)
     
     async def add_exclusive_content(self, title, description, file_id, file_type, required_referrals=0, required_points=0):
         """Add exclusive content"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                INSERT INTO exclusive_content 
-                (title, description, file_id, file_type, required_referrals, required_points)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (title, description, file_id, file_type, required_referrals, required_points))
-            await db.commit()
-            return cursor.lastrowid
+        cursor = await self.execute_write("""
+            INSERT INTO exclusive_content 
+            (title, description, file_id, file_type, required_referrals, required_points)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (title, description, file_id, file_type, required_referrals, required_points))
+        return cursor.lastrowid
     
     async def get_available_content(self, user_referrals, user_points):
         """Get content available for user based on referrals and points"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("""
-                SELECT * FROM exclusive_content 
+        row_type, columns = select_columns(ContentRow)
+        async with self.get_connection() as db:
+            async with db.execute(f"""
+                SELECT {columns} FROM exclusive_content 
                 WHERE is_active = TRUE 
                 AND required_referrals <= ? 
                 AND required_points <= ?
                 ORDER BY required_referrals DESC, required_points DESC
             """, (user_referrals, user_points)) as cursor:
+                cursor.row_factory = row_factory(row_type)
                 return await cursor.fetchall()
     
     async def claim_reward(self, user_id, content_id):
         """Mark content as claimed by user"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Check if already claimed
+        async def job(db):
             async with db.execute("""
-                SELECT id FROM user_rewards WHERE user_id = ? AND content_id = ?
+                INSERT INTO user_rewards (user_id, content_id)
+                VALUES (?, ?)
+                ON CONFLICT DO NOTHING
+                RETURNING id
             """, (user_id, content_id)) as cursor:
-                existing = await cursor.fetchone()
-            
-            if not existing:
-                await db.execute("""
-                    INSERT INTO user_rewards (user_id, content_id)
-                    VALUES (?, ?)
-                """, (user_id, content_id))
-                await db.commit()
-                return True
-            return False
\ No newline at end of file
+                return await cursor.fetchone() is not None
+        
+        return await self.write(job)
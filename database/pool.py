@@ -0,0 +1,104 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import aiosqlite
+
+# Connection held by the current task, so nested checkouts reuse it
+_held_connection = ContextVar('held_connection', default=None)
+
+
+async def apply_pragmas(conn, pragmas):
+    """Apply a PRAGMA profile to a connection"""
+    for name, value in pragmas.items():
+        await conn.execute(f"PRAGMA {name} = {value}")
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived aiosqlite connections"""
+
+    def __init__(self, db_path, size=5, timeout=10.0, pragmas=None):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas or {}
+        self._idle = asyncio.Queue(maxsize=size)
+        self._connections = []
+        self._closed = True
+
+        # Metrics
+        self.checkouts = 0
+        self.reused_checkouts = 0
+        self.waits = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    async def open(self):
+        """Open all pooled connections"""
+        if not self._closed:
+            return
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.db_path)
+            await apply_pragmas(conn, self.pragmas)
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+        self._closed = False
+
+    async def close(self):
+        """Close all pooled connections"""
+        self._closed = True
+        for conn in self._connections:
+            try:
+                await conn.close()
+            except Exception as e:
+                print(f"Error closing pooled connection: {e}")
+        self._connections.clear()
+        self._idle = asyncio.Queue(maxsize=self.size)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Check out a connection for the duration of the block"""
+        if self._closed:
+            raise RuntimeError("Connection pool is not open")
+
+        task = asyncio.current_task()
+        held = _held_connection.get()
+        if held and held[1] is task:
+            self.reused_checkouts += 1
+            yield held[0]
+            return
+
+        started = time.monotonic()
+        if self._idle.empty():
+            self.waits += 1
+        conn = await asyncio.wait_for(self._idle.get(), self.timeout)
+        waited = time.monotonic() - started
+        self.total_wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+        self.checkouts += 1
+
+        token = _held_connection.set((conn, task))
+        try:
+            yield conn
+        finally:
+            _held_connection.reset(token)
+            if conn.in_transaction:
+                await conn.rollback()
+            if self._closed:
+                await conn.close()
+            else:
+                self._idle.put_nowait(conn)
+
+    def stats(self):
+        """Get pool usage metrics"""
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'in_use': self.size - self._idle.qsize() if not self._closed else 0,
+            'checkouts': self.checkouts,
+            'reused_checkouts': self.reused_checkouts,
+            'waits': self.waits,
+            'avg_wait_ms': round(self.total_wait_time / self.checkouts * 1000, 3) if self.checkouts else 0,
+            'max_wait_ms': round(self.max_wait_time * 1000, 3)
+        }
@@ -0,0 +1,141 @@
+from database.segments import compile_segment
+
+# SQL of the hot read paths. The data-access code runs these and
+# HOT_QUERIES (see database.migrations) checks their plans at startup,
+# so the check always sees the queries that are actually executed.
+
+# ProfileRow columns of users LEFT JOIN user_profiles, with the defaults of an empty profile
+PROFILE_COLUMNS = (
+    "users.user_id, COALESCE(best_time, 12), COALESCE(engagement_score, 0), COALESCE(interests, '')"
+)
+
+# Format with the selected ReferralRow columns
+REFERRALS_BY_REFERRER = """
+    SELECT {columns} FROM referrals
+    WHERE referrer_id = ?
+    ORDER BY date DESC
+    LIMIT ?
+"""
+
+# Format with the selected UserRow columns
+TOP_REFERRERS = """
+    SELECT {columns}
+    FROM users
+    WHERE total_referrals > 0
+    ORDER BY total_referrals DESC, points DESC
+    LIMIT ?
+"""
+
+POPULAR_ACTIONS = """
+    SELECT event_type, COUNT(*) as count
+    FROM analytics
+    WHERE timestamp >= datetime('now', '-7 days')
+    GROUP BY event_type
+    ORDER BY count DESC
+    LIMIT ?
+"""
+
+# Format with extra conditions on analytics; see UserProfileBuilder
+PROFILE_EVENTS = """
+    SELECT user_id, event_type, COUNT(*), AVG(strftime('%H', timestamp))
+    FROM analytics
+    WHERE timestamp >= datetime('now', ?) {where}
+    GROUP BY user_id, event_type
+    ORDER BY user_id
+"""
+# Restricts PROFILE_EVENTS to users with events in an analytics id range
+PROFILE_REFRESH_CONDITION = "AND user_id IN (SELECT user_id FROM analytics WHERE id > ? AND id <= ?)"
+
+CAMPAIGN_STATS = """
+    SELECT stats.campaign_id, campaigns.name,
+           SUM(sent), SUM(delivered), SUM(failed), SUM(unreachable), SUM(opened), SUM(clicked)
+    FROM campaign_stats_hourly AS stats
+    LEFT JOIN campaigns ON campaigns.id = stats.campaign_id
+    WHERE hour >= ? AND hour < ?
+    GROUP BY stats.campaign_id
+"""
+
+AB_TEST_GROUP_DELIVERIES = """
+    SELECT
+        COUNT(*) as total_sent,
+        SUM(CASE WHEN status = ? THEN 1 ELSE 0 END) as delivered,
+        0 as opened,
+        NULL as avg_engagement_time
+    FROM delivery_log
+    WHERE job_type = ? AND job_id = ? AND variant = ?
+"""
+
+CLICKS_BY_VARIANT = """
+    SELECT SUM(clicks) FROM click_stats_hourly
+    WHERE job_type = ? AND job_id = ? AND variant = ?
+"""
+
+CLICKED_BEFORE = """
+    SELECT 1 FROM click_users
+    WHERE job_type = ? AND job_id = ? AND variant = ? AND button = ? AND user_id = ?
+"""
+
+WHEEL_SLOT_PAGE = """
+    SELECT user_id, message FROM campaign_deliveries
+    WHERE slot = ? AND campaign_id = ? AND user_id > ? AND created_at <= ?
+    ORDER BY user_id
+    LIMIT ?
+"""
+
+SCHEDULED_CAMPAIGNS = "SELECT id, scheduled_time FROM campaigns WHERE status = 'scheduled'"
+
+CAMPAIGN_HELD_DELIVERIES = "SELECT 1 FROM campaign_deliveries WHERE campaign_id = ? LIMIT 1"
+
+# Campaigns whose held deliveries have all left the delivery wheel
+FINISH_SENT_CAMPAIGNS = """
+    UPDATE campaigns SET status = 'done', finished_at = CURRENT_TIMESTAMP
+    WHERE status = 'sending'
+    AND NOT EXISTS (SELECT 1 FROM campaign_deliveries WHERE campaign_id = campaigns.id)
+"""
+
+# Shards of paused broadcasts are left for later so they do not hold up newer jobs
+CLAIM_BROADCAST_SHARD = """
+    UPDATE broadcast_shards
+    SET status = 'running', worker_pid = ?, heartbeat_at = CURRENT_TIMESTAMP
+    WHERE rowid = (
+        SELECT broadcast_shards.rowid FROM broadcast_shards
+        JOIN broadcasts ON broadcasts.id = broadcast_shards.broadcast_id
+        WHERE shard = ? AND shard_count = ? AND broadcast_shards.status IN ('pending', 'running')
+          AND broadcasts.status != 'paused'
+        ORDER BY broadcast_id LIMIT 1
+    )
+    RETURNING broadcast_id
+"""
+
+
+def profiles_query(count):
+    """Profiles of `count` users looked up by primary key"""
+    return f"""
+        SELECT {PROFILE_COLUMNS} FROM users
+        LEFT JOIN user_profiles ON user_profiles.user_id = users.user_id
+        WHERE users.user_id IN ({', '.join('?' * count)})
+        ORDER BY users.user_id
+    """
+
+
+def segment_count_query(segment):
+    """Count the members of a segment; returns (query, params)"""
+    where, params = compile_segment(segment)
+    return f"SELECT COUNT(*) FROM users WHERE {where}", params
+
+
+def user_page_query(segment, shard=None):
+    """Page through a segment by user_id; returns (query, params) to extend with (last_id, limit)
+
+    With `shard=(index, count)` only user_id % count == index is selected.
+    """
+    where, params = compile_segment(segment)
+    if shard:
+        where += " AND user_id % ? = ?"
+        params += (shard[1], shard[0])
+    return f"""
+        SELECT user_id FROM users
+        WHERE {where} AND user_id > ?
+        ORDER BY user_id
+        LIMIT ?
+    """, params
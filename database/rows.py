@@ -0,0 +1,118 @@
+from collections import namedtuple
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+
+class UserRow(NamedTuple):
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    referrer_id: Optional[int]
+    join_date: str
+    is_member: bool
+    total_referrals: int
+    points: int
+    is_banned: bool
+    last_activity: str
+
+
+class ReferralRow(NamedTuple):
+    id: int
+    referrer_id: int
+    referred_id: int
+    date: str
+    reward_given: bool
+
+
+class ContentRow(NamedTuple):
+    id: int
+    title: str
+    description: str
+    file_id: str
+    file_type: str
+    required_referrals: int
+    required_points: int
+    created_at: str
+    is_active: bool
+
+
+class ProfileRow(NamedTuple):
+    user_id: int
+    best_time: int
+    engagement_score: int
+    interests: str
+
+
+@lru_cache(maxsize=None)
+def partial_row_type(row_type, fields=None):
+    """Get the row type for a subset of a table's columns
+
+    Returns `row_type` itself for the full column list, otherwise a cached
+    namedtuple with only the requested fields (in the requested order).
+    """
+    if fields is None or tuple(fields) == row_type._fields:
+        return row_type
+    unknown = [field for field in fields if field not in row_type._fields]
+    if unknown:
+        raise ValueError(f"Unknown {row_type.__name__} fields: {', '.join(unknown)}")
+    return namedtuple(row_type.__name__, fields)
+
+
+def select_columns(row_type, fields=None):
+    """Get the row type and the explicit column list to SELECT for it"""
+    row_type = partial_row_type(row_type, tuple(fields) if fields else None)
+    return row_type, ', '.join(row_type._fields)
+
+
+def row_factory(row_type):
+    """Build a cursor row factory producing `row_type` instances"""
+    make = row_type._make
+    return lambda cursor, row: make(row)
+
+
+def _benchmark(users=50000, leaderboard=1000):
+    """Compare per-row allocations of the old and new row shapes"""
+    import sqlite3
+    import tracemalloc
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE users ({', '.join(UserRow._fields)})")
+    conn.executemany(
+        f"INSERT INTO users VALUES ({', '.join('?' for _ in UserRow._fields)})",
+        (
+            (i, f'user{i}', f'First {i}', f'Last {i}', None, '2024-01-01 00:00:00',
+             1, i % 50, i % 500, 0, '2024-01-01 00:00:00')
+            for i in range(users)
+        )
+    )
+
+    def measure(query, factory=None, transform=None):
+        conn.row_factory = factory
+        tracemalloc.start()
+        rows = conn.execute(query).fetchall()
+        if transform:
+            rows = transform(rows)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        count = len(rows)
+        del rows
+        return size / count if count else 0
+
+    leader_type, leader_columns = select_columns(UserRow, ('user_id', 'first_name', 'total_referrals', 'points'))
+    cases = [
+        ('leaderboard SELECT * tuple', measure(f"SELECT * FROM users LIMIT {leaderboard}")),
+        ('leaderboard UserRow fields', measure(
+            f"SELECT {leader_columns} FROM users LIMIT {leaderboard}", row_factory(leader_type)
+        )),
+        ('broadcast 1-tuples', measure("SELECT user_id FROM users")),
+        ('broadcast int ids', measure(
+            "SELECT user_id FROM users", transform=lambda rows: [row[0] for row in rows]
+        )),
+    ]
+    for name, per_row in cases:
+        print(f"{name:<30} {per_row:8.1f} bytes/row")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,116 @@
+import json
+
+# Every segment skips banned users and users who blocked the bot
+BASE_CONDITION = "users.is_banned = FALSE AND users.is_reachable = TRUE"
+
+# Named audiences; a segment is either one of these names or a definition dict
+SEGMENTS = {
+    'all': {},
+    'members': {'is_member': True},
+    'active': {'active_within_days': 7},
+    'new': {'joined_within_days': 7},
+    'inactive': {'inactive_for_days': 30},
+    'top': {'min_referrals': 5},
+}
+
+# Predicate name -> (SQL condition, converter from the definition value to its parameters)
+PREDICATES = {
+    'active_within_days': ("users.last_activity >= datetime('now', ?)", lambda days: (f'-{int(days)} days',)),
+    'inactive_for_days': ("users.last_activity < datetime('now', ?)", lambda days: (f'-{int(days)} days',)),
+    'joined_within_days': ("users.join_date >= datetime('now', ?)", lambda days: (f'-{int(days)} days',)),
+    'joined_before_days': ("users.join_date < datetime('now', ?)", lambda days: (f'-{int(days)} days',)),
+    'min_referrals': ("users.total_referrals >= ?", lambda count: (int(count),)),
+    'max_referrals': ("users.total_referrals <= ?", lambda count: (int(count),)),
+    'min_points': ("users.points >= ?", lambda points: (int(points),)),
+    'max_points': ("users.points <= ?", lambda points: (int(points),)),
+    'is_member': ("users.is_member = ?", lambda member: (bool(member),)),
+    'min_engagement': (
+        "users.user_id IN (SELECT user_id FROM user_profiles WHERE engagement_score >= ?)",
+        lambda score: (int(score),)
+    ),
+}
+
+# Predicates on last_activity, which ActivityTracker writes in batches
+ACTIVITY_PREDICATES = ('active_within_days', 'inactive_for_days')
+
+# Columns a segment may be ranked by with 'order_by' (descending) and 'limit'
+ORDER_COLUMNS = ('total_referrals', 'points', 'join_date', 'last_activity')
+
+
+def get_segment(segment):
+    """Get the definition dict of a segment name or definition"""
+    if isinstance(segment, dict):
+        return segment
+    if segment not in SEGMENTS:
+        raise ValueError(f"Unknown segment: {segment}")
+    return SEGMENTS[segment]
+
+
+def segment_key(segment):
+    """Canonical cache key of a segment"""
+    return json.dumps(get_segment(segment), sort_keys=True)
+
+
+def uses_activity(segment):
+    """Whether a segment filters on last_activity"""
+    return any(name in get_segment(segment) for name in ACTIVITY_PREDICATES)
+
+
+def compile_segment(segment):
+    """Compile a segment to a WHERE clause on `users` and its parameters
+
+    Besides the PREDICATES, a definition may have:
+      'interests': profile interests the user must all have
+      'events': [{'type': ..., 'within_days': 30, 'min_count': 1}, ...]
+    """
+    definition = get_segment(segment)
+    conditions = [BASE_CONDITION]
+    params = []
+
+    for name, value in definition.items():
+        if name in PREDICATES:
+            condition, convert = PREDICATES[name]
+            conditions.append(condition)
+            params.extend(convert(value))
+        elif name == 'interests':
+            for interest in value:
+                conditions.append(
+                    "users.user_id IN (SELECT user_id FROM user_profiles WHERE ',' || interests || ',' LIKE ?)"
+                )
+                params.append(f'%,{interest},%')
+        elif name == 'events':
+            for event in value:
+                conditions.append("""users.user_id IN (
+                    SELECT user_id FROM analytics
+                    WHERE timestamp >= datetime('now', ?) AND event_type = ?
+                    GROUP BY user_id HAVING COUNT(*) >= ?
+                )""")
+                params.extend((f"-{int(event.get('within_days', 30))} days", event['type'],
+                               int(event.get('min_count', 1))))
+        elif name not in ('order_by', 'limit'):
+            raise ValueError(f"Unknown segment predicate: {name}")
+
+    return ' AND '.join(conditions), tuple(params)
+
+
+def compile_segment_query(segment):
+    """Compile a segment to a query selecting its user IDs in ascending order"""
+    definition = get_segment(segment)
+    where, params = compile_segment(definition)
+    query = f"SELECT users.user_id FROM users WHERE {where}"
+
+    order_by = definition.get('order_by')
+    if order_by:
+        if order_by not in ORDER_COLUMNS:
+            raise ValueError(f"Unknown segment order column: {order_by}")
+        query += f" ORDER BY users.{order_by} DESC"
+    else:
+        query += " ORDER BY users.user_id"
+    if definition.get('limit'):
+        query += " LIMIT ?"
+        params += (int(definition['limit']),)
+
+    # A ranked segment is still returned in user_id order
+    if order_by:
+        query = f"SELECT user_id FROM ({query}) ORDER BY user_id"
+    return query, params
@@ -0,0 +1,114 @@
+import asyncio
+
+import aiosqlite
+
+from database.pool import apply_pragmas
+
+
+class SQLiteWriter:
+    """Single writer task that owns the only write connection
+
+    Write jobs are async callables taking the connection. Jobs queued while
+    a transaction is running are grouped into the next one, each inside its
+    own savepoint so a failing job does not roll back its neighbours. Jobs
+    must not commit themselves.
+    """
+
+    def __init__(self, db_path, pragmas=None, max_batch=256):
+        self.db_path = db_path
+        self.pragmas = pragmas or {}
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+        self._conn = None
+        self._task = None
+
+        # Metrics
+        self.jobs = 0
+        self.transactions = 0
+        self.failed_jobs = 0
+
+    async def start(self):
+        """Open the write connection and start the writer task"""
+        if self._task:
+            return
+        self._conn = await aiosqlite.connect(self.db_path)
+        await apply_pragmas(self._conn, self.pragmas)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Drain queued jobs, then close the write connection"""
+        if not self._task:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        await self._conn.close()
+        self._conn = None
+
+    def submit(self, job):
+        """Queue a write job and return a future for its result"""
+        if not self._task:
+            raise RuntimeError("Database writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((job, future))
+        return future
+
+    async def _run(self):
+        """Execute queued jobs in grouped transactions"""
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._execute_batch(batch)
+
+    async def _execute_batch(self, batch):
+        """Run one transaction for a batch of jobs"""
+        conn = self._conn
+        results = []
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+            for job, future in batch:
+                await conn.execute("SAVEPOINT write_job")
+                try:
+                    result = await job(conn)
+                    await conn.execute("RELEASE write_job")
+                    results.append((future, result, None))
+                except Exception as e:
+                    await conn.execute("ROLLBACK TO write_job")
+                    await conn.execute("RELEASE write_job")
+                    results.append((future, None, e))
+            await conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                await conn.rollback()
+            results = [(future, None, e) for _, future in batch]
+
+        self.transactions += 1
+        for future, result, error in results:
+            self.jobs += 1
+            if future.cancelled():
+                continue
+            if error is not None:
+                self.failed_jobs += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """Get writer queue metrics"""
+        return {
+            'queued': self._queue.qsize(),
+            'jobs': self.jobs,
+            'transactions': self.transactions,
+            'failed_jobs': self.failed_jobs
+        }
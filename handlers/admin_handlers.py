@@ -1,9 +1,11 @@
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime, timedelta
-import asyncio
 from utils.helpers import BotHelpers
 from utils.analytics import Analytics
+from utils.broadcast_engine import BroadcastEngine
+from utils.broadcast_jobs import BroadcastJobManager
+from utils.progress import ProgressReporter
 
 class AdminHandlers:
     def __init__(self, bot, db, admin_id):
@@ -13,6 +15,14 @@ class AdminHandlers:
         self.helpers = BotHelpers()
         self.analytics = Analytics(db)
         self.broadcast_state = {}
+        self.broadcast_engine = BroadcastEngine(on_unreachable=db.mark_user_unreachable)
+        self.broadcast_jobs = BroadcastJobManager(
+            bot, db, self.broadcast_engine,
+            on_finished=self.on_broadcast_finished,
+            on_progress=self.on_broadcast_progress
+        )
+        self.progress_reporters = {}
+        self.scheduler = None  # BotScheduler, set once it is created
     
     def is_admin(self, user_id):
         """Check if user is admin"""
@@ -233,6 +243,10 @@ class AdminHandlers:
         if not self.is_admin(user_id) or user_id not in self.broadcast_state:
             return
         
+        if self.broadcast_state[user_id]['step'] == 'waiting_schedule_time':
+            await self.handle_schedule_time(message)
+            return
+        
         if self.broadcast_state[user_id]['step'] != 'waiting_message':
             return
         
@@ -273,58 +287,165 @@ class AdminHandlers:
         
         broadcast_data = self.broadcast_state[user_id]
         
-        # Get all users
-        users = await self.db.get_all_users()
-        total_users = len(users)
+        # Count users; recipients are streamed page by page by the job
+        total_users = await self.db.count_users()
+        
+        # Store the broadcast as a resumable job before sending anything
+        job_id = await self.broadcast_jobs.create_job(
+            broadcast_data,
+            created_by=user_id,
+            admin_chat_id=callback.message.chat.id,
+            status_message_id=callback.message.message_id
+        )
+        
+        # Clean up state
+        del self.broadcast_state[user_id]
         
         # Update message to show progress
         await callback.message.edit_text(
             f"📤 در حال ارسال پیام به {self.helpers.format_number(total_users)} کاربر...\n\n"
-            "⏳ لطفاً صبر کنید..."
+            "⏳ لطفاً صبر کنید...",
+            reply_markup=self._broadcast_controls_keyboard(job_id)
         )
         
-        # Send messages
-        sent_count = 0
-        failed_count = 0
-        
-        for user_data in users:
-            try:
-                user_id_target = user_data[0]
-                
-                if broadcast_data['message_type'] == 'text':
-                    await self.bot.send_message(
-                        user_id_target,
-                        broadcast_data['message_text'],
-                        parse_mode='Markdown'
-                    )
-                else:
-                    # Handle media messages
-                    await self._send_media_message(
-                        user_id_target,
-                        broadcast_data
-                    )
-                
-                sent_count += 1
-                
-                # Small delay to avoid rate limiting
-                await asyncio.sleep(0.05)
-                
-            except Exception as e:
-                failed_count += 1
-                continue
-        
-                # Clean up state
-        del self.broadcast_state[user_id]
+        self.broadcast_jobs.start(job_id)
+    
+    async def start_schedule_broadcast(self, callback: types.CallbackQuery):
+        """Ask the admin when to send the broadcast"""
+        if not self.is_admin(callback.from_user.id):
+            return
+        
+        user_id = callback.from_user.id
+        if user_id not in self.broadcast_state or not self.scheduler:
+            await callback.answer("خطا در زمان‌بندی پیام!", show_alert=True)
+            return
+        
+        self.broadcast_state[user_id]['step'] = 'waiting_schedule_time'
+        
+        keyboard = InlineKeyboardMarkup()
+        cancel_btn = InlineKeyboardButton("❌ لغو", callback_data="admin_broadcast")
+        keyboard.add(cancel_btn)
+        
+        await callback.message.edit_text(
+            "⏰ زمان‌بندی پیام همگانی\n\n"
+            "زمان ارسال را با فرمت زیر وارد کنید:\n"
+            f"`{(datetime.now() + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M')}`",
+            reply_markup=keyboard,
+            parse_mode='Markdown'
+        )
+    
+    async def handle_schedule_time(self, message: types.Message):
+        """Store the broadcast as a scheduled job at the time the admin sent"""
+        user_id = message.from_user.id
+        
+        try:
+            send_time = datetime.strptime((message.text or '').strip(), '%Y-%m-%d %H:%M')
+        except ValueError:
+            await message.answer("❌ فرمت زمان نامعتبر است! مثال: 2024-01-31 18:30")
+            return
+        
+        if send_time <= datetime.now():
+            await message.answer("❌ زمان ارسال باید در آینده باشد!")
+            return
+        
+        broadcast_data = self.broadcast_state.pop(user_id)
+        status_message = await message.answer("⏳ در حال زمان‌بندی...")
+        
+        job_id = await self.broadcast_jobs.create_job(
+            broadcast_data,
+            created_by=user_id,
+            admin_chat_id=status_message.chat.id,
+            status_message_id=status_message.message_id,
+            scheduled_time=send_time
+        )
+        self.scheduler.schedule_broadcast(job_id, send_time)
+        
+        keyboard = InlineKeyboardMarkup()
+        cancel_btn = InlineKeyboardButton("⛔️ لغو ارسال", callback_data=f"broadcast_cancel_{job_id}")
+        keyboard.add(cancel_btn)
+        
+        await status_message.edit_text(
+            f"✅ پیام همگانی برای {send_time.strftime('%Y/%m/%d - %H:%M')} زمان‌بندی شد.",
+            reply_markup=keyboard
+        )
+    
+    def _broadcast_controls_keyboard(self, job_id, paused=False):
+        """Pause/resume and cancel buttons for a running broadcast"""
+        keyboard = InlineKeyboardMarkup(row_width=2)
+        if paused:
+            toggle_btn = InlineKeyboardButton("▶️ ادامه", callback_data=f"broadcast_resume_{job_id}")
+        else:
+            toggle_btn = InlineKeyboardButton("⏸ توقف موقت", callback_data=f"broadcast_pause_{job_id}")
+        cancel_btn = InlineKeyboardButton("⛔️ لغو ارسال", callback_data=f"broadcast_cancel_{job_id}")
+        keyboard.add(toggle_btn, cancel_btn)
+        return keyboard
+    
+    async def handle_broadcast_control(self, callback: types.CallbackQuery):
+        """Pause, resume or cancel a broadcast job"""
+        action, job_id = callback.data.split('_')[1:3]
+        job_id = int(job_id)
+        
+        if action == 'pause':
+            done = await self.broadcast_jobs.pause(job_id)
+            status_text = "⏸ ارسال پیام همگانی متوقف شد."
+        elif action == 'resume':
+            done = await self.broadcast_jobs.resume(job_id)
+            status_text = "▶️ ارسال پیام همگانی ادامه یافت..."
+        else:
+            done = await self.broadcast_jobs.cancel(job_id)
+            status_text = "⛔️ ارسال پیام همگانی در حال لغو است..."
+        
+        if not done:
+            await callback.answer("این ارسال دیگر فعال نیست!", show_alert=True)
+            return
+        
+        keyboard = None if action == 'cancel' else self._broadcast_controls_keyboard(job_id, action == 'pause')
+        await callback.message.edit_text(status_text, reply_markup=keyboard)
+    
+    async def on_broadcast_progress(self, job, result):
+        """Show a running broadcast's progress in the admin's status message"""
+        if not job['admin_chat_id']:
+            return
+        
+        job_id = job['id']
+        reporter = self.progress_reporters.get(job_id)
+        if reporter is None:
+            reporter = ProgressReporter(
+                self.bot, job['admin_chat_id'], job['status_message_id'],
+                "ارسال پیام همگانی", job['total_users'] or 0
+            )
+            self.progress_reporters[job_id] = reporter
+        
+        paused = self.broadcast_jobs.is_paused(job_id)
+        await reporter.update(
+            result,
+            status="⏸ متوقف شده" if paused else None,
+            reply_markup=self._broadcast_controls_keyboard(job_id, paused)
+        )
+    
+    async def on_broadcast_finished(self, job_id, result):
+        """Report a finished broadcast job to the admin"""
+        self.progress_reporters.pop(job_id, None)
+        job = await self.broadcast_jobs.get_job(job_id)
+        if not job or not job['admin_chat_id']:
+            return
+        
+        total_users = job['total_users'] or 0
+        sent_count = result.sent
+        failed_count = result.failed
+        title = "⛔️ ارسال پیام همگانی لغو شد!" if result.cancelled else "✅ ارسال پیام همگانی تکمیل شد!"
         
         # Show results
         result_text = f"""
-✅ ارسال پیام همگانی تکمیل شد!
+{title}
 
 📊 نتایج:
 • کل کاربران: {self.helpers.format_number(total_users)}
 • ارسال موفق: {self.helpers.format_number(sent_count)}
 • ارسال ناموفق: {self.helpers.format_number(failed_count)}
-• نرخ موفقیت: {round((sent_count/total_users)*100, 1)}%
+• ربات را مسدود کرده‌اند: {self.helpers.format_number(result.unreachable)}
+• نرخ موفقیت: {round((sent_count/total_users)*100, 1) if total_users else 0}%
+• سرعت ارسال: {round(result.rate, 1)} پیام در ثانیه
 
 ⏰ زمان ارسال: {datetime.now().strftime('%Y/%m/%d - %H:%M')}
         """
@@ -333,13 +454,23 @@ class AdminHandlers:
         back_btn = InlineKeyboardButton("🔙 بازگشت", callback_data="admin_broadcast")
         keyboard.add(back_btn)
         
-        await callback.message.edit_text(result_text, reply_markup=keyboard)
+        await self.bot.edit_message_text(
+            result_text,
+            chat_id=job['admin_chat_id'],
+            message_id=job['status_message_id'],
+            reply_markup=keyboard
+        )
         
         # Log the broadcast
-        await self.db.log_analytics('broadcast_sent', callback.from_user.id, {
+        await self.db.log_analytics('broadcast_sent', job['created_by'], {
+            'job_id': job_id,
             'total_users': total_users,
             'sent_count': sent_count,
-            'failed_count': failed_count
+            'failed_count': failed_count,
+            'cancelled': result.cancelled,
+            'unreachable': result.unreachable,
+            'flood_waits': result.flood_waits,
+            'send_rate': round(result.rate, 2)
         })
     
     def _get_file_id(self, message):
@@ -358,25 +489,6 @@ class AdminHandlers:
             return message.animation.file_id
         return None
     
-    async def _send_media_message(self, user_id, broadcast_data):
-        """Send media message to user"""
-        file_id = broadcast_data['file_id']
-        caption = broadcast_data['message_text']
-        message_type = broadcast_data['message_type']
-        
-        if message_type == 'photo':
-            await self.bot.send_photo(user_id, file_id, caption=caption, parse_mode='Markdown')
-        elif message_type == 'video':
-            await self.bot.send_video(user_id, file_id, caption=caption, parse_mode='Markdown')
-        elif message_type == 'document':
-            await self.bot.send_document(user_id, file_id, caption=caption, parse_mode='Markdown')
-        elif message_type == 'audio':
-            await self.bot.send_audio(user_id, file_id, caption=caption, parse_mode='Markdown')
-        elif message_type == 'voice':
-            await self.bot.send_voice(user_id, file_id, caption=caption, parse_mode='Markdown')
-        elif message_type == 'animation':
-            await self.bot.send_animation(user_id, file_id, caption=caption, parse_mode='Markdown')
-    
     async def show_content_management(self, callback: types.CallbackQuery):
         """Show exclusive content management"""
         if not self.is_admin(callback.from_user.id):
@@ -428,6 +540,10 @@ class AdminHandlers:
             await self.start_new_broadcast(callback)
         elif callback.data == "admin_send_broadcast":
             await self.send_broadcast(callback)
+        elif callback.data == "admin_schedule_broadcast":
+            await self.start_schedule_broadcast(callback)
+        elif callback.data.startswith("broadcast_"):
+            await self.handle_broadcast_control(callback)
         elif callback.data == "admin_content":
             await self.show_content_management(callback)
         
@@ -481,4 +597,31 @@ class AdminHandlers:
 ⏰ {datetime.now().strftime('%Y/%m/%d - %H:%M')}
         """
         
-        await message.answer(quick_stats)
\ No newline at end of file
+        await message.answer(quick_stats)
+    
+    async def ban_user(self, message: types.Message, user_id):
+        """Ban a user by ID"""
+        await self._set_user_banned(message, user_id, True)
+    
+    async def unban_user(self, message: types.Message, user_id):
+        """Unban a user by ID"""
+        await self._set_user_banned(message, user_id, False)
+    
+    async def _set_user_banned(self, message: types.Message, user_id, is_banned):
+        """Update a user's ban status and report the result"""
+        if not self.helpers.is_valid_user_id(user_id):
+            await message.answer("❌ شناسه کاربر نامعتبر است!")
+            return
+        
+        if not await self.db.set_user_banned(int(user_id), is_banned):
+            await message.answer("❌ کاربر یافت نشد!")
+            return
+        
+        if is_banned:
+            await message.answer(f"🚫 کاربر {user_id} مسدود شد.")
+        else:
+            await message.answer(f"✅ کاربر {user_id} رفع مسدودی شد.")
+        
+        await self.db.log_analytics('user_banned' if is_banned else 'user_unbanned', message.from_user.id, {
+            'target_user': int(user_id)
+        })
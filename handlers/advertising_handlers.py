@@ -1,24 +1,50 @@
-import asyncio
 import random
 from datetime import datetime, timedelta
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from config import ADMIN_ID
 from utils.helpers import BotHelpers
+from utils.broadcast_engine import BroadcastEngine, delivery_status
+from utils.campaign_manager import optimization_suggestions
+from utils.click_tracking import tracked_keyboard
+from utils.delivery_wheel import DeliveryWheel
+from utils.user_profiles import profile_from_row
+from database.buffers import DeliveryLog
+from database.bitmap import UserSet
+from database.segments import SEGMENTS
 import aiohttp
 import json
 
 class AdvertisingHandlers:
+    # Target types that differ from the segment of the same name
+    TARGET_SEGMENTS = {
+        'top': {'min_referrals': 5, 'order_by': 'total_referrals', 'limit': 100},
+    }
+    
+    CAMPAIGN_TYPES = {
+        'broadcast': 'پیام همگانی',
+        'referral': 'تشویق ارجاع',
+        'engagement': 'افزایش تعامل',
+        'retention': 'بازگشت کاربران'
+    }
+    
     def __init__(self, bot, db):
         self.bot = bot
         self.db = db
         self.helpers = BotHelpers()
         self.campaign_state = {}
         self.partner_channels = []  # List of partner channels
+        self.broadcast_engine = BroadcastEngine(on_unreachable=db.mark_user_unreachable, priority='campaign')
+        self.delivery_wheel = DeliveryWheel(db, self.broadcast_engine, self.send_campaign_message)
+        self.campaign_manager = None  # CampaignManager, set once it is created
         
     # ==================== CAMPAIGN MANAGEMENT ====================
     
     async def show_advertising_panel(self, callback: types.CallbackQuery):
         """Show main advertising panel"""
+        # Leaving to the panel abandons the campaign wizard
+        self.campaign_state.pop(callback.from_user.id, None)
+        
         keyboard = InlineKeyboardMarkup(row_width=2)
         
         # Campaign management
@@ -65,6 +91,9 @@ class AdvertisingHandlers:
     async def create_campaign_wizard(self, callback: types.CallbackQuery):
         """Start campaign creation wizard"""
         user_id = callback.from_user.id
+        if user_id != ADMIN_ID:
+            return
+        
         self.campaign_state[user_id] = {
             'step': 'campaign_type',
             'data': {}
@@ -97,18 +126,18 @@ class AdvertisingHandlers:
         if user_id not in self.campaign_state:
             return
         
-        self.campaign_state[user_id]['data']['type'] = campaign_type
+        self.campaign_state[user_id]['data']['campaign_type'] = campaign_type
         self.campaign_state[user_id]['step'] = 'target_audience'
         
         keyboard = InlineKeyboardMarkup(row_width=2)
         
         # Target audience options
-        all_users_btn = InlineKeyboardButton("👥 همه کاربران", callback_data="target_all")
-        active_users_btn = InlineKeyboardButton("⚡ کاربران فعال", callback_data="target_active")
-        new_users_btn = InlineKeyboardButton("🆕 کاربران جدید", callback_data="target_new")
-        top_referrers_btn = InlineKeyboardButton("🏆 برترین ارجاع‌دهندگان", callback_data="target_top")
-        inactive_users_btn = InlineKeyboardButton("😴 کاربران غیرفعال", callback_data="target_inactive")
-        custom_btn = InlineKeyboardButton("🎯 سفارشی", callback_data="target_custom")
+        all_users_btn = InlineKeyboardButton("👥 همه کاربران", callback_data="campaign_target_all")
+        active_users_btn = InlineKeyboardButton("⚡ کاربران فعال", callback_data="campaign_target_active")
+        new_users_btn = InlineKeyboardButton("🆕 کاربران جدید", callback_data="campaign_target_new")
+        top_referrers_btn = InlineKeyboardButton("🏆 برترین ارجاع‌دهندگان", callback_data="campaign_target_top")
+        inactive_users_btn = InlineKeyboardButton("😴 کاربران غیرفعال", callback_data="campaign_target_inactive")
+        custom_btn = InlineKeyboardButton("🎯 سفارشی", callback_data="campaign_target_custom")
         
         back_btn = InlineKeyboardButton("🔙 قبلی", callback_data="ad_create_campaign")
         
@@ -117,19 +146,163 @@ class AdvertisingHandlers:
         keyboard.add(inactive_users_btn, custom_btn)
         keyboard.add(back_btn)
         
-        campaign_types = {
-            'broadcast': 'پیام همگانی',
-            'referral': 'تشویق ارجاع',
-            'engagement': 'افزایش تعامل',
-            'retention': 'بازگشت کاربران'
-        }
-        
         await callback.message.edit_text(
-            f"🎯 کمپین: {campaign_types.get(campaign_type, campaign_type)}\n\n"
+            f"🎯 کمپین: {self.CAMPAIGN_TYPES.get(campaign_type, campaign_type)}\n\n"
             "مخاطب هدف را انتخاب کنید:",
             reply_markup=keyboard
         )
     
+    async def handle_campaign_target(self, callback: types.CallbackQuery):
+        """Handle target audience selection and ask for the campaign message"""
+        user_id = callback.from_user.id
+        if user_id not in self.campaign_state:
+            return
+        
+        self.campaign_state[user_id]['data']['target_type'] = callback.data.split('_', 2)[2]
+        self.campaign_state[user_id]['step'] = 'waiting_message'
+        
+        keyboard = InlineKeyboardMarkup()
+        cancel_btn = InlineKeyboardButton("❌ لغو", callback_data="ad_panel")
+        keyboard.add(cancel_btn)
+        
+        await callback.message.edit_text(
+            "📝 متن کمپین را ارسال کنید.\n\n"
+            "برای افزودن دکمه، در انتهای پیام هر دکمه را در یک خط بنویسید:\n"
+            "+ متن دکمه | https://example.com\n"
+            "به جای لینک می‌توانید متنی بنویسید تا با زدن دکمه نمایش داده شود.",
+            reply_markup=keyboard
+        )
+    
+    def is_waiting_for_message(self, user_id):
+        """Check if the campaign wizard expects a message from the user"""
+        state = self.campaign_state.get(user_id)
+        return bool(state) and state['step'] in ('waiting_message', 'waiting_schedule_time')
+    
+    async def handle_campaign_message(self, message: types.Message):
+        """Handle the campaign message or schedule time sent during the wizard"""
+        user_id = message.from_user.id
+        state = self.campaign_state.get(user_id)
+        if not state:
+            return
+        
+        if state['step'] == 'waiting_schedule_time':
+            await self.handle_campaign_schedule_time(message)
+            return
+        
+        if state['step'] != 'waiting_message':
+            return
+        
+        if not message.text:
+            await message.answer("❌ پیام کمپین باید متنی باشد!")
+            return
+        
+        text, buttons = parse_campaign_buttons(message.text)
+        state['data'].update({'message': text, 'buttons': buttons})
+        state['step'] = 'confirm'
+        
+        keyboard = InlineKeyboardMarkup(row_width=2)
+        run_now_btn = InlineKeyboardButton("🚀 اجرای فوری", callback_data="campaign_run_now")
+        schedule_btn = InlineKeyboardButton("⏰ زمان‌بندی", callback_data="campaign_schedule")
+        cancel_btn = InlineKeyboardButton("❌ لغو", callback_data="ad_panel")
+        keyboard.add(run_now_btn, schedule_btn)
+        keyboard.add(cancel_btn)
+        
+        await message.answer(
+            f"✅ پیام کمپین دریافت شد ({len(buttons)} دکمه).\n\n"
+            "گزینه مورد نظر را انتخاب کنید:",
+            reply_markup=keyboard
+        )
+    
+    async def save_campaign(self, user_id, status_message):
+        """Store the campaign confirmed in the wizard as a draft and return its ID (None if not ready)
+        
+        `status_message` is the admin's message that shows the campaign's progress.
+        """
+        state = self.campaign_state.get(user_id)
+        if not state or state['step'] not in ('confirm', 'waiting_schedule_time') or not self.campaign_manager:
+            return None
+        
+        data = self.campaign_state.pop(user_id)['data']
+        campaign_type = data.get('campaign_type')
+        data.update({
+            'name': f"{self.CAMPAIGN_TYPES.get(campaign_type, campaign_type)} - {datetime.now().strftime('%Y/%m/%d %H:%M')}",
+            'admin_chat_id': status_message.chat.id,
+            'status_message_id': status_message.message_id
+        })
+        return await self.campaign_manager.create_campaign(data)
+    
+    async def run_campaign_now(self, callback: types.CallbackQuery):
+        """Store the campaign and hand it to the campaign manager to run right away"""
+        campaign_id = await self.save_campaign(callback.from_user.id, callback.message)
+        if not campaign_id:
+            await callback.answer("خطا در اجرای کمپین!", show_alert=True)
+            return
+        
+        # Due now, so the manager runs it under a lease like any scheduled campaign
+        await self.campaign_manager.schedule_campaign(campaign_id, datetime.now())
+        
+        await callback.message.edit_text(f"🚀 کمپین {campaign_id} در حال اجراست.")
+    
+    async def start_schedule_campaign(self, callback: types.CallbackQuery):
+        """Ask the admin when to run the campaign"""
+        user_id = callback.from_user.id
+        if user_id not in self.campaign_state or self.campaign_state[user_id]['step'] != 'confirm':
+            await callback.answer("خطا در زمان‌بندی کمپین!", show_alert=True)
+            return
+        
+        self.campaign_state[user_id]['step'] = 'waiting_schedule_time'
+        
+        keyboard = InlineKeyboardMarkup()
+        cancel_btn = InlineKeyboardButton("❌ لغو", callback_data="ad_panel")
+        keyboard.add(cancel_btn)
+        
+        await callback.message.edit_text(
+            "⏰ زمان‌بندی کمپین\n\n"
+            "زمان اجرا را با فرمت زیر وارد کنید:\n"
+            f"`{(datetime.now() + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M')}`",
+            reply_markup=keyboard,
+            parse_mode='Markdown'
+        )
+    
+    async def handle_campaign_schedule_time(self, message: types.Message):
+        """Store the campaign and schedule it at the time the admin sent"""
+        try:
+            send_time = datetime.strptime((message.text or '').strip(), '%Y-%m-%d %H:%M')
+        except ValueError:
+            await message.answer("❌ فرمت زمان نامعتبر است! مثال: 2024-01-31 18:30")
+            return
+        
+        if send_time <= datetime.now():
+            await message.answer("❌ زمان اجرا باید در آینده باشد!")
+            return
+        
+        status_message = await message.answer("⏳ در حال زمان‌بندی...")
+        campaign_id = await self.save_campaign(message.from_user.id, status_message)
+        if not campaign_id:
+            await status_message.edit_text("❌ خطا در زمان‌بندی کمپین!")
+            return
+        await self.campaign_manager.schedule_campaign(campaign_id, send_time)
+        
+        keyboard = InlineKeyboardMarkup()
+        unschedule_btn = InlineKeyboardButton("⛔️ لغو زمان‌بندی", callback_data=f"campaign_unschedule_{campaign_id}")
+        keyboard.add(unschedule_btn)
+        
+        await status_message.edit_text(
+            f"✅ کمپین {campaign_id} برای {send_time.strftime('%Y/%m/%d - %H:%M')} زمان‌بندی شد.",
+            reply_markup=keyboard
+        )
+    
+    async def unschedule_campaign(self, callback: types.CallbackQuery):
+        """Take a scheduled campaign off the schedule (it stays stored as a draft)"""
+        if callback.from_user.id != ADMIN_ID or not self.campaign_manager:
+            return
+        
+        campaign_id = int(callback.data.rsplit('_', 1)[1])
+        if await self.campaign_manager.unschedule_campaign(campaign_id):
+            await callback.message.edit_text(f"⛔️ زمان‌بندی کمپین {campaign_id} لغو شد.")
+        else:
+            await callback.answer("این کمپین دیگر در صف زمان‌بندی نیست.", show_alert=True)
+    
     # ==================== CROSS PROMOTION SYSTEM ====================
     
     async def show_cross_promotion(self, callback: types.CallbackQuery):
@@ -263,7 +436,7 @@ class AdvertisingHandlers:
         keyboard.add(templates_btn, settings_btn)
         keyboard.add(back_btn)
         
-                ab_text = """
+        ab_text = """
 🔬 سیستم A/B تست
 
 🧪 تست‌های قابل انجام:
@@ -385,142 +558,131 @@ class AdvertisingHandlers:
     
     # ==================== HELPER METHODS ====================
     
-    async def get_campaign_statistics(self):
-        """Get comprehensive campaign statistics"""
-        # This would fetch real data from database
-        # For now, returning sample data
-        return {
-            'total_campaigns': 15,
-            'total_messages': 45000,
-            'delivery_rate': 98.5,
-            'open_rate': 65.2,
-            'click_rate': 12.8,
-            'best_campaign': 'کمپین بهاری',
-            'best_engagement': 78.5,
-            'weak_campaigns': 3,
-            'improvement_suggestions': 8
-        }
-    
-    async def analyze_user_behavior(self, user_id):
-        """Analyze individual user behavior for targeting"""
-        async with self.db.get_connection() as db:
-            # Get user activity patterns
-            async with db.execute("""
-                SELECT event_type, COUNT(*) as count, 
-                       AVG(strftime('%H', timestamp)) as avg_hour
-                FROM analytics 
-                WHERE user_id = ? 
-                AND timestamp >= datetime('now', '-30 days')
-                GROUP BY event_type
-            """, (user_id,)) as cursor:
-                behavior_data = await cursor.fetchall()
-            
-            return {
-                'activity_patterns': behavior_data,
-                'best_time': self.calculate_best_time(behavior_data),
-                'engagement_score': self.calculate_engagement_score(behavior_data),
-                'interests': self.extract_interests(behavior_data)
-            }
-    
-    def calculate_best_time(self, behavior_data):
-        """Calculate best time to send messages to user"""
-        if not behavior_data:
-            return 12  # Default noon
-        
-        # Calculate weighted average of activity hours
-        total_weight = sum(data[1] for data in behavior_data)
-        if total_weight == 0:
-            return 12
-        
-        weighted_hour = sum(data[2] * data[1] for data in behavior_data if data[2]) / total_weight
-        return int(weighted_hour) if weighted_hour else 12
-    
-    def calculate_engagement_score(self, behavior_data):
-        """Calculate user engagement score (0-100)"""
-        if not behavior_data:
-            return 0
-        
-        # Weight different activities
-        activity_weights = {
-            'button_click': 3,
-            'referral_share': 5,
-            'content_view': 2,
-            'menu_navigation': 1
-        }
+    async def get_campaign_statistics(self, days=30):
+        """Get campaign statistics for the last `days` days from the hourly rollup"""
+        stats = await self.db.get_campaign_stats(datetime.now() - timedelta(days=days))
         
-        total_score = 0
-        for event_type, count, _ in behavior_data:
-            weight = activity_weights.get(event_type, 1)
-            total_score += count * weight
+        total_sent = sum(row[2] for row in stats)
+        delivered = sum(row[3] for row in stats)
+        opened = sum(row[6] for row in stats)
+        clicked = sum(row[7] for row in stats)
         
-        # Normalize to 0-100 scale
-        return min(100, total_score // 10)
-    
-    def extract_interests(self, behavior_data):
-        """Extract user interests from behavior"""
-        interests = []
+        # Best campaign by clicks per delivered message
+        def engagement(row):
+            return round(row[7] / row[3] * 100, 1) if row[3] else 0
+        best = max(stats, key=engagement, default=None)
         
-        for event_type, count, _ in behavior_data:
-            if 'referral' in event_type and count > 5:
-                interests.append('referral_enthusiast')
-            elif 'content' in event_type and count > 10:
-                interests.append('content_consumer')
-            elif 'admin' in event_type:
-                interests.append('power_user')
+        suggestions = [optimization_suggestions(row[0], row[2], row[3], row[6], row[7]) for row in stats]
         
-        return interests
+        return {
+            'total_campaigns': len(stats),
+            'total_messages': total_sent,
+            'delivery_rate': round(delivered / total_sent * 100, 1) if total_sent else 0,
+            'open_rate': round(opened / delivered * 100, 1) if delivered else 0,
+            'click_rate': round(clicked / delivered * 100, 1) if delivered else 0,
+            'best_campaign': (best[1] or f'کمپین {best[0]}') if best else 'ندارد',
+            'best_engagement': engagement(best) if best else 0,
+            'weak_campaigns': sum(1 for campaign_suggestions in suggestions if campaign_suggestions),
+            'improvement_suggestions': sum(len(campaign_suggestions) for campaign_suggestions in suggestions)
+        }
+    
+    async def analyze_user_behavior(self, user_id):
+        """Get a user's behavior profile for targeting (precomputed by UserProfileBuilder)"""
+        return profile_from_row(await self.db.get_user_profile(user_id))
     
     # ==================== CAMPAIGN EXECUTION ====================
     
-    async def execute_smart_campaign(self, campaign_data):
-        """Execute campaign with smart targeting"""
-        target_users = await self.get_target_users(campaign_data['target_type'])
-        
-        successful_sends = 0
-        failed_sends = 0
-        
-        for user_id in target_users:
-            try:
-                # Analyze user for personalization
-                user_analysis = await self.analyze_user_behavior(user_id)
-                
-                # Personalize message
-                personalized_message = await self.personalize_message(
-                    campaign_data['message'], 
-                    user_analysis
-                )
-                
-                # Send at optimal time for user
-                optimal_time = user_analysis['best_time']
-                current_hour = datetime.now().hour
-                
-                if abs(current_hour - optimal_time) <= 2:  # Send now if within 2 hours
-                    await self.send_campaign_message(user_id, personalized_message)
-                    successful_sends += 1
-                else:  # Schedule for later
-                    await self.schedule_campaign_message(user_id, personalized_message, optimal_time)
-                
-                # Small delay to avoid rate limiting
-                await asyncio.sleep(0.1)
-                
-            except Exception as e:
-                failed_sends += 1
-                await self.db.log_analytics('campaign_send_failed', user_id, str(e))
+    async def execute_smart_campaign(self, campaign_data, progress=None):
+        """Execute campaign with smart targeting
+        
+        `campaign_data['target_type']` is a target type, a segment definition
+        or a UserSet (see resolve_target). `progress` is an optional
+        ProgressReporter kept updated while sending.
+        """
+        total_targets = 0
+        messages = {}
+        
+        async def recipients():
+            nonlocal total_targets
+            # Profiles come joined to the audience pages, not queried per user
+            async for user_id, user_analysis in self.iter_target_profiles(campaign_data['target_type']):
+                total_targets += 1
+                try:
+                    # Personalize message
+                    personalized_message = await self.personalize_message(
+                        campaign_data['message'], 
+                        user_analysis
+                    )
+                    
+                    # Send at optimal time for user
+                    optimal_time = user_analysis['best_time']
+                    current_hour = datetime.now().hour
+                    
+                    if abs(current_hour - optimal_time) <= 2:  # Send now if within 2 hours
+                        messages[user_id] = personalized_message
+                        if progress:
+                            # The audience is streamed, so the total grows as targets are found
+                            progress.total += 1
+                        yield user_id
+                    else:  # Schedule for later
+                        await self.schedule_campaign_message(user_id, personalized_message, optimal_time, campaign_id)
+                except Exception as e:
+                    await self.db.log_analytics('campaign_send_failed', user_id, str(e))
+        
+        # Campaigns without a stored ID are logged under 0
+        campaign_id = campaign_data.get('id') or 0
+        
+        async def send(user_id):
+            await self.send_campaign_message(user_id, messages.pop(user_id), campaign_id)
+        
+        async def on_failed(user_id, error):
+            messages.pop(user_id, None)
+            await self.db.delivery_log.record(DeliveryLog.CAMPAIGN, campaign_id, user_id, delivery_status(error))
+            await self.db.log_analytics('campaign_send_failed', user_id, str(error))
+        
+        # Sends share the global rate budget; flood waits and blocked users are handled by the engine
+        result = await self.broadcast_engine.run(
+            recipients(), send,
+            on_progress=progress.update if progress else None,
+            progress_interval=1.0,
+            on_failed=on_failed
+        )
+        if progress:
+            await progress.update(result, force=True)
+        await self.delivery_wheel.flush()
+        successful_sends = result.sent
+        failed_sends = result.failed
         
         # Log campaign results
         await self.db.log_analytics('campaign_executed', 0, {
             'campaign_id': campaign_data.get('id'),
             'successful_sends': successful_sends,
             'failed_sends': failed_sends,
+            'unreachable': result.unreachable,
             'target_type': campaign_data['target_type']
         })
         
         return {
             'successful_sends': successful_sends,
             'failed_sends': failed_sends,
-            'total_targets': len(target_users)
+            'total_targets': total_targets
         }
     
+    async def send_campaign_message(self, user_id, message, campaign_id=0):
+        """Send a campaign message with its tracked buttons and record it in the delivery log"""
+        buttons = await self.db.get_campaign_buttons(campaign_id) if campaign_id else []
+        sent = await self.bot.send_message(
+            user_id, message, reply_markup=tracked_keyboard(DeliveryLog.CAMPAIGN, campaign_id, buttons)
+        )
+        await self.db.delivery_log.record(
+            DeliveryLog.CAMPAIGN, campaign_id, user_id, DeliveryLog.SENT, sent.message_id
+        )
+        return sent
+    
+    async def schedule_campaign_message(self, user_id, message, hour, campaign_id=0):
+        """Hold a campaign message until the user's best hour comes round"""
+        await self.delivery_wheel.schedule(campaign_id, user_id, message, hour)
+    
     async def personalize_message(self, base_message, user_analysis):
         """Personalize message based on user analysis"""
         personalized = base_message
@@ -537,46 +699,65 @@ class AdvertisingHandlers:
         
         return personalized
     
+    def target_segment(self, target_type):
+        """Get the audience segment for a campaign target type (or a segment definition)"""
+        if isinstance(target_type, dict):
+            return target_type
+        if target_type in self.TARGET_SEGMENTS:
+            return self.TARGET_SEGMENTS[target_type]
+        return target_type if target_type in SEGMENTS else 'all'
+    
+    async def resolve_target(self, target_type):
+        """Get the users targeted by a target type, segment definition or UserSet
+        
+        A UserSet lets callers combine audiences first, e.g.
+        `active - await db.delivery_set(DeliveryLog.CAMPAIGN, x, since=week_ago)`.
+        """
+        if isinstance(target_type, UserSet):
+            return target_type
+        return await self.db.resolve_segment(self.target_segment(target_type))
+    
     async def get_target_users(self, target_type):
         """Get list of users based on targeting criteria"""
-        async with self.db.get_connection() as db:
-            if target_type == 'all':
-                query = "SELECT user_id FROM users WHERE is_banned = FALSE"
-            elif target_type == 'active':
-                query = """
-                    SELECT user_id FROM users 
-                    WHERE is_banned = FALSE 
-                    AND last_activity >= datetime('now', '-7 days')
-                """
-            elif target_type == 'new':
-                query = """
-                    SELECT user_id FROM users 
-                    WHERE is_banned = FALSE 
-                    AND join_date >= datetime('now', '-7 days')
-                """
-            elif target_type == 'top':
-                query = """
-                    SELECT user_id FROM users 
-                    WHERE is_banned = FALSE 
-                    AND total_referrals >= 5
-                    ORDER BY total_referrals DESC
-                    LIMIT 100
-                """
-            elif target_type == 'inactive':
-                query = """
-                    SELECT user_id FROM users 
-                    WHERE is_banned = FALSE 
-                    AND last_activity < datetime('now', '-30 days')
-                """
-            else:
-                query = "SELECT user_id FROM users WHERE is_banned = FALSE"
-            
-            async with db.execute(query) as cursor:
-                users = await cursor.fetchall()
-                return [user[0] for user in users]
+        return list(await self.resolve_target(target_type))
+    
+    async def iter_target_users(self, target_type):
+        """Stream user IDs matching the targeting criteria"""
+        for user_id in await self.resolve_target(target_type):
+            yield user_id
+    
+    async def iter_target_profiles(self, target_type):
+        """Stream (user_id, profile) pairs for the users matching the targeting criteria"""
+        async for row in self.db.iter_user_profiles(await self.resolve_target(target_type)):
+            yield row.user_id, profile_from_row(row)
     
     # ==================== CALLBACK HANDLER ====================
     
+    async def handle_tracked_click(self, callback: types.CallbackQuery, click):
+        """Count a click on a tracked campaign or A/B test button and run its action
+        
+        `click` is the decoded (job_type, job_id, variant, button).
+        """
+        job_type, job_id, variant, button = click
+        first_click = await self.db.click_counter.click(job_type, job_id, variant, button, callback.from_user.id)
+        
+        # Only campaigns store their buttons; other clicks are just acknowledged
+        buttons = await self.db.get_campaign_buttons(job_id) if job_type == DeliveryLog.CAMPAIGN else []
+        action = buttons[button] if button < len(buttons) else {}
+        
+        if action.get('url') and first_click:
+            keyboard = InlineKeyboardMarkup()
+            keyboard.add(InlineKeyboardButton(action['text'], url=action['url']))
+            await self.bot.send_message(callback.from_user.id, "🔗 برای ادامه روی دکمه زیر بزنید:", reply_markup=keyboard)
+            await callback.answer()
+        elif action.get('url'):
+            # The link was already sent on the first click; repeats only show it (alerts hold 200 characters)
+            await callback.answer(f"🔗 {action['url']}"[:200], show_alert=True)
+        elif action.get('reply'):
+            await callback.answer(action['reply'], show_alert=True)
+        else:
+            await callback.answer("✅ ثبت شد")
+    
     async def handle_callback_query(self, callback: types.CallbackQuery):
         """Handle advertising-related callback queries"""
         if callback.data == "ad_panel":
@@ -585,6 +766,14 @@ class AdvertisingHandlers:
             await self.create_campaign_wizard(callback)
         elif callback.data.startswith("campaign_type_"):
             await self.handle_campaign_type(callback)
+        elif callback.data.startswith("campaign_target_"):
+            await self.handle_campaign_target(callback)
+        elif callback.data == "campaign_run_now":
+            await self.run_campaign_now(callback)
+        elif callback.data == "campaign_schedule":
+            await self.start_schedule_campaign(callback)
+        elif callback.data.startswith("campaign_unschedule_"):
+            await self.unschedule_campaign(callback)
         elif callback.data == "ad_cross_promotion":
             await self.show_cross_promotion(callback)
         elif callback.data == "cross_add_partner":
@@ -598,4 +787,18 @@ class AdvertisingHandlers:
         elif callback.data == "ad_optimization":
             await self.show_optimization_panel(callback)
         
-        await callback.answer()
\ No newline at end of file
+        await callback.answer()
+
+
+def parse_campaign_buttons(text):
+    """Split trailing "+ text | url-or-reply" lines off a campaign message; returns (message, buttons)"""
+    lines = [line.strip() for line in text.strip().split('\n')]
+    buttons = []
+    while lines and lines[-1].startswith('+') and '|' in lines[-1]:
+        label, action = (part.strip() for part in lines.pop()[1:].split('|', 1))
+        if action.startswith(('http://', 'https://', 'tg://')):
+            buttons.append({'text': label, 'url': action})
+        else:
+            buttons.append({'text': label, 'reply': action})
+    buttons.reverse()
+    return '\n'.join(lines).strip(), buttons
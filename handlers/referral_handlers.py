@@ -1,6 +1,7 @@
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from utils.helpers import BotHelpers
+from config import REFERRAL_REWARD
 
 class ReferralHandlers:
     def __init__(self, bot, db):
@@ -11,7 +12,7 @@ class ReferralHandlers:
     async def show_referral_menu(self, callback: types.CallbackQuery):
         """Show referral system main menu"""
         user_id = callback.from_user.id
-        user_data = await self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id, fields=('total_referrals', 'points'))
         
         if not user_data:
             await callback.answer("خطا در دریافت اطلاعات!", show_alert=True)
@@ -49,11 +50,11 @@ class ReferralHandlers:
         referral_text = f"""
 🔗 سیستم دعوت دوستان
 
-👥 تعداد دعوت‌های شما: {self.helpers.format_number(user_data[6])} نفر
-💎 امتیاز کسب شده: {self.helpers.format_number(user_data[7])} امتیاز
+👥 تعداد دعوت‌های شما: {self.helpers.format_number(user_data.total_referrals)} نفر
+💎 امتیاز کسب شده: {self.helpers.format_number(user_data.points)} امتیاز
 
 🎁 پاداش هر دعوت:
-• 10 امتیاز فوری
+• {REFERRAL_REWARD} امتیاز فوری
 • دسترسی به محتوای ویژه
 • شرکت در قرعه‌کشی‌ها
 
@@ -122,13 +123,13 @@ class ReferralHandlers:
     async def show_referral_rewards(self, callback: types.CallbackQuery):
         """Show available referral rewards"""
         user_id = callback.from_user.id
-        user_data = await self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id, fields=('total_referrals', 'points'))
         
         if not user_data:
             return
         
-        referrals = user_data[6]
-        points = user_data[7]
+        referrals = user_data.total_referrals
+        points = user_data.points
         
         keyboard = InlineKeyboardMarkup(row_width=1)
         
@@ -179,7 +180,7 @@ class ReferralHandlers:
         back_btn = InlineKeyboardButton("🔙 بازگشت", callback_data="referral_menu")
         keyboard.add(back_btn)
         
-        how_it_works_text = """
+        how_it_works_text = f"""
 ❓ چگونه سیستم دعوت کار می‌کند؟
 
 🔗 مرحله ۱: دریافت لینک
@@ -192,7 +193,7 @@ class ReferralHandlers:
 وقتی کسی از طریق لینک شما عضو شود و در کانال عضو شود، شما پاداش می‌گیرید.
 
 🎁 مرحله ۴: دریافت پاداش
-• 10 امتیاز فوری
+• {REFERRAL_REWARD} امتیاز فوری
 • دسترسی به محتوای ویژه
 • شرکت در قرعه‌کشی‌ها
 
@@ -223,14 +224,14 @@ class ReferralHandlers:
         """Handle reward claim"""
         reward_level = int(callback.data.split('_')[2])
         user_id = callback.from_user.id
-        user_data = await self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id, fields=('total_referrals',))
         
         if not user_data:
             await callback.answer("خطا در دریافت اطلاعات!", show_alert=True)
             return
         
         # Check if user qualifies for reward
-        if user_data[6] >= reward_level:
+        if user_data.total_referrals >= reward_level:
             # Here you would implement the actual reward giving logic
             # For now, just show a success message
             
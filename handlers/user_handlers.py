@@ -1,7 +1,8 @@
-گfrom aiogram import types
+from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from utils.helpers import BotHelpers
-from config import CHANNEL_ID
+from utils.outbound import outbound_priority
+from config import CHANNEL_ID, REFERRAL_REWARD
 
 class UserHandlers:
     def __init__(self, bot, db):
@@ -30,19 +31,22 @@ class UserHandlers:
         await self.db.log_analytics('start_command', user_id, {'referrer_id': referrer_id})
         
         # Add referral if exists
+        success = False
         if referrer_id and referrer_id != user_id:
             success = await self.db.add_referral(referrer_id, user_id)
-            if success:
-                # Notify referrer
-                try:
+        
+        if success:
+            # Notify referrer
+            try:
+                with outbound_priority('referral'):
                     await self.bot.send_message(
                         referrer_id,
                         f"🎉 تبریک! کاربر جدیدی از طریق لینک شما عضو شد!\n"
                         f"👤 {first_name}\n"
-                        f"💎 +10 امتیاز دریافت کردید!"
+                        f"💎 +{REFERRAL_REWARD} امتیاز دریافت کردید!"
                     )
-                except:
-                    pass
+            except:
+                pass
         
         # Show welcome message
         await self.show_welcome_message(message)
@@ -93,8 +97,8 @@ class UserHandlers:
     
     async def show_main_menu(self, callback: types.CallbackQuery):
         """Show main menu to verified users"""
-        user_data = await self.db.get_user(callback.from_user.id)
-        level, level_emoji = self.helpers.calculate_user_level(user_data[7])
+        user_data = await self.db.get_user(callback.from_user.id, fields=('total_referrals', 'points'))
+        level, level_emoji = self.helpers.calculate_user_level(user_data.points)
         
         keyboard = InlineKeyboardMarkup(row_width=2)
         
@@ -117,8 +121,8 @@ class UserHandlers:
 
 👤 {callback.from_user.first_name}
 {level_emoji} سطح: {level}
-💎 امتیاز: {self.helpers.format_number(user_data[7])}
-👥 دعوت‌ها: {self.helpers.format_number(user_data[6])}
+💎 امتیاز: {self.helpers.format_number(user_data.points)}
+👥 دعوت‌ها: {self.helpers.format_number(user_data.total_referrals)}
 
 🎯 از منوی زیر استفاده کنید:
         """
@@ -128,14 +132,16 @@ class UserHandlers:
     async def show_my_stats(self, callback: types.CallbackQuery):
         """Show user personal statistics"""
         user_id = callback.from_user.id
-        user_data = await self.db.get_user(user_id)
+        user_data = await self.db.get_user(
+            user_id, fields=('user_id', 'first_name', 'join_date', 'total_referrals', 'points')
+        )
         
         if not user_data:
             await callback.answer("خطا در دریافت اطلاعات!", show_alert=True)
             return
         
-        level, level_emoji = self.helpers.calculate_user_level(user_data[7])
-        join_date = self.helpers.format_datetime(user_data[5])
+        level, level_emoji = self.helpers.calculate_user_level(user_data.points)
+        join_date = self.helpers.format_datetime(user_data.join_date)
         
         keyboard = InlineKeyboardMarkup()
         back_btn = InlineKeyboardButton("🔙 بازگشت", callback_data="main_menu")
@@ -144,16 +150,16 @@ class UserHandlers:
         stats_text = f"""
 📊 آمار شخصی شما
 
-👤 نام: {user_data[2]}
-🆔 شناسه: {user_data[0]}
+👤 نام: {user_data.first_name}
+🆔 شناسه: {user_data.user_id}
 📅 عضو از: {join_date}
 
 {level_emoji} سطح فعلی: {level}
-💎 کل امتیازات: {self.helpers.format_number(user_data[7])}
-👥 کل دعوت‌ها: {self.helpers.format_number(user_data[6])}
+💎 کل امتیازات: {self.helpers.format_number(user_data.points)}
+👥 کل دعوت‌ها: {self.helpers.format_number(user_data.total_referrals)}
 
 📈 پیشرفت تا سطح بعد:
-{self._get_progress_bar(user_data[7])}
+{self._get_progress_bar(user_data.points)}
 
 🎯 برای کسب امتیاز بیشتر، دوستان خود را دعوت کنید!
         """
@@ -174,20 +180,20 @@ class UserHandlers:
         if top_users:
             for i, user in enumerate(top_users, 1):
                 rank_emoji = self.helpers.get_user_rank_emoji(i)
-                name = user[1] or "کاربر ناشناس"
+                name = user.first_name or "کاربر ناشناس"
                 
                 # Highlight current user
-                if user[0] == user_id:
-                    leaderboard_text += f"➤ {rank_emoji} {name} - {self.helpers.format_number(user[2])} دعوت\n"
+                if user.user_id == user_id:
+                    leaderboard_text += f"➤ {rank_emoji} {name} - {self.helpers.format_number(user.total_referrals)} دعوت\n"
                 else:
-                    leaderboard_text += f"{rank_emoji} {name} - {self.helpers.format_number(user[2])} دعوت\n"
+                    leaderboard_text += f"{rank_emoji} {name} - {self.helpers.format_number(user.total_referrals)} دعوت\n"
             
             # Show current user rank if not in top 10
-            user_data = await self.db.get_user(user_id)
-            if user_data and user_data[6] > 0:
-                user_in_top = any(user[0] == user_id for user in top_users)
+            user_data = await self.db.get_user(user_id, fields=('total_referrals',))
+            if user_data and user_data.total_referrals > 0:
+                user_in_top = any(user.user_id == user_id for user in top_users)
                 if not user_in_top:
-                    leaderboard_text += f"\n📍 رتبه شما: {user_data[6]} دعوت"
+                    leaderboard_text += f"\n📍 رتبه شما: {user_data.total_referrals} دعوت"
         else:
             leaderboard_text += "هنوز کسی دعوت نکرده است!\nاولین نفر باشید! 🚀"
         
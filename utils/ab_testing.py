@@ -2,12 +2,21 @@ import random
 import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Any
+from database.buffers import DeliveryLog
+from database.queries import AB_TEST_GROUP_DELIVERIES, CLICKS_BY_VARIANT
+from utils.broadcast_engine import BroadcastEngine, BroadcastResult, delivery_status
+from utils.click_tracking import tracked_keyboard
+from utils.progress import ProgressReporter
 
 class ABTestManager:
+    # Test group letters as stored in the delivery log's variant column
+    GROUP_CODES = {'A': 1, 'B': 2}
+    
     def __init__(self, bot, db):
         self.bot = bot
         self.db = db
         self.active_tests = {}
+        self.broadcast_engine = BroadcastEngine(on_unreachable=db.mark_user_unreachable, priority='campaign')
     
     async def create_ab_test(self, test_config: Dict[str, Any]):
         """Create new A/B test"""
@@ -26,19 +35,9 @@ class ABTestManager:
     
     async def split_audience(self, audience_size: int, split_ratio: float = 0.5):
         """Split audience into test groups"""
-        # Get random sample of users
-        async with self.db.get_connection() as db:
-            async with db.execute("""
-                SELECT user_id FROM users 
-                WHERE is_banned = FALSE 
-                AND is_member = TRUE
-                ORDER BY RANDOM()
-                LIMIT ?
-            """, (audience_size,)) as cursor:
-                users = await cursor.fetchall()
-        
-        user_ids = [user[0] for user in users]
-        random.shuffle(user_ids)
+        # Sample from the cached member set instead of streaming the user table
+        members = await self.db.resolve_segment('members')
+        user_ids = random.sample(members.to_array(), min(audience_size, len(members)))
         
         split_point = int(len(user_ids) * split_ratio)
         
@@ -48,17 +47,33 @@ class ABTestManager:
         }
     
     async def run_ab_test(self, test_id: int):
-        """Execute A/B test"""
+        """Execute A/B test
+        
+        With an 'admin_chat_id' and 'status_message_id' in the test config,
+        that message shows the progress of both groups while sending.
+        """
         # Get test configuration
         test_config = await self.get_test_config(test_id)
         test_groups = await self.get_test_groups(test_id)
         
+        # Both groups add up in one result so progress covers the whole test
+        result = BroadcastResult()
+        progress = None
+        if test_config.get('admin_chat_id'):
+            progress = ProgressReporter(
+                self.bot, test_config['admin_chat_id'], test_config['status_message_id'],
+                f"اجرای A/B تست {test_id}",
+                len(test_groups['group_a']) + len(test_groups['group_b'])
+            )
+        
         # Send variant A to group A
         await self.send_test_variant(
             test_groups['group_a'],
             test_config['variant_a'],
             test_id,
-            'A'
+            'A',
+            result,
+            progress
         )
         
         # Send variant B to group B
@@ -66,34 +81,74 @@ class ABTestManager:
             test_groups['group_b'],
             test_config['variant_b'],
             test_id,
-            'B'
+            'B',
+            result,
+            progress
         )
         
+        if progress:
+            await progress.update(result, force=True)
+        
         # Schedule result analysis
         await self.schedule_result_analysis(test_id, test_config['duration'])
     
-    async def send_test_variant(self, user_ids: List[int], variant: Dict, test_id: int, group: str):
-        """Send test variant to specific group"""
-        for user_id in user_ids:
-            try:
-                # Send message based on variant type
-                if variant['type'] == 'text':
-                    await self.bot.send_message(user_id, variant['content'])
-                elif variant['type'] == 'photo':
-                    await self.bot.send_photo(
-                        user_id, 
-                        variant['file_id'], 
-                        caption=variant['caption']
-                    )
-                
-                # Log test message
-                await self.log_test_message(test_id, user_id, group, variant)
-                
-            except Exception as e:
-                print(f"Failed to send test message to {user_id}: {e}")
+    async def send_test_variant(self, user_ids: List[int], variant: Dict, test_id: int, group: str,
+                                result: BroadcastResult = None, progress=None):
+        """Send test variant to specific group
+        
+        `variant['buttons']` may list tracked buttons (dicts with a 'text')
+        whose clicks count towards the group's click rate.
+        """
+        keyboard = tracked_keyboard(
+            DeliveryLog.AB_TEST, test_id, variant.get('buttons'), variant=self.GROUP_CODES[group]
+        )
+        
+        async def send(user_id):
+            # Send message based on variant type
+            if variant['type'] == 'text':
+                sent = await self.bot.send_message(user_id, variant['content'], reply_markup=keyboard)
+            elif variant['type'] == 'photo':
+                sent = await self.bot.send_photo(
+                    user_id, 
+                    variant['file_id'], 
+                    caption=variant['caption'],
+                    reply_markup=keyboard
+                )
+            else:
+                raise ValueError(f"Unknown variant type: {variant['type']}")
+            
+            # Log test message
+            await self.log_test_message(test_id, user_id, group, variant, message_id=sent.message_id)
+        
+        async def on_failed(user_id, error):
+            print(f"Failed to send test message to {user_id}: {error}")
+            await self.log_test_message(test_id, user_id, group, variant, status=delivery_status(error))
+        
+        return await self.broadcast_engine.run(
+            user_ids, send,
+            result=result,
+            on_progress=progress.update if progress else None,
+            progress_interval=1.0,
+            on_failed=on_failed
+        )
+    
+    async def assignment_set(self, test_id: int, group: str = None):
+        """Get the users a test was sent to (optionally one group) as a UserSet"""
+        variant = self.GROUP_CODES[group] if group else None
+        return await self.db.delivery_set(DeliveryLog.AB_TEST, test_id, status=None, variant=variant)
+    
+    async def log_test_message(self, test_id: int, user_id: int, group: str, variant: Dict,
+                               status: int = DeliveryLog.SENT, message_id: int = None):
+        """Record a test message in the delivery log (group A is variant 1, B is 2)"""
+        await self.db.delivery_log.record(
+            DeliveryLog.AB_TEST, test_id, user_id, status, message_id, variant=self.GROUP_CODES[group]
+        )
     
     async def analyze_test_results(self, test_id: int):
         """Analyze A/B test results"""
+        # Count clicks still waiting in memory
+        await self.db.click_counter.flush()
+        
         # Get test metrics
         metrics_a = await self.get_group_metrics(test_id, 'A')
         metrics_b = await self.get_group_metrics(test_id, 'B')
@@ -121,21 +176,15 @@ class ABTestManager:
     
     async def get_group_metrics(self, test_id: int, group: str):
         """Get metrics for specific test group"""
+        variant = self.GROUP_CODES[group]
         async with self.db.get_connection() as db:
-            # Get basic metrics
-            async with db.execute("""
-                SELECT 
-                    COUNT(*) as total_sent,
-                    SUM(CASE WHEN delivered = 1 THEN 1 ELSE 0 END) as delivered,
-                    SUM(CASE WHEN opened = 1 THEN 1 ELSE 0 END) as opened,
-                    SUM(CASE WHEN clicked = 1 THEN 1 ELSE 0 END) as clicked,
-                    AVG(engagement_time) as avg_engagement_time
-                FROM ab_test_messages 
-                WHERE test_id = ? AND test_group = ?
-            """, (test_id, group)) as cursor:
-                metrics = await cursor.fetchone()
-        
-        total_sent, delivered, opened, clicked, avg_engagement = metrics
+            # Get basic metrics (Telegram reports no opens; clicks come from the tracked buttons)
+            async with db.execute(AB_TEST_GROUP_DELIVERIES, (DeliveryLog.SENT, DeliveryLog.AB_TEST, test_id, variant)) as cursor:
+                total_sent, delivered, opened, avg_engagement = await cursor.fetchone()
+            async with db.execute(CLICKS_BY_VARIANT, (DeliveryLog.AB_TEST, test_id, variant)) as cursor:
+                clicked = (await cursor.fetchone())[0] or 0
+        
+        delivered = delivered or 0
         
         return {
             'total_sent': total_sent,
@@ -144,7 +193,7 @@ class ABTestManager:
             'clicked': clicked,
             'delivery_rate': (delivered / total_sent * 100) if total_sent > 0 else 0,
             'open_rate': (opened / delivered * 100) if delivered > 0 else 0,
-            'click_rate': (clicked / opened * 100) if opened > 0 else 0,
+            'click_rate': (clicked / delivered * 100) if delivered > 0 else 0,
             'avg_engagement_time': avg_engagement or 0
         }
     
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 import json
+from database.queries import POPULAR_ACTIONS
 
 class Analytics:
     def __init__(self, db):
@@ -11,40 +12,35 @@ class Analytics:
     
     async def get_user_growth_stats(self, days=30):
         """Get user growth statistics for specified days"""
+        dates = [
+            (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
+            for i in range(days)
+        ]
+        
+        # One range scan over the join_date index instead of a query per day
         async with self.db.get_connection() as db:
-            stats = []
-            for i in range(days):
-                date = datetime.now() - timedelta(days=i)
-                date_str = date.strftime('%Y-%m-%d')
-                
-                async with db.execute("""
-                    SELECT COUNT(*) FROM users 
-                    WHERE DATE(join_date) = ?
-                """, (date_str,)) as cursor:
-                    count = (await cursor.fetchone())[0]
-                
-                stats.append({
-                    'date': date_str,
-                    'new_users': count
-                })
-            
-            return list(reversed(stats))
+            async with db.execute("""
+                SELECT DATE(join_date) as day, COUNT(*) FROM users 
+                WHERE join_date >= ?
+                GROUP BY day
+            """, (dates[-1],)) as cursor:
+                counts = dict(await cursor.fetchall())
+        
+        return [
+            {'date': date_str, 'new_users': counts.get(date_str, 0)}
+            for date_str in reversed(dates)
+        ]
     
     async def get_referral_stats(self):
         """Get referral system statistics"""
         async with self.db.get_connection() as db:
-            stats = {}
+            counters = await self.db.get_counters(db, 'total_referrals', 'referrers')
+            stats = {'total_referrals': counters['total_referrals']}
             
-            # Total referrals
-            async with db.execute("SELECT COUNT(*) FROM referrals") as cursor:
-                stats['total_referrals'] = (await cursor.fetchone())[0]
-            
-            # Average referrals per user
-            async with db.execute("""
-                SELECT AVG(total_referrals) FROM users WHERE total_referrals > 0
-            """) as cursor:
-                avg = await cursor.fetchone()
-                stats['avg_referrals'] = round(avg[0] if avg[0] else 0, 2)
+            # Average referrals per referring user
+            stats['avg_referrals'] = round(
+                counters['total_referrals'] / counters['referrers'] if counters['referrers'] else 0, 2
+            )
             
             # Top referrer
             async with db.execute("""
@@ -58,70 +54,40 @@ class Analytics:
                 }
             
             # Referrals this week
-            async with db.execute("""
-                SELECT COUNT(*) FROM referrals 
-                WHERE date >= datetime('now', '-7 days')
-            """) as cursor:
-                stats['week_referrals'] = (await cursor.fetchone())[0]
+            stats['week_referrals'] = await self.db.sum_counter_buckets(db, 'referrals', '-7 days')
             
             return stats
     
     async def get_activity_stats(self):
         """Get user activity statistics"""
+        await self.db.flush_activity()
         async with self.db.get_connection() as db:
-            stats = {}
-            
-            # Active users (last 24 hours)
-            async with db.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE last_activity >= datetime('now', '-1 day')
-            """) as cursor:
-                stats['daily_active'] = (await cursor.fetchone())[0]
-            
-            # Active users (last 7 days)
-            async with db.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE last_activity >= datetime('now', '-7 days')
-            """) as cursor:
-                stats['weekly_active'] = (await cursor.fetchone())[0]
-            
-            # Active users (last 30 days)
-            async with db.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE last_activity >= datetime('now', '-30 days')
-            """) as cursor:
-                stats['monthly_active'] = (await cursor.fetchone())[0]
-            
-            return stats
+            return {
+                'daily_active': await self.db.sum_counter_buckets(db, 'active', '-1 day'),
+                'weekly_active': await self.db.sum_counter_buckets(db, 'active', '-7 days'),
+                'monthly_active': await self.db.sum_counter_buckets(db, 'active', '-30 days')
+            }
     
     async def get_popular_actions(self, limit=10):
         """Get most popular user actions"""
         async with self.db.get_connection() as db:
-            async with db.execute("""
-                SELECT event_type, COUNT(*) as count
-                FROM analytics 
-                WHERE timestamp >= datetime('now', '-7 days')
-                GROUP BY event_type
-                ORDER BY count DESC
-                LIMIT ?
-            """, (limit,)) as cursor:
+            async with db.execute(POPULAR_ACTIONS, (limit,)) as cursor:
                 return await cursor.fetchall()
     
     async def get_hourly_activity(self):
         """Get hourly activity distribution"""
+        hourly_stats = {hour: 0 for hour in range(24)}
+        
         async with self.db.get_connection() as db:
-            hourly_stats = {}
-            
-            for hour in range(24):
-                async with db.execute("""
-                    SELECT COUNT(*) FROM analytics 
-                    WHERE strftime('%H', timestamp) = ? 
-                    AND timestamp >= datetime('now', '-7 days')
-                """, (f"{hour:02d}",)) as cursor:
-                    count = (await cursor.fetchone())[0]
-                    hourly_stats[hour] = count
-            
-            return hourly_stats
+            async with db.execute("""
+                SELECT strftime('%H', timestamp) as hour, COUNT(*) FROM analytics 
+                WHERE timestamp >= datetime('now', '-7 days')
+                GROUP BY hour
+            """) as cursor:
+                for hour, count in await cursor.fetchall():
+                    hourly_stats[int(hour)] = count
+        
+        return hourly_stats
     
     async def generate_analytics_report(self):
         """Generate comprehensive analytics report"""
@@ -0,0 +1,236 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+from aiogram.utils.exceptions import (
+    BotBlocked, BotKicked, ChatNotFound, NetworkError, RestartingTelegram, RetryAfter, UserDeactivated
+)
+
+from config import (
+    BROADCAST_CONCURRENCY, BROADCAST_MAX_RETRIES, BROADCAST_MAX_FLOOD_WAITS, BROADCAST_RETRY_BASE_DELAY
+)
+from database.buffers import DeliveryLog
+from utils.outbound import set_priority
+from utils.rate_limiter import shared_limiter
+
+# The recipient will never accept messages again
+UNREACHABLE_ERRORS = (BotBlocked, BotKicked, UserDeactivated, ChatNotFound)
+# Worth retrying after a short delay
+TRANSIENT_ERRORS = (NetworkError, RestartingTelegram, asyncio.TimeoutError)
+
+
+def delivery_status(error):
+    """Get the DeliveryLog status code for the final error of a send"""
+    if isinstance(error, UNREACHABLE_ERRORS):
+        return DeliveryLog.UNREACHABLE
+    return DeliveryLog.FAILED
+
+
+class BroadcastResult:
+    """Counters for one broadcast run"""
+
+    def __init__(self, sent=0, failed=0, checkpoint=-1):
+        self.sent = sent
+        self.failed = failed
+        self.unreachable = 0
+        self.retries = 0
+        self.flood_waits = 0
+        # Highest user_id such that every recipient up to it has been processed
+        self.checkpoint = checkpoint
+        self.cancelled = False
+        self._base = sent + failed
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def processed(self):
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rate(self):
+        """Achieved sends per second in this run"""
+        return (self.processed - self._base) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'unreachable': self.unreachable,
+            'retries': self.retries,
+            'flood_waits': self.flood_waits,
+            'checkpoint': self.checkpoint,
+            'elapsed': round(self.elapsed, 2),
+            'rate': round(self.rate, 2)
+        }
+
+
+class JobControl:
+    """Pause, resume and cancel switch for a running broadcast"""
+
+    def __init__(self):
+        self._runnable = asyncio.Event()
+        self._runnable.set()
+        self.cancelled = False
+
+    @property
+    def paused(self):
+        return not self._runnable.is_set() and not self.cancelled
+
+    def pause(self):
+        self._runnable.clear()
+
+    def resume(self):
+        self._runnable.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._runnable.set()
+
+    async def wait_runnable(self):
+        """Block while paused; returns False once cancelled"""
+        await self._runnable.wait()
+        return not self.cancelled
+
+
+async def _iterate(recipients):
+    for user_id in recipients:
+        yield user_id
+
+
+class BroadcastEngine:
+    """Sends to a stream of recipients with a bounded pool of workers
+
+    Workers make their API calls under the engine's priority class, so
+    OutboundBot holds them to that class's share of the shared budget
+    while each request's round trip overlaps with the others.
+
+    Errors are classified: a flood wait pauses the shared limiter and
+    retries, blocked or deleted recipients are reported to
+    `on_unreachable(user_id)`, and network errors are retried with
+    jittered exponential backoff.
+    """
+
+    def __init__(self, limiter=None, concurrency=BROADCAST_CONCURRENCY, on_unreachable=None,
+                 max_retries=BROADCAST_MAX_RETRIES, retry_base_delay=BROADCAST_RETRY_BASE_DELAY,
+                 priority='broadcast', max_flood_waits=BROADCAST_MAX_FLOOD_WAITS):
+        self.limiter = limiter or shared_limiter
+        self.concurrency = concurrency
+        self.priority = priority
+        self.on_unreachable = on_unreachable
+        self.max_retries = max_retries
+        self.max_flood_waits = max_flood_waits
+        self.retry_base_delay = retry_base_delay
+
+    async def deliver(self, user_id, send, result):
+        """Send to one recipient, retrying flood waits and transient errors
+
+        Returns None on success, otherwise the final exception. Flood waits
+        say nothing about the recipient, so they have their own limit
+        instead of using up the retries.
+        """
+        attempt = 0
+        flood_waits = 0
+        while True:
+            try:
+                await send(user_id)
+                return None
+            except RetryAfter as e:
+                result.flood_waits += 1
+                self.limiter.pause(e.timeout)
+                if flood_waits >= self.max_flood_waits:
+                    return e
+                flood_waits += 1
+                continue
+            except UNREACHABLE_ERRORS as e:
+                result.unreachable += 1
+                if self.on_unreachable:
+                    try:
+                        await self.on_unreachable(user_id)
+                    except Exception as report_error:
+                        print(f"Error marking user {user_id} unreachable: {report_error}")
+                return e
+            except TRANSIENT_ERRORS as e:
+                error = e
+                await asyncio.sleep(random.uniform(0, self.retry_base_delay * 2 ** attempt))
+            except Exception as e:
+                return e
+
+            if attempt >= self.max_retries:
+                return error
+            attempt += 1
+            result.retries += 1
+
+    async def run(self, recipients, send, result=None, control=None, on_progress=None, progress_interval=5.0,
+                  on_failed=None):
+        """Call `send(user_id)` for every ID yielded by `recipients` (a list, UserSet or async iterable)
+
+        Recipients must arrive in ascending user_id order for
+        `result.checkpoint` to be meaningful. `on_progress(result)` is awaited
+        every `progress_interval` seconds and once at the end;
+        `on_failed(user_id, error)` after each send that finally failed.
+        """
+        if not hasattr(recipients, '__aiter__'):
+            recipients = _iterate(recipients)
+        result = result or BroadcastResult()
+        result.finished_at = None  # a result may be carried over several runs
+        control = control or JobControl()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        dispatched = deque()
+        completed = set()
+
+        def mark_done(user_id):
+            completed.add(user_id)
+            while dispatched and dispatched[0] in completed:
+                result.checkpoint = dispatched.popleft()
+                completed.discard(result.checkpoint)
+
+        async def worker():
+            set_priority(self.priority)
+            while True:
+                user_id = await queue.get()
+                if user_id is None:
+                    return
+                # Queued recipients wait out a pause and are skipped on cancel
+                if not await control.wait_runnable():
+                    continue
+                error = await self.deliver(user_id, send, result)
+                if error is None:
+                    result.sent += 1
+                else:
+                    result.failed += 1
+                    if on_failed:
+                        await on_failed(user_id, error)
+                mark_done(user_id)
+
+        async def ticker():
+            while True:
+                await asyncio.sleep(progress_interval)
+                await on_progress(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        progress_task = asyncio.create_task(ticker()) if on_progress else None
+        try:
+            async for user_id in recipients:
+                if not await control.wait_runnable():
+                    result.cancelled = True
+                    break
+                dispatched.append(user_id)
+                await queue.put(user_id)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if progress_task:
+                progress_task.cancel()
+            result.finished_at = time.monotonic()
+
+        if on_progress:
+            await on_progress(result)
+        return result
@@ -0,0 +1,284 @@
+import asyncio
+import time
+
+from config import BROADCAST_CHECKPOINT_INTERVAL, BROADCAST_WORKERS
+from database.buffers import DeliveryLog
+from utils.broadcast_engine import BroadcastEngine, BroadcastResult, JobControl, delivery_status
+
+JOB_COLUMNS = (
+    'id', 'message_text', 'media_type', 'media_file_id', 'scheduled_time', 'status',
+    'audience', 'cursor_user_id', 'total_users', 'total_sent', 'total_failed',
+    'created_by', 'admin_chat_id', 'status_message_id'
+)
+
+
+class BroadcastJobManager:
+    """Runs broadcasts as persistent jobs stored in the broadcasts table
+
+    Each job checkpoints the last fully processed user_id and its counters
+    every BROADCAST_CHECKPOINT_INTERVAL seconds, so after a restart it
+    continues from the checkpoint instead of starting over. Recipients
+    in flight at a crash may receive the message twice.
+
+    With `shards` > 0 the job is split into user_id % shards rows in
+    broadcast_shards that BroadcastWorker processes deliver; this process
+    only aggregates their progress.
+    """
+
+    def __init__(self, bot, db, engine=None, on_finished=None, shards=BROADCAST_WORKERS, on_progress=None):
+        self.bot = bot
+        self.db = db
+        self.engine = engine or BroadcastEngine()
+        self.on_finished = on_finished
+        self.on_progress = on_progress
+        self.shards = shards
+        self._active = {}
+
+    async def create_job(self, broadcast_data, audience='all', created_by=None,
+                         admin_chat_id=None, status_message_id=None, scheduled_time=None):
+        """Store a new broadcast job and return its ID
+        
+        Jobs with a `scheduled_time` are stored as 'scheduled' and started by
+        BotScheduler when due.
+        """
+        cursor = await self.db.execute_write("""
+            INSERT INTO broadcasts
+            (message_text, media_type, media_file_id, scheduled_time, status, audience,
+             created_by, admin_chat_id, status_message_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            broadcast_data['message_text'], broadcast_data['message_type'], broadcast_data.get('file_id'),
+            scheduled_time.strftime('%Y-%m-%d %H:%M:%S') if scheduled_time else None,
+            'scheduled' if scheduled_time else 'pending',
+            audience, created_by, admin_chat_id, status_message_id
+        ))
+        return cursor.lastrowid
+
+    async def get_job(self, job_id):
+        """Get a broadcast job as a dict"""
+        async with self.db.get_connection() as db:
+            async with db.execute(f"""
+                SELECT {', '.join(JOB_COLUMNS)} FROM broadcasts WHERE id = ?
+            """, (job_id,)) as cursor:
+                row = await cursor.fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    async def set_status_message(self, job_id, chat_id, message_id):
+        """Remember which admin message shows this job's status"""
+        await self.db.execute_write("""
+            UPDATE broadcasts SET admin_chat_id = ?, status_message_id = ? WHERE id = ?
+        """, (chat_id, message_id, job_id))
+
+    def is_active(self, job_id):
+        return job_id in self._active
+
+    def is_paused(self, job_id):
+        active = self._active.get(job_id)
+        return bool(active) and active[0].paused
+
+    def get_progress(self, job_id):
+        """Get the live result of a running job, if any"""
+        active = self._active.get(job_id)
+        return active[1] if active else None
+
+    def start(self, job_id):
+        """Start (or restart from its checkpoint) a broadcast job"""
+        if job_id in self._active:
+            return False
+        control = JobControl()
+        task = asyncio.create_task(self._run_job(job_id, control))
+        self._active[job_id] = (control, None, task)
+        return True
+
+    async def pause(self, job_id):
+        """Pause a running job"""
+        active = self._active.get(job_id)
+        if not active:
+            return False
+        active[0].pause()
+        await self._set_status(job_id, 'paused')
+        return True
+
+    async def resume(self, job_id):
+        """Resume a paused job, restarting it from its checkpoint if needed"""
+        active = self._active.get(job_id)
+        if active:
+            active[0].resume()
+            await self._set_status(job_id, 'running')
+            return True
+        job = await self.get_job(job_id)
+        if not job or job['status'] not in ('paused', 'running', 'pending'):
+            return False
+        return self.start(job_id)
+
+    async def cancel(self, job_id):
+        """Cancel a job; recipients already sent to are kept in the counters"""
+        active = self._active.get(job_id)
+        if active:
+            active[0].cancel()
+            return True
+        job = await self.get_job(job_id)
+        if not job or job['status'] in ('done', 'cancelled'):
+            return False
+        await self._finish(job_id, 'cancelled')
+        return True
+
+    async def resume_unfinished(self):
+        """Restart jobs that were running or about to run when the process stopped
+        
+        'pending' jobs were confirmed (or claimed by the scheduler) but had
+        not reached 'running' yet, so they are started as well.
+        """
+        async with self.db.get_connection() as db:
+            async with db.execute("SELECT id FROM broadcasts WHERE status IN ('pending', 'running')") as cursor:
+                job_ids = [row[0] for row in await cursor.fetchall()]
+        for job_id in job_ids:
+            self.start(job_id)
+        return job_ids
+
+    async def shutdown(self):
+        """Stop running jobs, leaving their checkpoints for the next start"""
+        tasks = [task for _, _, task in self._active.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_job(self, job_id, control):
+        """Execute a job from its checkpoint to completion"""
+        job = await self.get_job(job_id)
+        if not job:
+            self._active.pop(job_id, None)
+            return
+
+        result = BroadcastResult(job['total_sent'] or 0, job['total_failed'] or 0, job['cursor_user_id'])
+        self._active[job_id] = (control, result, self._active[job_id][2])
+
+        if not job['total_users']:
+            job['total_users'] = await self.db.count_users(job['audience'])
+        await self.db.execute_write("""
+            UPDATE broadcasts
+            SET status = 'running', total_users = ?, started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+            WHERE id = ?
+        """, (job['total_users'], job_id))
+
+        try:
+            if self.shards:
+                await self._wait_for_shards(job, result, control)
+            else:
+                await self.engine.run(
+                    self.db.iter_users(job['audience'], start_after=job['cursor_user_id']),
+                    lambda user_id: self.deliver_job_message(user_id, job),
+                    result=result,
+                    control=control,
+                    on_progress=lambda progress: self._report_progress(job, progress),
+                    progress_interval=BROADCAST_CHECKPOINT_INTERVAL,
+                    on_failed=lambda user_id, error: self.log_failure(job_id, user_id, error)
+                )
+        except asyncio.CancelledError:
+            await self._checkpoint(job_id, result)
+            self._active.pop(job_id, None)
+            raise
+        except Exception as e:
+            print(f"Error running broadcast job {job_id}: {e}")
+            await self._checkpoint(job_id, result)
+            await self._set_status(job_id, 'paused')
+            self._active.pop(job_id, None)
+            return
+
+        self._active.pop(job_id, None)
+        await self._finish(job_id, 'cancelled' if result.cancelled else 'done')
+        if self.on_finished:
+            try:
+                await self.on_finished(job_id, result)
+            except Exception as e:
+                print(f"Error reporting broadcast job {job_id}: {e}")
+
+    async def _wait_for_shards(self, job, result, control):
+        """Hand a job to the worker processes and follow it until every shard finishes"""
+        job_id = job['id']
+
+        async def create_shards(db):
+            await db.executemany("""
+                INSERT OR IGNORE INTO broadcast_shards (broadcast_id, shard, shard_count) VALUES (?, ?, ?)
+            """, [(job_id, shard, self.shards) for shard in range(self.shards)])
+
+        await self.db.write(create_shards)
+
+        cancel_requested = False
+        while True:
+            await asyncio.sleep(BROADCAST_CHECKPOINT_INTERVAL)
+            # Workers read the job status to pause or cancel their shards
+            if control.cancelled and not cancel_requested:
+                await self._set_status(job_id, 'cancelled')
+                cancel_requested = True
+
+            async with self.db.get_connection() as db:
+                async with db.execute("""
+                    SELECT SUM(total_sent), SUM(total_failed),
+                           SUM(status IN ('pending', 'running')), SUM(status = 'cancelled')
+                    FROM broadcast_shards WHERE broadcast_id = ?
+                """, (job_id,)) as cursor:
+                    sent, failed, unfinished, cancelled = await cursor.fetchone()
+
+            result.sent, result.failed = sent or 0, failed or 0
+            await self._report_progress(job, result)
+            if not unfinished:
+                result.cancelled = bool(cancelled)
+                result.finished_at = time.monotonic()
+                return
+
+    async def deliver_job_message(self, user_id, job):
+        """Send a job's message to one user and record it in the delivery log"""
+        message = await self.send_job_message(user_id, job)
+        await self.db.delivery_log.record(
+            DeliveryLog.BROADCAST, job['id'], user_id, DeliveryLog.SENT, getattr(message, 'message_id', None)
+        )
+        return message
+
+    async def log_failure(self, job_id, user_id, error):
+        """Record a failed send in the delivery log"""
+        await self.db.delivery_log.record(DeliveryLog.BROADCAST, job_id, user_id, delivery_status(error))
+
+    async def send_job_message(self, user_id, job):
+        """Send a job's message to one user"""
+        text = job['message_text']
+        file_id = job['media_file_id']
+        media_type = job['media_type']
+
+        if media_type == 'text':
+            return await self.bot.send_message(user_id, text, parse_mode='Markdown')
+        elif media_type == 'photo':
+            return await self.bot.send_photo(user_id, file_id, caption=text, parse_mode='Markdown')
+        elif media_type == 'video':
+            return await self.bot.send_video(user_id, file_id, caption=text, parse_mode='Markdown')
+        elif media_type == 'document':
+            return await self.bot.send_document(user_id, file_id, caption=text, parse_mode='Markdown')
+        elif media_type == 'audio':
+            return await self.bot.send_audio(user_id, file_id, caption=text, parse_mode='Markdown')
+        elif media_type == 'voice':
+            return await self.bot.send_voice(user_id, file_id, caption=text, parse_mode='Markdown')
+        elif media_type == 'animation':
+            return await self.bot.send_animation(user_id, file_id, caption=text, parse_mode='Markdown')
+
+    async def _report_progress(self, job, result):
+        """Checkpoint a running job and pass its progress to `on_progress`"""
+        await self._checkpoint(job['id'], result)
+        if self.on_progress:
+            try:
+                await self.on_progress(job, result)
+            except Exception as e:
+                print(f"Error reporting progress of broadcast job {job['id']}: {e}")
+
+    async def _checkpoint(self, job_id, result):
+        """Persist the job's cursor and counters"""
+        await self.db.execute_write("""
+            UPDATE broadcasts SET cursor_user_id = ?, total_sent = ?, total_failed = ? WHERE id = ?
+        """, (result.checkpoint, result.sent, result.failed, job_id))
+
+    async def _set_status(self, job_id, status):
+        await self.db.execute_write("UPDATE broadcasts SET status = ? WHERE id = ?", (status, job_id))
+
+    async def _finish(self, job_id, status):
+        await self.db.execute_write("""
+            UPDATE broadcasts SET status = ?, sent = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?
+        """, (status, status == 'done', job_id))
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+
+from config import BOT_TOKEN, BROADCAST_CHECKPOINT_INTERVAL, BROADCAST_WORKER_POLL_INTERVAL
+from database.models import Database
+from database.queries import CLAIM_BROADCAST_SHARD
+from utils.broadcast_engine import BroadcastEngine, BroadcastResult, JobControl
+from utils.broadcast_jobs import BroadcastJobManager
+from utils.outbound import OutboundBot
+from utils.rate_limiter import RateLimiter, worker_rate
+
+
+class BroadcastWorker:
+    """Delivers one user_id % shard_count shard of every sharded broadcast
+
+    Shard rows in broadcast_shards are created by the bot process; the worker
+    claims its own shard of each job in order, checkpoints progress into the
+    row and follows cancel from the job's status. The shard of a paused job
+    is handed back as 'pending' so later jobs are not held up behind it.
+    """
+
+    def __init__(self, shard, shard_count, bot, db, engine, poll_interval=BROADCAST_WORKER_POLL_INTERVAL):
+        self.shard = shard
+        self.shard_count = shard_count
+        self.db = db
+        self.engine = engine
+        self.jobs = BroadcastJobManager(bot, db, engine)
+        self.poll_interval = poll_interval
+
+    async def run(self):
+        """Claim and deliver shards until cancelled"""
+        while True:
+            broadcast_id = await self.claim()
+            if broadcast_id is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            try:
+                await self.deliver(broadcast_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error delivering shard {self.shard} of broadcast {broadcast_id}: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def claim(self):
+        """Take the oldest unfinished shard of this worker, if any"""
+        async def job(db):
+            async with db.execute(CLAIM_BROADCAST_SHARD, (os.getpid(), self.shard, self.shard_count)) as cursor:
+                row = await cursor.fetchone()
+            return row[0] if row else None
+
+        return await self.db.write(job)
+
+    async def deliver(self, broadcast_id):
+        """Send a broadcast to this worker's shard from its checkpoint"""
+        job = await self.jobs.get_job(broadcast_id)
+        async with self.db.get_connection() as db:
+            async with db.execute("""
+                SELECT cursor_user_id, total_sent, total_failed FROM broadcast_shards
+                WHERE broadcast_id = ? AND shard = ?
+            """, (broadcast_id, self.shard)) as cursor:
+                cursor_user_id, total_sent, total_failed = await cursor.fetchone()
+
+        result = BroadcastResult(total_sent, total_failed, cursor_user_id)
+        if job['status'] == 'paused':
+            # Hand the shard back instead of holding the worker (see CLAIM_BROADCAST_SHARD)
+            await self._checkpoint(broadcast_id, result, 'pending')
+            return
+
+        control = JobControl()
+        paused = False
+        if job['status'] not in ('pending', 'running'):
+            control.cancel()
+
+        async def on_progress(progress):
+            nonlocal paused
+            await self._checkpoint(broadcast_id, progress)
+            job_status = await self._job_status(broadcast_id)
+            if job_status not in ('pending', 'running'):
+                # Stopping early on pause is safe: the cursor only covers finished
+                # sends, so queued recipients are sent when the shard is claimed again
+                paused = job_status == 'paused'
+                control.cancel()
+
+        recipients = self.db.iter_users(
+            job['audience'], start_after=cursor_user_id, shard=(self.shard, self.shard_count)
+        )
+        try:
+            await self.engine.run(
+                recipients,
+                lambda user_id: self.jobs.deliver_job_message(user_id, job),
+                result=result,
+                control=control,
+                on_progress=on_progress,
+                progress_interval=BROADCAST_CHECKPOINT_INTERVAL,
+                on_failed=lambda user_id, error: self.jobs.log_failure(broadcast_id, user_id, error)
+            )
+        except asyncio.CancelledError:
+            # Leave the shard running so it is claimed again on restart
+            await self._checkpoint(broadcast_id, result)
+            raise
+
+        if paused:
+            status = 'pending'
+        else:
+            status = 'cancelled' if result.cancelled else 'done'
+        await self._checkpoint(broadcast_id, result, status)
+
+    async def _job_status(self, broadcast_id):
+        async with self.db.get_connection() as db:
+            async with db.execute("SELECT status FROM broadcasts WHERE id = ?", (broadcast_id,)) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def _checkpoint(self, broadcast_id, result, status='running'):
+        """Persist the shard's cursor, counters and heartbeat"""
+        await self.db.execute_write("""
+            UPDATE broadcast_shards
+            SET status = ?, cursor_user_id = ?, total_sent = ?, total_failed = ?, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE broadcast_id = ? AND shard = ?
+        """, (status, result.checkpoint, result.sent, result.failed, broadcast_id, self.shard))
+
+
+async def serve(shard, shard_count):
+    """Run one worker process until SIGTERM or SIGINT"""
+    db = Database()
+    await db.init_db()
+
+    # Workers split the broadcast share; the bot process keeps the rest (see process_budget)
+    limiter = RateLimiter(rate=worker_rate(shard_count), shares={'broadcast': 1.0})
+    bot = OutboundBot(token=BOT_TOKEN, limiter=limiter)
+    engine = BroadcastEngine(limiter, on_unreachable=db.mark_user_unreachable)
+    worker = BroadcastWorker(shard, shard_count, bot, db, engine)
+
+    task = asyncio.create_task(worker.run())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        limiter.close()
+        await bot.close()
+        await db.close()
+
+
+def start_workers(shard_count):
+    """Spawn `shard_count` worker processes"""
+    return [
+        subprocess.Popen([sys.executable, '-m', 'utils.broadcast_worker', str(shard), str(shard_count)])
+        for shard in range(shard_count)
+    ]
+
+
+async def stop_workers(processes, timeout=15):
+    """Ask worker processes to checkpoint and exit"""
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            await asyncio.to_thread(process.wait, timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m utils.broadcast_worker <shard> <shard_count>")
+    asyncio.run(serve(int(sys.argv[1]), int(sys.argv[2])))
@@ -1,33 +1,73 @@
 import asyncio
+import heapq
+import os
+import socket
+import time
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import json
+from config import ADMIN_ID, CAMPAIGN_LEASE_TTL
+from database.queries import SCHEDULED_CAMPAIGNS, CAMPAIGN_HELD_DELIVERIES, FINISH_SENT_CAMPAIGNS
+from utils.progress import ProgressReporter
+
+CAMPAIGN_COLUMNS = (
+    'id', 'name', 'campaign_type', 'target_type', 'message_text', 'media_type', 'media_file_id',
+    'status', 'scheduled_time', 'buttons', 'admin_chat_id', 'status_message_id'
+)
 
 class CampaignManager:
-    def __init__(self, bot, db):
+    # Allowed status changes; every change is a conditional UPDATE on the current status.
+    # 'sending' campaigns have finished their run but still have deliveries on the
+    # delivery wheel; recover_campaigns marks them done once the wheel has sent them.
+    TRANSITIONS = {
+        'draft': ('scheduled',),
+        'scheduled': ('draft', 'running'),
+        'running': ('sending', 'done', 'failed'),
+        'sending': ('done',),
+    }
+    
+    def __init__(self, bot, db, executor=None, lease_ttl=CAMPAIGN_LEASE_TTL):
         self.bot = bot
         self.db = db
+        # async executor(campaign_data, progress), e.g. AdvertisingHandlers.execute_smart_campaign
+        self.executor = executor
+        self.lease_ttl = lease_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
         self.scheduler = AsyncIOScheduler()
         self.active_campaigns = {}
         self.ab_tests = {}
+        
+        # Scheduled campaigns as a min-heap of (due timestamp, campaign_id)
+        self._campaign_heap = []
+        self._campaign_wakeup = None
+        self._campaign_task = None
     
     def start(self):
         """Start campaign manager"""
+        self._campaign_wakeup = asyncio.Event()
+        self._campaign_task = asyncio.create_task(self._run_due_campaigns())
         self.scheduler.start()
         self.setup_campaign_jobs()
     
-    def stop(self):
-        """Stop campaign manager"""
+    async def stop(self):
+        """Stop campaign manager; running campaigns are marked failed"""
         self.scheduler.shutdown()
+        if self._campaign_task:
+            self._campaign_task.cancel()
+            self._campaign_task = None
+        tasks = list(self.active_campaigns.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
     
     def setup_campaign_jobs(self):
         """Setup scheduled campaign jobs"""
-        # Check for scheduled campaigns every minute
+        # Fail campaigns left running by a dead instance and pick up ones scheduled elsewhere
         self.scheduler.add_job(
-            self.check_scheduled_campaigns,
+            self.recover_campaigns,
             'interval',
-            minutes=1,
-            id='check_campaigns'
+            seconds=self.lease_ttl,
+            id='recover_campaigns'
         )
         
         # Optimize campaigns daily
@@ -49,45 +89,236 @@ class CampaignManager:
             id='weekly_report'
         )
     
+    # ==================== CAMPAIGN STORE ====================
+    
+    async def create_campaign(self, campaign_data):
+        """Store a campaign as a draft and return its ID
+        
+        `campaign_data['buttons']` may list tracked buttons, each a dict with
+        a 'text' and either a 'url' or a 'reply' shown as an alert. With an
+        'admin_chat_id' and 'status_message_id' that message shows the
+        campaign's progress while it runs.
+        """
+        buttons = campaign_data.get('buttons')
+        cursor = await self.db.execute_write("""
+            INSERT INTO campaigns
+                (name, campaign_type, target_type, message_text, media_type, media_file_id, buttons,
+                 admin_chat_id, status_message_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            campaign_data.get('name'),
+            campaign_data.get('campaign_type'),
+            campaign_data.get('target_type', 'all'),
+            campaign_data.get('message'),
+            campaign_data.get('media_type'),
+            campaign_data.get('media_file_id'),
+            json.dumps(buttons, ensure_ascii=False) if buttons else None,
+            campaign_data.get('admin_chat_id'),
+            campaign_data.get('status_message_id')
+        ))
+        return cursor.lastrowid
+    
+    async def get_campaign(self, campaign_id):
+        """Get a campaign as a dict (`message` holds the text, as campaign executors expect)"""
+        async with self.db.get_connection() as db:
+            async with db.execute(f"""
+                SELECT {', '.join(CAMPAIGN_COLUMNS)} FROM campaigns WHERE id = ?
+            """, (campaign_id,)) as cursor:
+                row = await cursor.fetchone()
+        if not row:
+            return None
+        campaign = dict(zip(CAMPAIGN_COLUMNS, row))
+        campaign['message'] = campaign['message_text']
+        campaign['buttons'] = json.loads(campaign['buttons']) if campaign['buttons'] else []
+        return campaign
+    
+    async def _transition(self, db, campaign_id, status, extra_sql="", params=()):
+        """Move a campaign to `status` if its current status allows it (run inside a writer job)"""
+        sources = [source for source, targets in self.TRANSITIONS.items() if status in targets]
+        if not sources:
+            raise ValueError(f"Unknown campaign status: {status}")
+        cursor = await db.execute(f"""
+            UPDATE campaigns SET status = ?{extra_sql}
+            WHERE id = ? AND status IN ({', '.join('?' * len(sources))})
+        """, (status, *params, campaign_id, *sources))
+        return cursor.rowcount > 0
+    
+    async def schedule_campaign(self, campaign_id, send_time):
+        """Schedule a draft campaign to run at `send_time`"""
+        async def job(db):
+            return await self._transition(
+                db, campaign_id, 'scheduled', ", scheduled_time = ?", (send_time.strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+        
+        if not await self.db.write(job):
+            return False
+        heapq.heappush(self._campaign_heap, (send_time.timestamp(), campaign_id))
+        # Wake the timer in case this one is due before the current head
+        if self._campaign_wakeup:
+            self._campaign_wakeup.set()
+        return True
+    
+    async def unschedule_campaign(self, campaign_id):
+        """Return a scheduled campaign to draft (its heap entry is skipped when due)"""
+        async def job(db):
+            return await self._transition(db, campaign_id, 'draft', ", scheduled_time = NULL")
+        
+        return await self.db.write(job)
+    
+    # ==================== SCHEDULED EXECUTION ====================
+    
     async def check_scheduled_campaigns(self):
-        """Check and execute scheduled campaigns"""
+        """Rebuild the scheduled campaign heap from the campaigns table"""
         try:
-            current_time = datetime.now()
-            
-            # Get campaigns scheduled for current time
             async with self.db.get_connection() as db:
-                async with db.execute("""
-                    SELECT * FROM scheduled_campaigns 
-                    WHERE scheduled_time <= ? 
-                    AND executed = FALSE
-                """, (current_time,)) as cursor:
-                    campaigns = await cursor.fetchall()
+                async with db.execute(SCHEDULED_CAMPAIGNS) as cursor:
+                    rows = await cursor.fetchall()
             
-            for campaign in campaigns:
-                await self.execute_scheduled_campaign(campaign)
-                
+            scheduled = {
+                campaign_id: datetime.fromisoformat(scheduled_time).timestamp() if scheduled_time else 0
+                for campaign_id, scheduled_time in rows
+            }
+            # Keep entries of campaigns scheduled after the query read the table; entries
+            # of campaigns that are no longer scheduled are skipped when due as before
+            self._campaign_heap = [(due, campaign_id) for campaign_id, due in scheduled.items()] + [
+                entry for entry in self._campaign_heap if entry[1] not in scheduled
+            ]
+            heapq.heapify(self._campaign_heap)
+            if self._campaign_wakeup:
+                self._campaign_wakeup.set()
+            return len(self._campaign_heap)
         except Exception as e:
             print(f"Error checking scheduled campaigns: {e}")
+            return 0
     
-    async def execute_scheduled_campaign(self, campaign_data):
-        """Execute a scheduled campaign"""
+    async def recover_campaigns(self):
+        """Fail campaigns whose lease expired, finish sent ones, then resync the heap"""
+        async def job(db):
+            now = int(time.time())
+            cursor = await db.execute("""
+                UPDATE campaigns SET status = 'failed', error = 'lease expired', finished_at = CURRENT_TIMESTAMP
+                WHERE status = 'running'
+                AND id NOT IN (SELECT campaign_id FROM campaign_leases WHERE expires_at >= ?)
+            """, (now,))
+            await db.execute("DELETE FROM campaign_leases WHERE expires_at < ?", (now,))
+            await db.execute(FINISH_SENT_CAMPAIGNS)
+            return cursor.rowcount
+        
         try:
-            campaign_id = campaign_data[0]
-            
-            # Mark as executed
-            async with self.db.get_connection() as db:
-                await db.execute("""
-                    UPDATE scheduled_campaigns 
-                    SET executed = TRUE, executed_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (campaign_id,))
-                await db.commit()
+            failed = await self.db.write(job)
+            if failed:
+                print(f"Campaigns failed after their lease expired: {failed}")
+        except Exception as e:
+            print(f"Error recovering campaigns: {e}")
+        await self.check_scheduled_campaigns()
+    
+    async def _run_due_campaigns(self):
+        """Sleep until the earliest scheduled campaign is due, then start it"""
+        await self.recover_campaigns()
+        while True:
+            self._campaign_wakeup.clear()
+            if not self._campaign_heap:
+                await self._campaign_wakeup.wait()
+                continue
             
-            # Execute the campaign
-            await self.run_campaign(campaign_data)
+            due, campaign_id = self._campaign_heap[0]
+            delay = due - datetime.now().timestamp()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._campaign_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
             
+            heapq.heappop(self._campaign_heap)
+            if campaign_id not in self.active_campaigns:
+                task = asyncio.create_task(self.run_campaign(campaign_id))
+                self.active_campaigns[campaign_id] = task
+                task.add_done_callback(lambda _, campaign_id=campaign_id: self.active_campaigns.pop(campaign_id, None))
+    
+    async def run_campaign(self, campaign_id):
+        """Run a scheduled campaign under a lease so no other instance runs it too"""
+        if not await self._claim(campaign_id):
+            return False
+        
+        renewer = asyncio.create_task(self._renew_lease(campaign_id))
+        try:
+            campaign_data = await self.get_campaign(campaign_id)
+            if not self.executor:
+                raise RuntimeError("no campaign executor configured")
+            await self.executor(campaign_data, self._progress_reporter(campaign_data))
+        except asyncio.CancelledError:
+            await self._finish(campaign_id, 'failed', 'interrupted')
+            raise
         except Exception as e:
             print(f"Error executing campaign {campaign_id}: {e}")
+            await self._finish(campaign_id, 'failed', str(e))
+            return False
+        finally:
+            renewer.cancel()
+        
+        # Messages held for users' best hours are still to be sent
+        await self._finish(campaign_id, 'sending' if await self._has_held_deliveries(campaign_id) else 'done')
+        return True
+    
+    def _progress_reporter(self, campaign_data):
+        """Reporter for the campaign's status message, if it has one"""
+        if not campaign_data['admin_chat_id']:
+            return None
+        # The audience is streamed, so the executor grows the total as it finds targets
+        return ProgressReporter(
+            self.bot, campaign_data['admin_chat_id'], campaign_data['status_message_id'],
+            f"اجرای کمپین {campaign_data['name'] or campaign_data['id']}", 0
+        )
+    
+    async def _has_held_deliveries(self, campaign_id):
+        async with self.db.get_connection() as db:
+            async with db.execute(CAMPAIGN_HELD_DELIVERIES, (campaign_id,)) as cursor:
+                return await cursor.fetchone() is not None
+    
+    async def _claim(self, campaign_id):
+        """Take the campaign's lease and mark it running, atomically"""
+        async def job(db):
+            now = int(time.time())
+            cursor = await db.execute("""
+                INSERT INTO campaign_leases (campaign_id, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (campaign_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE campaign_leases.expires_at < ?
+            """, (campaign_id, self.owner, now + self.lease_ttl, now))
+            if not cursor.rowcount:
+                return False
+            if not await self._transition(db, campaign_id, 'running', ", started_at = CURRENT_TIMESTAMP"):
+                await db.execute(
+                    "DELETE FROM campaign_leases WHERE campaign_id = ? AND owner = ?", (campaign_id, self.owner)
+                )
+                return False
+            return True
+        
+        return await self.db.write(job)
+    
+    async def _renew_lease(self, campaign_id):
+        """Keep extending the lease while the campaign runs"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self.db.execute_write("""
+                    UPDATE campaign_leases SET expires_at = ? WHERE campaign_id = ? AND owner = ?
+                """, (int(time.time()) + self.lease_ttl, campaign_id, self.owner))
+            except Exception as e:
+                print(f"Error renewing lease of campaign {campaign_id}: {e}")
+    
+    async def _finish(self, campaign_id, status, error=None):
+        """Record the outcome of a run and release the lease"""
+        # A sending campaign finishes when the wheel has sent its deliveries
+        finished_sql = "" if status == 'sending' else ", finished_at = CURRENT_TIMESTAMP"
+        
+        async def job(db):
+            await self._transition(db, campaign_id, status, ", error = ?" + finished_sql, (error,))
+            await db.execute(
+                "DELETE FROM campaign_leases WHERE campaign_id = ? AND owner = ?", (campaign_id, self.owner)
+            )
+        
+        await self.db.write(job)
     
     async def daily_campaign_optimization(self):
         """Daily optimization of active campaigns"""
@@ -108,52 +339,83 @@ class CampaignManager:
             print(f"Error in daily optimization: {e}")
     
     async def get_campaign_performance(self, date):
-        """Get campaign performance for specific date"""
-        async with self.db.get_connection() as db:
-            async with db.execute("""
-                SELECT campaign_id, 
-                       COUNT(*) as total_sent,
-                       SUM(CASE WHEN delivered = 1 THEN 1 ELSE 0 END) as delivered,
-                       SUM(CASE WHEN opened = 1 THEN 1 ELSE 0 END) as opened,
-                       SUM(CASE WHEN clicked = 1 THEN 1 ELSE 0 END) as clicked
-                FROM campaign_messages 
-                WHERE DATE(sent_at) = DATE(?)
-                GROUP BY campaign_id
-            """, (date,)) as cursor:
-                return await cursor.fetchall()
+        """Get (campaign_id, total_sent, delivered, opened, clicked) per campaign for one day"""
+        day_start = datetime(date.year, date.month, date.day)
+        stats = await self.db.get_campaign_stats(day_start, day_start + timedelta(days=1))
+        return [
+            (campaign_id, sent, delivered, opened, clicked)
+            for campaign_id, name, sent, delivered, failed, unreachable, opened, clicked in stats
+        ]
     
     async def generate_optimizations(self, performance_data):
         """Generate optimization suggestions"""
         optimizations = []
         
         for campaign in performance_data:
-            campaign_id, total_sent, delivered, opened, clicked = campaign
-            
-            if total_sent > 0:
-                delivery_rate = (delivered / total_sent) * 100
-                open_rate = (opened / delivered) * 100 if delivered > 0 else 0
-                click_rate = (clicked / opened) * 100 if opened > 0 else 0
-                
-                # Generate suggestions based on performance
-                if delivery_rate < 95:
-                    optimizations.append({
-                        'campaign_id': campaign_id,
-                        'type': 'delivery',
-                        'suggestion': 'بهبود زمان‌بندی ارسال برای افزایش نرخ تحویل'
-                    })
-                
-                if open_rate < 50:
-                    optimizations.append({
-                        'campaign_id': campaign_id,
-                        'type': 'open_rate',
-                        'suggestion': 'بهبود عنوان و محتوای پیام برای افزایش نرخ باز کردن'
-                    })
-                
-                if click_rate < 10:
-                    optimizations.append({
-                        'campaign_id': campaign_id,
-                        'type': 'click_rate',
-                        'suggestion': 'بهبود دکمه‌های عمل (CTA) برای افزایش کلیک'
-                    })
+            optimizations.extend(optimization_suggestions(*campaign))
+        
+        return optimizations
+    
+    async def send_optimization_report(self, optimizations):
+        """Send the daily optimization suggestions to the admin"""
+        if not optimizations:
+            return
         
-        return optimizations
\ No newline at end of file
+        text = "🛠 پیشنهادات بهینه‌سازی کمپین‌ها (دیروز):\n\n"
+        text += "\n".join(
+            f"• کمپین {optimization['campaign_id']}: {optimization['suggestion']}"
+            for optimization in optimizations
+        )
+        await self.bot.send_message(ADMIN_ID, text)
+    
+    async def weekly_campaign_report(self):
+        """Send the admin a summary of the last 7 days of campaigns"""
+        try:
+            stats = await self.db.get_campaign_stats(datetime.now() - timedelta(days=7))
+            if not stats:
+                return
+            
+            text = "📊 گزارش هفتگی کمپین‌ها\n"
+            for campaign_id, name, sent, delivered, failed, unreachable, opened, clicked in stats:
+                delivery_rate = round(delivered / sent * 100, 1) if sent else 0
+                text += f"""
+🎯 {name or f'کمپین {campaign_id}'}
+• ارسال: {sent} | تحویل: {delivery_rate}%
+• ناموفق: {failed} | مسدود کرده‌اند: {unreachable}
+• کلیک: {clicked}
+"""
+            await self.bot.send_message(ADMIN_ID, text)
+        except Exception as e:
+            print(f"Error sending weekly campaign report: {e}")
+
+
+def optimization_suggestions(campaign_id, total_sent, delivered, opened, clicked):
+    """Suggest improvements for a campaign's delivery and click rates
+    
+    `opened` is accepted for the shape of the performance rows but not
+    judged: Telegram does not report opens, so it is always 0.
+    """
+    suggestions = []
+    if not total_sent:
+        return suggestions
+    
+    delivery_rate = (delivered / total_sent) * 100
+    # Telegram does not report opens, so clicks are measured against deliveries
+    click_rate = (clicked / delivered) * 100 if delivered > 0 else 0
+    
+    # Generate suggestions based on performance
+    if delivery_rate < 95:
+        suggestions.append({
+            'campaign_id': campaign_id,
+            'type': 'delivery',
+            'suggestion': 'بهبود زمان‌بندی ارسال برای افزایش نرخ تحویل'
+        })
+    
+    if click_rate < 10:
+        suggestions.append({
+            'campaign_id': campaign_id,
+            'type': 'click_rate',
+            'suggestion': 'بهبود دکمه‌های عمل (CTA) برای افزایش کلیک'
+        })
+    
+    return suggestions
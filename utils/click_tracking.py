@@ -0,0 +1,47 @@
+import base64
+import struct
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+# callback_data of a tracked button: the prefix and the unpadded url-safe
+# base64 of (job_type, job_id, variant, button) as big-endian u8, u32, u8, u8.
+# That is a fixed 11 characters, well under Telegram's 64-byte limit, and
+# no other callback_data starts with the prefix.
+CLICK_PREFIX = '~'
+CLICK_STRUCT = struct.Struct('>BIBB')
+CLICK_DATA_LENGTH = len(CLICK_PREFIX) + (CLICK_STRUCT.size * 4 + 2) // 3
+
+
+def encode_click(job_type, job_id, variant, button):
+    """Pack a tracked button into its callback_data"""
+    packed = CLICK_STRUCT.pack(job_type, job_id, variant, button)
+    return CLICK_PREFIX + base64.urlsafe_b64encode(packed).decode().rstrip('=')
+
+
+def decode_click(data):
+    """Unpack tracked button callback_data into (job_type, job_id, variant, button), or None"""
+    # Game and inline-mode callbacks carry no data
+    if not data:
+        return None
+    if len(data) != CLICK_DATA_LENGTH or not data.startswith(CLICK_PREFIX):
+        return None
+    try:
+        return CLICK_STRUCT.unpack(base64.urlsafe_b64decode(data[len(CLICK_PREFIX):] + '=='))
+    except (ValueError, struct.error):
+        return None
+
+
+def tracked_keyboard(job_type, job_id, buttons, variant=0):
+    """Build an inline keyboard whose buttons report clicks (None when there are no buttons)
+
+    `buttons` is a list of dicts with a 'text'; what a click does is
+    looked up by its index when the click comes in.
+    """
+    if not buttons:
+        return None
+    keyboard = InlineKeyboardMarkup(row_width=1)
+    for index, button in enumerate(buttons):
+        keyboard.add(InlineKeyboardButton(
+            button['text'], callback_data=encode_click(job_type, job_id, variant, index)
+        ))
+    return keyboard
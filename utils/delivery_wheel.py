@@ -0,0 +1,171 @@
+import asyncio
+import time
+from datetime import datetime
+
+from config import CAMPAIGN_WHEEL_SLOTS, CAMPAIGN_WHEEL_BATCH_SIZE, USER_PAGE_SIZE
+from database.buffers import DeliveryLog
+from database.queries import WHEEL_SLOT_PAGE
+from utils.broadcast_engine import delivery_status
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class DeliveryWheel:
+    """Timing wheel of campaign messages waiting for each user's best hour
+
+    The day is split into `slots` equal slots. Deliveries are stored in
+    campaign_deliveries under the slot of the user's best hour, and when a
+    slot comes round its deliveries are sent through the broadcast engine,
+    so they share the global rate budget with every other send.
+    """
+
+    def __init__(self, db, engine, send, slots=CAMPAIGN_WHEEL_SLOTS, batch_size=CAMPAIGN_WHEEL_BATCH_SIZE):
+        self.db = db
+        self.engine = engine
+        self.send = send  # send(user_id, message, campaign_id)
+        self.slots = slots
+        self.batch_size = batch_size
+        self._pending = []
+        self._task = None
+
+        # Metrics
+        self.scheduled = 0
+        self.drained_slots = 0
+        self.sent = 0
+        self.failed = 0
+
+    def slot_for_hour(self, hour):
+        """Get the slot that starts a user's best hour"""
+        return hour % 24 * self.slots // 24
+
+    def current_slot(self, now=None):
+        now = now or datetime.now()
+        seconds = now.hour * 3600 + now.minute * 60 + now.second
+        return seconds * self.slots // SECONDS_PER_DAY
+
+    def seconds_until_next_slot(self, now=None):
+        now = now or datetime.now()
+        seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+        slot_length = SECONDS_PER_DAY / self.slots
+        return slot_length - seconds % slot_length
+
+    async def schedule(self, campaign_id, user_id, message, hour):
+        """Queue a campaign message for the slot of `hour`
+
+        Rows are written in batches; call `flush()` once a campaign has
+        scheduled all of its messages.
+        """
+        self._pending.append((self.slot_for_hour(hour), campaign_id, user_id, message, int(time.time())))
+        self.scheduled += 1
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """Write queued deliveries to the wheel"""
+        if not self._pending:
+            return 0
+        rows, self._pending = self._pending, []
+
+        async def job(db):
+            await db.executemany("""
+                INSERT OR REPLACE INTO campaign_deliveries (slot, campaign_id, user_id, message, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+
+        await self.db.write(job)
+        return len(rows)
+
+    def start(self):
+        """Start turning the wheel"""
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop turning the wheel and write out queued deliveries"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        """Drain each slot as it comes round"""
+        while True:
+            try:
+                await self.drain(self.current_slot())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error draining campaign delivery slot: {e}")
+            await asyncio.sleep(self.seconds_until_next_slot())
+
+    async def drain(self, slot):
+        """Send every delivery stored in `slot`, one campaign at a time"""
+        await self.flush()
+        drain_started = int(time.time())
+        async with self.db.get_connection() as db:
+            async with db.execute(
+                "SELECT DISTINCT campaign_id FROM campaign_deliveries WHERE slot = ?", (slot,)
+            ) as cursor:
+                campaign_ids = [row[0] for row in await cursor.fetchall()]
+
+        for campaign_id in campaign_ids:
+            await self._drain_campaign(slot, campaign_id, drain_started)
+        self.drained_slots += 1
+
+    async def _drain_campaign(self, slot, campaign_id, drain_started):
+        messages = {}
+
+        async def recipients():
+            last_id = -1
+            while True:
+                async with self.db.get_connection() as db:
+                    async with db.execute(WHEEL_SLOT_PAGE, (slot, campaign_id, last_id, drain_started, USER_PAGE_SIZE)) as cursor:
+                        rows = await cursor.fetchall()
+                for user_id, message in rows:
+                    messages[user_id] = message
+                    yield user_id
+                if len(rows) < USER_PAGE_SIZE:
+                    return
+                last_id = rows[-1][0]
+
+        async def send(user_id):
+            await self.send(user_id, messages[user_id], campaign_id)
+
+        async def on_failed(user_id, error):
+            await self.db.delivery_log.record(DeliveryLog.CAMPAIGN, campaign_id, user_id, delivery_status(error))
+
+        async def remove_delivered(progress):
+            # Everything up to the checkpoint is done, so it leaves the wheel
+            for user_id in [user_id for user_id in messages if user_id <= progress.checkpoint]:
+                del messages[user_id]
+            await self.db.execute_write("""
+                DELETE FROM campaign_deliveries
+                WHERE slot = ? AND campaign_id = ? AND user_id <= ? AND created_at <= ?
+            """, (slot, campaign_id, progress.checkpoint, drain_started))
+
+        result = await self.engine.run(recipients(), send, on_progress=remove_delivered, on_failed=on_failed)
+        self.sent += result.sent
+        self.failed += result.failed
+
+    async def pending_by_slot(self):
+        """Count stored deliveries per slot"""
+        async with self.db.get_connection() as db:
+            async with db.execute(
+                "SELECT slot, COUNT(*) FROM campaign_deliveries GROUP BY slot"
+            ) as cursor:
+                return dict(await cursor.fetchall())
+
+    def stats(self):
+        """Get wheel metrics"""
+        return {
+            'slots': self.slots,
+            'queued': len(self._pending),
+            'scheduled': self.scheduled,
+            'drained_slots': self.drained_slots,
+            'sent': self.sent,
+            'failed': self.failed
+        }
@@ -26,6 +26,21 @@ class BotHelpers:
         """Format number with Persian separators"""
         return f"{number:,}".replace(',', '،')
     
+    @staticmethod
+    def format_duration(seconds):
+        """Format seconds as H:MM:SS or M:SS"""
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            return f"{hours}:{minutes:02d}:{seconds:02d}"
+        return f"{minutes}:{seconds:02d}"
+    
+    @staticmethod
+    def create_progress_bar(percent, length=10):
+        """Create a text progress bar"""
+        filled = min(length, int(percent / 100 * length))
+        return "▓" * filled + "░" * (length - filled)
+    
     @staticmethod
     def get_user_rank_emoji(rank):
         """Get emoji for user rank"""
@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+
+from utils.rate_limiter import shared_limiter
+
+# Bot API methods that count against Telegram's message limits
+RATE_LIMITED_METHODS = ('send', 'edit', 'copy', 'forward')
+# ...except these, which send no message
+UNLIMITED_METHODS = ('sendChatAction',)
+
+_priority = ContextVar('outbound_priority', default='interactive')
+
+
+def current_priority():
+    """Get the priority class of API calls made in the current context"""
+    return _priority.get()
+
+
+def set_priority(priority):
+    """Set the priority class for the rest of the current task"""
+    return _priority.set(priority)
+
+
+@contextmanager
+def outbound_priority(priority):
+    """Make API calls inside the block with the given priority class"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundBot(Bot):
+    """Bot whose message calls wait for a slot in the shared priority budget
+
+    Calls are 'interactive' unless made inside `outbound_priority(...)` or
+    from a task that called `set_priority(...)`, so handler replies are not
+    queued behind bulk sends.
+    """
+
+    def __init__(self, *args, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter or shared_limiter
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if method.startswith(RATE_LIMITED_METHODS) and method not in UNLIMITED_METHODS:
+            await self.limiter.acquire((data or {}).get('chat_id'), _priority.get())
+        return await super().request(method, data, files, **kwargs)
@@ -0,0 +1,97 @@
+import time
+
+from aiogram.utils.exceptions import MessageNotModified
+
+from config import BROADCAST_PROGRESS_INTERVAL, BROADCAST_RATE, PROGRESS_EDIT_SHARE
+from utils.helpers import BotHelpers
+from utils.rate_limiter import TokenBucket
+
+# Shared by every reporter, so status edits never take more than this share of the send budget
+_edit_budget = TokenBucket(BROADCAST_RATE * PROGRESS_EDIT_SHARE)
+
+
+class ProgressReporter:
+    """Keeps an admin's status message updated with the progress of a send
+
+    `update()` can be called as often as convenient; edits are coalesced to
+    at most one per `interval` seconds per message, and skipped entirely
+    when the shared edit budget is used up.
+    """
+
+    def __init__(self, bot, chat_id, message_id, title, total, interval=BROADCAST_PROGRESS_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.title = title
+        self.total = total
+        self.interval = interval
+        self.helpers = BotHelpers()
+        self._last_edit = 0.0
+        self._last_text = None
+        self._first_sample = None
+
+        # Metrics
+        self.edits = 0
+        self.coalesced = 0
+
+    async def update(self, result, status=None, reply_markup=None, force=False):
+        """Show `result` (a BroadcastResult) unless an edit was made too recently"""
+        now = time.monotonic()
+        if self._first_sample is None:
+            self._first_sample = (now, result.processed)
+        if not force and now - self._last_edit < self.interval:
+            self.coalesced += 1
+            return False
+
+        # Only edits that change the message take from the shared budget
+        text = self.render(result, status, self._rate(result, now))
+        if text == self._last_text:
+            return False
+        if not force and not _edit_budget.try_acquire():
+            self.coalesced += 1
+            return False
+
+        try:
+            await self.bot.edit_message_text(
+                text, chat_id=self.chat_id, message_id=self.message_id, reply_markup=reply_markup
+            )
+        except MessageNotModified:
+            pass
+        except Exception as e:
+            print(f"Error updating progress message: {e}")
+            return False
+
+        self._last_edit = now
+        self._last_text = text
+        self.edits += 1
+        return True
+
+    def _rate(self, result, now):
+        """Sends per second since this reporter first saw the job
+
+        Measured here rather than taken from the result, whose counters may
+        include messages sent before a restart.
+        """
+        started, processed = self._first_sample
+        if now - started < 1:
+            return 0.0
+        return (result.processed - processed) / (now - started)
+
+    def render(self, result, status=None, rate=0.0):
+        """Build the status message text"""
+        processed = result.processed
+        remaining = max(0, self.total - processed)
+        percent = min(100, round(processed / self.total * 100, 1)) if self.total else 100
+        eta = self.helpers.format_duration(remaining / rate) if rate > 0 and remaining else "-"
+
+        text = f"📤 {self.title}\n\n"
+        if status:
+            text += f"{status}\n\n"
+        text += f"""{self.helpers.create_progress_bar(percent)} {percent}%
+
+✅ ارسال موفق: {self.helpers.format_number(result.sent)}
+❌ ارسال ناموفق: {self.helpers.format_number(result.failed)}
+⏳ باقی‌مانده: {self.helpers.format_number(remaining)}
+⚡️ سرعت ارسال: {round(rate, 1)} پیام در ثانیه
+🕒 زمان تقریبی باقی‌مانده: {eta}"""
+        return text
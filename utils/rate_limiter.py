@@ -0,0 +1,256 @@
+import asyncio
+import time
+from collections import deque
+
+from config import BROADCAST_RATE, BROADCAST_PER_CHAT_RATE, BROADCAST_WORKERS, OUTBOUND_SHARES
+
+
+class TokenBucket:
+    """Async token bucket refilled at `rate` tokens per second"""
+
+    def __init__(self, rate, burst=1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1.0):
+        """Take `tokens` if they are available right now"""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens=1.0):
+        """Wait until `tokens` are available and take them"""
+        # The lock keeps waiters in FIFO order instead of waking all at once
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def refund(self, tokens=1.0):
+        """Give back `tokens` that were taken but not used"""
+        self._tokens = min(self.burst, self._tokens + tokens)
+
+
+class PriorityBudget:
+    """One token bucket shared by priority classes
+
+    Each class has a reserved share of the rate. A slot goes to the
+    highest-priority waiting class that still has reserved credit, and
+    otherwise to the highest-priority waiting class, so capacity a class
+    does not use is lent to the others.
+    """
+
+    def __init__(self, rate, shares):
+        self.bucket = TokenBucket(rate)
+        self.classes = tuple(shares)
+        self.reserved = {name: TokenBucket(rate * share) for name, share in shares.items() if share > 0}
+        self._waiters = {name: deque() for name in self.classes}
+        self._wakeup = None
+        self._task = None
+
+        # Metrics
+        self.granted = dict.fromkeys(self.classes, 0)
+        self.max_queued = dict.fromkeys(self.classes, 0)
+        self._latencies = {name: deque(maxlen=1000) for name in self.classes}
+
+    async def acquire(self, priority):
+        """Wait for a slot for the class `priority`"""
+        if priority not in self._waiters:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+
+        future = loop.create_future()
+        waiters = self._waiters[priority]
+        waiters.append((future, time.monotonic()))
+        self.max_queued[priority] = max(self.max_queued[priority], len(waiters))
+        self._wakeup.set()
+        await future
+
+    def _next_class(self):
+        """Pick the class that gets the next slot"""
+        waiting = []
+        for name in self.classes:
+            waiters = self._waiters[name]
+            while waiters and waiters[0][0].cancelled():
+                waiters.popleft()
+            if waiters:
+                waiting.append(name)
+        if not waiting:
+            return None
+
+        for name in waiting:
+            reserved = self.reserved.get(name)
+            if reserved and reserved.try_acquire():
+                return name
+        return waiting[0]
+
+    async def _dispatch(self):
+        """Hand out slots from the bucket to waiting classes"""
+        while True:
+            if not any(self._waiters.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Choose before waiting so the token is never taken with no one to give it to
+            name = self._next_class()
+            if name is None:
+                continue
+            await self.bucket.acquire()
+
+            # The chosen caller may have been cancelled while the bucket refilled
+            waiters = self._waiters[name]
+            while waiters and waiters[0][0].cancelled():
+                waiters.popleft()
+            if not waiters:
+                name = self._next_class()
+                if name is None:
+                    self.bucket.refund()
+                    continue
+
+            future, queued_at = self._waiters[name].popleft()
+            future.set_result(None)
+            self.granted[name] += 1
+            self._latencies[name].append(time.monotonic() - queued_at)
+
+    def close(self):
+        """Stop the dispatcher and cancel calls still waiting for a slot"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for waiters in self._waiters.values():
+            while waiters:
+                future, _ = waiters.popleft()
+                future.cancel()
+
+    def stats(self):
+        """Get per-class queue and latency metrics"""
+        stats = {}
+        for name in self.classes:
+            latencies = sorted(self._latencies[name])
+            stats[name] = {
+                'queued': len(self._waiters[name]),
+                'max_queued': self.max_queued[name],
+                'granted': self.granted[name],
+                'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0,
+                'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else 0
+            }
+        return stats
+
+
+class RateLimiter:
+    """Global send budget split by priority, plus a minimum interval between bulk sends to one chat"""
+
+    def __init__(self, rate=BROADCAST_RATE, per_chat_rate=BROADCAST_PER_CHAT_RATE, max_tracked_chats=10000,
+                 shares=OUTBOUND_SHARES):
+        self.budget = PriorityBudget(rate, shares)
+        self.per_chat_interval = 1.0 / per_chat_rate
+        self.max_tracked_chats = max_tracked_chats
+        self._chat_next = {}
+        self._paused_until = 0.0
+
+        # Metrics
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.pauses = 0
+
+    @property
+    def rate(self):
+        return self.budget.bucket.rate
+
+    def pause(self, seconds):
+        """Stop handing out slots for `seconds` (e.g. after a flood-wait error)"""
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self.pauses += 1
+
+    async def acquire(self, chat_id=None, priority='broadcast'):
+        """Wait for a send slot for `chat_id` within both limits"""
+        started = time.monotonic()
+        await self._wait_unpaused()
+
+        # Replies to a user's own actions are not held to the per-chat interval
+        now = time.monotonic()
+        if chat_id is not None and priority != 'interactive':
+            next_at = self._chat_next.get(chat_id, 0.0)
+            self._chat_next[chat_id] = max(now, next_at) + self.per_chat_interval
+            if len(self._chat_next) > self.max_tracked_chats:
+                self._prune(now)
+            if next_at > now:
+                await asyncio.sleep(next_at - now)
+
+        await self.budget.acquire(priority)
+        # A flood wait may have started while this call was queued for its slot
+        await self._wait_unpaused()
+
+        self.acquired += 1
+        self.total_wait += time.monotonic() - started
+
+    async def _wait_unpaused(self):
+        while self._paused_until > time.monotonic():
+            await asyncio.sleep(self._paused_until - time.monotonic())
+
+    def close(self):
+        """Stop handing out slots; pending acquire calls are cancelled"""
+        self.budget.close()
+
+    def _prune(self, now):
+        """Forget chats whose interval has already elapsed"""
+        self._chat_next = {chat: at for chat, at in self._chat_next.items() if at > now}
+
+    def stats(self):
+        """Get limiter metrics"""
+        return {
+            'rate': self.rate,
+            'acquired': self.acquired,
+            'avg_wait_ms': round(self.total_wait / self.acquired * 1000, 2) if self.acquired else 0,
+            'tracked_chats': len(self._chat_next),
+            'pauses': self.pauses,
+            'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 1),
+            'classes': self.budget.stats()
+        }
+
+
+def worker_rate(shard_count):
+    """Send rate of one broadcast worker process: an equal slice of the broadcast share"""
+    return BROADCAST_RATE * OUTBOUND_SHARES['broadcast'] / shard_count
+
+
+def process_budget(workers=BROADCAST_WORKERS):
+    """Get the (rate, shares) of the bot process's budget
+
+    With broadcast workers the broadcast share of BROADCAST_RATE goes to
+    them, so the bot process keeps only the rest and all processes
+    together stay within the bot's global limit.
+    """
+    if workers <= 0:
+        return BROADCAST_RATE, OUTBOUND_SHARES
+    broadcast_share = OUTBOUND_SHARES['broadcast']
+    if not 0 < broadcast_share < 1:
+        raise ValueError("OUTBOUND_SHARE_BROADCAST must be between 0 and 1 when BROADCAST_WORKERS > 0")
+    remaining = 1 - broadcast_share
+    shares = {name: 0.0 if name == 'broadcast' else share / remaining for name, share in OUTBOUND_SHARES.items()}
+    return BROADCAST_RATE * remaining, shares
+
+
+# One budget shared by every sender in the process
+_rate, _shares = process_budget()
+shared_limiter = RateLimiter(rate=_rate, shares=_shares)
@@ -2,21 +2,37 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime, timedelta
 import asyncio
+import heapq
+from config import USER_PROFILE_REFRESH_INTERVAL
+from utils.user_profiles import UserProfileBuilder
 
 class BotScheduler:
-    def __init__(self, bot, db):
+    def __init__(self, bot, db, broadcast_jobs=None):
         self.bot = bot
         self.db = db
+        self.broadcast_jobs = broadcast_jobs
         self.scheduler = AsyncIOScheduler()
+        self.user_profiles = UserProfileBuilder(db)
+        
+        # Scheduled broadcasts as a min-heap of (due timestamp, broadcast_id)
+        self._broadcast_heap = []
+        self._broadcast_wakeup = None
+        self._broadcast_task = None
     
     def start(self):
         """Start the scheduler"""
         self.scheduler.start()
         self.setup_jobs()
+        if self.broadcast_jobs:
+            self._broadcast_wakeup = asyncio.Event()
+            self._broadcast_task = asyncio.create_task(self._run_scheduled_broadcasts())
     
     def stop(self):
         """Stop the scheduler"""
         self.scheduler.shutdown()
+        if self._broadcast_task:
+            self._broadcast_task.cancel()
+            self._broadcast_task = None
     
     def setup_jobs(self):
         """Setup scheduled jobs"""
@@ -41,12 +57,25 @@ class BotScheduler:
             id='cleanup_data'
         )
         
-        # Check pending broadcasts
+        # Reconcile materialized stats counters
+        self.scheduler.add_job(
+            self.reconcile_stats_counters,
+            CronTrigger(hour=3, minute=30),
+            id='reconcile_counters'
+        )
+        
+        # Rebuild user behavior profiles in one pass, then keep them current from new events
+        self.scheduler.add_job(
+            self.rebuild_user_profiles,
+            CronTrigger(hour=4, minute=0),
+            id='rebuild_profiles'
+        )
         self.scheduler.add_job(
-            self.check_pending_broadcasts,
+            self.refresh_user_profiles,
             'interval',
-            minutes=5,
-            id='check_broadcasts'
+            seconds=USER_PROFILE_REFRESH_INTERVAL,
+            next_run_time=datetime.now(),
+            id='refresh_profiles'
         )
     
     async def daily_stats_update(self):
@@ -58,6 +87,32 @@ class BotScheduler:
         except Exception as e:
             print(f"Error updating daily stats: {e}")
     
+    async def rebuild_user_profiles(self):
+        """Recompute every user behavior profile from analytics"""
+        try:
+            count = await self.user_profiles.rebuild()
+            print(f"User profiles rebuilt: {count}")
+        except Exception as e:
+            print(f"Error rebuilding user profiles: {e}")
+    
+    async def refresh_user_profiles(self):
+        """Update the profiles of users with new analytics events"""
+        try:
+            await self.user_profiles.refresh()
+        except Exception as e:
+            print(f"Error refreshing user profiles: {e}")
+    
+    async def reconcile_stats_counters(self):
+        """Recount stats counters to correct any drift"""
+        try:
+            before = await self.db.get_user_stats()
+            await self.db.reconcile_stats_counters()
+            after = await self.db.get_user_stats()
+            drift = {key: after[key] - before[key] for key in after if after[key] != before[key]}
+            print(f"Stats counters reconciled, drift: {drift or 'none'}")
+        except Exception as e:
+            print(f"Error reconciling stats counters: {e}")
+    
     async def weekly_leaderboard(self):
         """Send weekly leaderboard to admin"""
         try:
@@ -67,7 +122,7 @@ class BotScheduler:
             if top_users:
                 text = "📊 گزارش هفتگی - برترین کاربران:\n\n"
                 for i, user in enumerate(top_users, 1):
-                    text += f"{i}. {user[1]} - {user[2]} دعوت\n"
+                    text += f"{i}. {user.first_name} - {user.total_referrals} دعوت\n"
                 
                 await self.bot.send_message(ADMIN_ID, text)
         except Exception as e:
@@ -76,38 +131,71 @@ class BotScheduler:
     async def cleanup_old_data(self):
         """Clean old analytics data (older than 3 months)"""
         try:
-            async with self.db.get_connection() as db:
-                await db.execute("""
-                    DELETE FROM analytics 
-                    WHERE timestamp < datetime('now', '-3 months')
-                """)
-                await db.commit()
+            await self.db.execute_write("""
+                DELETE FROM analytics 
+                WHERE timestamp < datetime('now', '-3 months')
+            """)
             print("Old analytics data cleaned up")
         except Exception as e:
             print(f"Error cleaning up old data: {e}")
     
     async def check_pending_broadcasts(self):
-        """Check and send pending broadcast messages"""
+        """Rebuild the scheduled broadcast heap from the broadcasts table"""
         try:
-            # This will be implemented in broadcast system
-            pass
+            async with self.db.get_connection() as db:
+                async with db.execute("""
+                    SELECT id, scheduled_time FROM broadcasts WHERE status = 'scheduled'
+                """) as cursor:
+                    rows = await cursor.fetchall()
+            
+            self._broadcast_heap = [
+                (datetime.fromisoformat(scheduled_time).timestamp(), broadcast_id)
+                for broadcast_id, scheduled_time in rows
+            ]
+            heapq.heapify(self._broadcast_heap)
+            if self._broadcast_wakeup:
+                self._broadcast_wakeup.set()
+            return len(self._broadcast_heap)
         except Exception as e:
             print(f"Error checking pending broadcasts: {e}")
+            return 0
     
     def schedule_broadcast(self, broadcast_id, send_time):
-        """Schedule a broadcast message"""
-        self.scheduler.add_job(
-            self.send_scheduled_broadcast,
-            'date',
-            run_date=send_time,
-            args=[broadcast_id],
-            id=f'broadcast_{broadcast_id}'
-        )
+        """Schedule a broadcast message (already stored with status 'scheduled')"""
+        heapq.heappush(self._broadcast_heap, (send_time.timestamp(), broadcast_id))
+        # Wake the timer in case this one is due before the current head
+        if self._broadcast_wakeup:
+            self._broadcast_wakeup.set()
     
     async def send_scheduled_broadcast(self, broadcast_id):
         """Send scheduled broadcast message"""
         try:
-            # Implementation will be added in broadcast handler
-            print(f"Sending scheduled broadcast {broadcast_id}")
+            # Claim the job so a stale heap entry can never start it twice
+            cursor = await self.db.execute_write("""
+                UPDATE broadcasts SET status = 'pending' WHERE id = ? AND status = 'scheduled'
+            """, (broadcast_id,))
+            if cursor.rowcount:
+                self.broadcast_jobs.start(broadcast_id)
         except Exception as e:
-            print(f"Error sending scheduled broadcast: {e}")
\ No newline at end of file
+            print(f"Error sending scheduled broadcast: {e}")
+    
+    async def _run_scheduled_broadcasts(self):
+        """Sleep until the earliest scheduled broadcast is due, then start it"""
+        await self.check_pending_broadcasts()
+        while True:
+            self._broadcast_wakeup.clear()
+            if not self._broadcast_heap:
+                await self._broadcast_wakeup.wait()
+                continue
+            
+            due, broadcast_id = self._broadcast_heap[0]
+            delay = due - datetime.now().timestamp()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._broadcast_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            heapq.heappop(self._broadcast_heap)
+            await self.send_scheduled_broadcast(broadcast_id)
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+from config import USER_PROFILE_BATCH_SIZE, USER_PROFILE_WINDOW_DAYS
+from database.queries import PROFILE_EVENTS, PROFILE_REFRESH_CONDITION
+
+# Weight of each activity in the engagement score
+ACTIVITY_WEIGHTS = {
+    'button_click': 3,
+    'referral_share': 5,
+    'content_view': 2,
+    'menu_navigation': 1
+}
+
+
+def calculate_best_time(behavior_data):
+    """Calculate best time to send messages to user"""
+    if not behavior_data:
+        return 12  # Default noon
+
+    # Calculate weighted average of activity hours
+    total_weight = sum(data[1] for data in behavior_data)
+    if total_weight == 0:
+        return 12
+
+    weighted_hour = sum(data[2] * data[1] for data in behavior_data if data[2]) / total_weight
+    return int(weighted_hour) if weighted_hour else 12
+
+
+def calculate_engagement_score(behavior_data):
+    """Calculate user engagement score (0-100)"""
+    if not behavior_data:
+        return 0
+
+    total_score = 0
+    for event_type, count, _ in behavior_data:
+        weight = ACTIVITY_WEIGHTS.get(event_type, 1)
+        total_score += count * weight
+
+    # Normalize to 0-100 scale
+    return min(100, total_score // 10)
+
+
+def extract_interests(behavior_data):
+    """Extract user interests from behavior"""
+    interests = []
+
+    for event_type, count, _ in behavior_data:
+        if 'referral' in event_type and count > 5:
+            interests.append('referral_enthusiast')
+        elif 'content' in event_type and count > 10:
+            interests.append('content_consumer')
+        elif 'admin' in event_type:
+            interests.append('power_user')
+
+    return interests
+
+
+def profile_from_row(row):
+    """Turn a ProfileRow into the profile dict used for personalization"""
+    return {
+        'best_time': row.best_time,
+        'engagement_score': row.engagement_score,
+        'interests': row.interests.split(',') if row.interests else []
+    }
+
+
+class UserProfileBuilder:
+    """Maintains user_profiles from the analytics table
+
+    `rebuild()` recomputes every profile in one grouped pass over the last
+    `window_days` of analytics; `refresh()` recomputes only the users with
+    events logged since the previous pass. Campaigns then read profiles with
+    a join instead of aggregating analytics for each recipient.
+    """
+
+    def __init__(self, db, window_days=USER_PROFILE_WINDOW_DAYS, batch_size=USER_PROFILE_BATCH_SIZE):
+        self.db = db
+        self.window_days = window_days
+        self.batch_size = batch_size
+        self._last_event_id = None
+        self._lock = asyncio.Lock()
+
+    async def rebuild(self):
+        """Recompute all profiles and drop those of users with no recent activity"""
+        async with self._lock:
+            await self.db.analytics_buffer.flush()
+            started = int(time.time())
+            last_event_id = await self._last_analytics_id()
+
+            count = await self._build()
+            await self.db.execute_write("DELETE FROM user_profiles WHERE updated_at < ?", (started,))
+
+            self._last_event_id = last_event_id
+            return count
+
+    async def refresh(self):
+        """Recompute the profiles of users with new analytics events"""
+        if self._last_event_id is None:
+            return await self.rebuild()
+
+        async with self._lock:
+            await self.db.analytics_buffer.flush()
+            last_event_id = await self._last_analytics_id()
+            if last_event_id == self._last_event_id:
+                return 0
+
+            count = await self._build(PROFILE_REFRESH_CONDITION, (self._last_event_id, last_event_id))
+            self._last_event_id = last_event_id
+            return count
+
+    async def _last_analytics_id(self):
+        async with self.db.get_connection() as db:
+            async with db.execute("SELECT MAX(id) FROM analytics") as cursor:
+                return (await cursor.fetchone())[0] or 0
+
+    async def _build(self, where="", params=()):
+        """Aggregate analytics per user and event type and save the resulting profiles"""
+        count = 0
+        batch = []
+        user_id, behavior_data = None, []
+
+        async with self.db.get_connection() as db:
+            async with db.execute(
+                PROFILE_EVENTS.format(where=where), (f'-{self.window_days} days',) + params
+            ) as cursor:
+                async for row in cursor:
+                    if row[0] != user_id:
+                        if behavior_data:
+                            batch.append(self._profile(user_id, behavior_data))
+                        user_id, behavior_data = row[0], []
+                    behavior_data.append(row[1:])
+
+                    if len(batch) >= self.batch_size:
+                        await self._save(batch)
+                        count += len(batch)
+                        batch = []
+
+        if behavior_data:
+            batch.append(self._profile(user_id, behavior_data))
+        if batch:
+            await self._save(batch)
+            count += len(batch)
+        return count
+
+    def _profile(self, user_id, behavior_data):
+        return (
+            user_id,
+            calculate_best_time(behavior_data),
+            calculate_engagement_score(behavior_data),
+            ','.join(extract_interests(behavior_data))
+        )
+
+    async def _save(self, profiles):
+        updated_at = int(time.time())
+
+        async def job(db):
+            await db.executemany("""
+                INSERT OR REPLACE INTO user_profiles (user_id, best_time, engagement_score, interests, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, [profile + (updated_at,) for profile in profiles])
+
+        await self.db.write(job)